@@ -0,0 +1,32 @@
+"""
+Reconstrói a tabela usage_rollups a partir das mensagens já gravadas.
+
+Uso:
+    python -m app.commands.rebuild_usage [--batch-size 5000]
+"""
+import argparse
+from app.database import SessionLocal, init_db
+from app.services import usage_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstrói os rollups de uso de tokens")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Mensagens (faixa de ids) por transação")
+    args = parser.parse_args()
+    
+    init_db()
+    db = SessionLocal()
+    try:
+        batches = usage_service.rebuild_usage(
+            db,
+            batch_size=args.batch_size,
+            on_batch=lambda done, total: print(f"{done}/{total} mensagens")
+        )
+    finally:
+        db.close()
+    
+    print(f"Rollups reconstruídos em {batches} lote(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -8,6 +9,113 @@ MYSQL_PASSWORD = os.getenv("MYSQLPASSWORD", "AqTBsOLdQFshorJbUtYhZZMElCReCnIL")
 MYSQL_HOST = os.getenv("MYSQLHOST", "ballast.proxy.rlwy.net")
 MYSQL_PORT = os.getenv("MYSQLPORT", "29391")
 MYSQL_DB = os.getenv("MYSQLDATABASE", "railway")
-DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
-#DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data.db")
+# DATABASE_URL sobrescreve a conexão montada acima (ex.: sqlite:///./data.db nos benchmarks)
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
+)
+# Réplica de leitura opcional (rotas GET); sem ela tudo vai para o primário
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+# Engine assíncrona: por padrão derivada das URLs acima (pymysql -> aiomysql, sqlite -> aiosqlite)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+ASYNC_DATABASE_READ_URL = os.getenv("ASYNC_DATABASE_READ_URL")
+
+# Pool de conexões
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # segundos; renova antes do wait_timeout do MySQL
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # espera máxima por uma conexão livre
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "5"))  # conexões abertas no startup, antes do tráfego
+# Startup: quanto o boot espera pela checagem do schema antes de subir mesmo assim
+# (o /ready e as rotas que usam o banco ficam 503 até o banco responder)
+STARTUP_DB_TIMEOUT = float(os.getenv("STARTUP_DB_TIMEOUT", "5"))
+# Assina os tokens de login. Sem ele (ou com "changeme") a aplicação não sobe,
+# a não ser com ALLOW_INSECURE_SECRET_KEY=true (só desenvolvimento local)
 SECRET_KEY = os.getenv("SECRET_KEY", "changeme")
+ALLOW_INSECURE_SECRET_KEY = os.getenv("ALLOW_INSECURE_SECRET_KEY", "false").lower() in ("1", "true", "yes")
+
+# Cliente Anthropic (pool HTTP compartilhado)
+ANTHROPIC_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "500"))
+ANTHROPIC_TIMEOUT = float(os.getenv("ANTHROPIC_TIMEOUT", "600"))
+
+# Resiliência das chamadas ao Claude (ai_service)
+AI_CALL_TIMEOUT = float(os.getenv("AI_CALL_TIMEOUT", "60"))  # Segundos por tentativa
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))  # Só para sobrecarga, 5xx, timeout e conexão
+AI_RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", "0.5"))
+AI_RETRY_MAX_DELAY = float(os.getenv("AI_RETRY_MAX_DELAY", "8"))
+# Hedge: dispara uma segunda chamada se a primeira passar do p95 observado do modelo
+AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+# Disjuntor por modelo e modelo alternativo enquanto o principal está fora
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+MODEL_FALLBACKS = json.loads(os.getenv(
+    "MODEL_FALLBACKS",
+    '{"claude-3-5-sonnet-20241022": "claude-3-5-haiku-20241022"}'
+))
+
+# model="auto": nota de complexidade a partir da qual o pedido vai para o modelo 'standard'
+ROUTER_COMPLEX_THRESHOLD = float(os.getenv("ROUTER_COMPLEX_THRESHOLD", "1.5"))
+
+# Single-flight: chamadas idênticas simultâneas ao Claude compartilham uma só chamada
+# (opt-in por rota; com temperature > 0 todos recebem a mesma resposta)
+COALESCE_CHAT_REQUESTS = os.getenv("COALESCE_CHAT_REQUESTS", "false").lower() in ("1", "true", "yes")
+COALESCE_ANALYZE_REQUESTS = os.getenv("COALESCE_ANALYZE_REQUESTS", "false").lower() in ("1", "true", "yes")
+
+# Cache de respostas do Claude (match exato)
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))
+AI_CACHE_TTL_SECONDS = float(os.getenv("AI_CACHE_TTL_SECONDS", "3600"))
+# Cache por similaridade (MinHash + LSH) para /ai/chat: mesmo pedido com outra
+# grafia, acentos ou pontuação. Vale só onde o cache exato vale. Desligado por
+# padrão: ligue só depois de conferir o threshold com pares rotulados
+# (iguais e diferentes) do seu tráfego, com similarity_cache.evaluate_threshold.
+AI_SIMILAR_CACHE_ENABLED = os.getenv("AI_SIMILAR_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+AI_SIMILAR_CACHE_MAX_ENTRIES = int(os.getenv("AI_SIMILAR_CACHE_MAX_ENTRIES", "5000"))
+AI_SIMILAR_CACHE_THRESHOLD = float(os.getenv("AI_SIMILAR_CACHE_THRESHOLD", "0.8"))  # Jaccard mínimo
+
+# Janela de contexto das conversas (orçamento de tokens por modelo)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+CONTEXT_TOKEN_BUDGETS = json.loads(os.getenv("CONTEXT_TOKEN_BUDGETS", "{}"))  # ex: {"claude-3-5-haiku-20241022": 4000}
+CONTEXT_RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "6"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "claude-3-5-haiku-20241022")
+
+# Grava o turno da conversa depois de enviar a resposta (write-behind)
+CONVERSATION_WRITE_BEHIND = os.getenv("CONVERSATION_WRITE_BEHIND", "false").lower() == "true"
+
+# Exportação/importação NDJSON: linhas lidas do cursor por vez e mensagens por INSERT/commit
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Cache em memória dos históricos de conversa (por worker)
+HISTORY_CACHE_MAX_CONVERSATIONS = int(os.getenv("HISTORY_CACHE_MAX_CONVERSATIONS", "1000"))
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Classificação em lote (/ai/analyze/batch)
+ANALYZE_BATCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "10"))
+ANALYZE_BATCH_MAX_ITEMS = int(os.getenv("ANALYZE_BATCH_MAX_ITEMS", "1000"))
+
+# Classificador local de intenção (responde sem chamar o Claude acima do limiar)
+INTENT_LOCAL_THRESHOLD = float(os.getenv("INTENT_LOCAL_THRESHOLD", "0.85"))
+# Só os exemplos iniciais dão confiança alta sem calibração: o local fica
+# desligado até ter este número de rótulos do Claude (arquivo ou aprendizado)
+INTENT_LOCAL_MIN_EXAMPLES = int(os.getenv("INTENT_LOCAL_MIN_EXAMPLES", "500"))
+INTENT_LEARN_MIN_CONFIDENCE = float(os.getenv("INTENT_LEARN_MIN_CONFIDENCE", "0.8"))
+INTENT_TRAINING_FILE = os.getenv("INTENT_TRAINING_FILE")  # NDJSON com 'message' e 'intent'
+
+# Autenticação
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))  # Threads dedicadas ao bcrypt
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+
+# Controle de admissão: limite por cliente (usuário ou IP), 0 desativa
+RATE_LIMIT_REQUESTS_PER_MINUTE = int(os.getenv("RATE_LIMIT_REQUESTS_PER_MINUTE", "60"))
+RATE_LIMIT_TOKENS_PER_MINUTE = int(os.getenv("RATE_LIMIT_TOKENS_PER_MINUTE", "100000"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Proxies confiáveis na frente da API (o Railway põe um): o IP do cliente anônimo
+# vem do X-Forwarded-For. 0 usa o IP da conexão (sem proxy: o header é forjável)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+# Chamadas simultâneas ao Claude e fila de espera (acima disso: 503 com Retry-After)
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "100"))
+UPSTREAM_MAX_QUEUE = int(os.getenv("UPSTREAM_MAX_QUEUE", "200"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "10"))
@@ -1,11 +1,324 @@
-from sqlalchemy import create_engine
+import asyncio
+import hashlib
+import time
+from fastapi import Request
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, create_engine, event, func, inspect, text
+)
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from app.config import DATABASE_URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from app.config import (
+    DATABASE_URL, DATABASE_READ_URL, ASYNC_DATABASE_URL, ASYNC_DATABASE_READ_URL,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT, DB_POOL_PRE_PING, DB_POOL_WARMUP
+)
+from app.utils.metrics import db_pool_checkout_wait, db_statement_duration, registry
+
+class _TimedPoolMixin:
+    """Mede a espera por uma conexão (checkout) do pool; o rótulo vem de pool_logging_name"""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            db_pool_checkout_wait.observe(time.perf_counter() - started, self._orig_logging_name or "default")
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def _statement_operation(statement: str) -> str:
+    """Primeira palavra do SQL (SELECT, INSERT, ...), rótulo das métricas"""
+    operation = statement.lstrip()[:12].split(None, 1)
+    return operation[0].upper() if operation else "UNKNOWN"
+
+def _instrument_engine(sync_engine, name: str):
+    """Duração de cada statement, via eventos da engine (síncrona ou a sync_engine da assíncrona)"""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        db_statement_duration.observe(time.perf_counter() - started, name, _statement_operation(statement))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        # Statement que falhou não chega no after_cursor_execute
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+def _create_engine(url: str, name: str = "primary"):
+    """Engine com as configurações de pool do config (o SQLite usa o pool padrão)"""
+    if url.startswith("sqlite"):
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+        _instrument_engine(engine, name)
+        return engine
+    
+    engine = create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_logging_name=name,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=DB_POOL_PRE_PING
+    )
+    _instrument_engine(engine, name)
+    return engine
+
+def _async_url(url: str) -> str:
+    """Troca o driver síncrono pelo assíncrono equivalente"""
+    if url.startswith("mysql+pymysql://"):
+        return "mysql+aiomysql://" + url[len("mysql+pymysql://"):]
+    if url.startswith("mysql://"):
+        return "mysql+aiomysql://" + url[len("mysql://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+def _create_async_engine(url: str, name: str = "async_primary"):
+    """Engine assíncrona com o mesmo pool da síncrona"""
+    if url.startswith("sqlite"):
+        engine = create_async_engine(url)
+        _instrument_engine(engine.sync_engine, name)
+        return engine
+    
+    engine = create_async_engine(
+        url,
+        poolclass=TimedAsyncAdaptedQueuePool,
+        pool_logging_name=name,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=DB_POOL_PRE_PING
+    )
+    _instrument_engine(engine.sync_engine, name)
+    return engine
+
+engine = _create_engine(DATABASE_URL)
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Camada assíncrona (usada pelas rotas); a síncrona continua para scripts e init_db
+async_engine = _create_async_engine(ASYNC_DATABASE_URL or _async_url(DATABASE_URL))
+if ASYNC_DATABASE_READ_URL or DATABASE_READ_URL:
+    async_read_engine = _create_async_engine(ASYNC_DATABASE_READ_URL or _async_url(DATABASE_READ_URL), "async_replica")
+else:
+    async_read_engine = async_engine
+
+def _pool_connections() -> dict:
+    """Conexões em uso e ociosas de cada pool (lidas na coleta do /metrics)"""
+    values = {}
+    engines = {
+        "primary": engine,
+        "async_primary": async_engine.sync_engine, "async_replica": async_read_engine.sync_engine
+    }
+    seen = set()
+    for name, pool_engine in engines.items():
+        pool = pool_engine.pool
+        # Sem réplica configurada, async_read_engine é a própria engine primária
+        if isinstance(pool, QueuePool) and id(pool_engine) not in seen:
+            seen.add(id(pool_engine))
+            values[(name, "checked_out")] = pool.checkedout()
+            values[(name, "idle")] = pool.checkedin()
+    return values
+
+registry.gauge("db_pool_connections", "Conexões do pool por estado", ("engine", "state"), _pool_connections)
+
+# expire_on_commit=False: atributos continuam acessíveis após o commit sem novo SELECT (lazy load não existe no async)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_sessionmaker(bind=async_read_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+# Métodos HTTP que só leem: podem ir para a réplica
+READ_ONLY_METHODS = {"GET", "HEAD"}
+
+async def get_async_db(request: Request):
+    """
+    Dependência de sessão do banco: requisições GET/HEAD usam a réplica de
+    leitura (se configurada), as demais o primário
+    """
+    session_factory = AsyncReadSessionLocal if request.method in READ_ONLY_METHODS else AsyncSessionLocal
+    async with session_factory() as db:
+        yield db
+
+def _add_missing_columns():
+    """
+    create_all não altera tabelas existentes: adiciona as colunas e índices
+    novos dos models que ainda não existem no banco.
+    
+    Returns:
+        set de (tabela, coluna) adicionadas
+    """
+    inspector = inspect(engine)
+    added = set()
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+                added.add((table.name, column.name))
+            
+            existing_indexes = {idx["name"] for idx in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+    
+    return added
+
+def _create_sqlite_search_index():
+    """
+    SQLite não tem FULLTEXT: cria a tabela FTS5 messages_fts (índice externo
+    sobre messages.content) e os triggers que a mantêm sincronizada
+    """
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        )).first()
+        if exists:
+            return
+        
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE messages_fts USING fts5("
+            "content, content='messages', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages BEGIN "
+            "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages BEGIN "
+            "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER messages_fts_au AFTER UPDATE OF content ON messages BEGIN "
+            "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+            "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END"
+        ))
+        # Indexa as mensagens que já existiam
+        conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+
+# Versão do schema aplicada no banco (fora de Base.metadata: não entra no fingerprint)
+schema_version_table = Table(
+    "schema_version",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("version", String(64), nullable=False),
+    Column("applied_at", DateTime, server_default=func.now())
+)
+
+def _import_models():
+    from app.models import user_model, conversation_model, usage_model  # certifique-se que importa todos os models
+
+def schema_fingerprint() -> str:
+    """
+    Hash do DDL de todas as tabelas e índices dos models: muda sozinho quando
+    um model ganha tabela, coluna ou índice (sem número de versão para lembrar de subir)
+    """
+    _import_models()
+    digest = hashlib.sha256()
+    for table in Base.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=engine.dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=engine.dialect)).encode())
+    return digest.hexdigest()
+
+def _record_schema_version(version: str):
+    schema_version_table.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        conn.execute(schema_version_table.delete())
+        conn.execute(schema_version_table.insert().values(id=1, version=version))
+
+async def schema_is_current() -> bool:
+    """Uma consulta: a versão gravada no banco é a dos models atuais?"""
+    expected = schema_fingerprint()
+    try:
+        async with async_engine.connect() as conn:
+            stored = await conn.scalar(
+                text("SELECT version FROM schema_version WHERE id = 1")
+            )
+    except DBAPIError:
+        # Banco sem a tabela schema_version (anterior a ela ou vazio)
+        return False
+    return stored == expected
+
+async def warm_up_pools(connections: int = DB_POOL_WARMUP):
+    """Abre `connections` conexões em cada pool assíncrono antes do tráfego chegar"""
+    for pool_engine in {async_engine, async_read_engine}:
+        pool = pool_engine.sync_engine.pool
+        count = min(connections, pool.size()) if isinstance(pool, QueuePool) else 1
+        conns = []
+        try:
+            for _ in range(count):
+                conn = await pool_engine.connect()
+                conns.append(conn)
+                await conn.execute(text("SELECT 1"))
+        finally:
+            # Devolvidas ao pool, as conexões ficam abertas e ociosas
+            for conn in conns:
+                await conn.close()
+
+async def ping(timeout: float = 2.0) -> bool:
+    """O banco responde a um SELECT 1 dentro do timeout?"""
+    async def select_one():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    try:
+        await asyncio.wait_for(select_one(), timeout)
+        return True
+    except (asyncio.TimeoutError, DBAPIError, OSError):
+        return False
+
+async def prepare_database():
+    """
+    Startup: confere a versão do schema (uma consulta) e só roda init_db
+    quando os models mudaram; depois aquece os pools
+    """
+    if not await schema_is_current():
+        await asyncio.to_thread(init_db)
+    await warm_up_pools()
+
+async def dispose_engines():
+    for pool_engine in {async_engine, async_read_engine}:
+        await pool_engine.dispose()
+    engine.dispose()
+
 def init_db():
-    from app.models import user_model, conversation_model  # certifique-se que importa todos os models
+    """Cria/atualiza tabelas, colunas e índices dos models e grava a versão do schema"""
+    _import_models()
     Base.metadata.create_all(bind=engine)
+    added = _add_missing_columns()
+    if engine.dialect.name == "sqlite":
+        _create_sqlite_search_index()
+    
+    # Preenche o contador desnormalizado nas conversas que já existiam
+    if ("conversations", "message_count") in added:
+        from app.services import conversation_service
+        db = SessionLocal()
+        try:
+            conversation_service.recount_messages(db)
+        finally:
+            db.close()
+    
+    _record_schema_version(schema_fingerprint())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -12,12 +12,22 @@ class Conversation(Base):
     title = Column(String(200), default="Nova Conversa")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    message_count = Column(Integer, default=0, server_default="0")  # Mantido por add_message
+    
+    # Resumo incremental das mensagens que saíram da janela de contexto
+    summary = Column(Text, nullable=True)
+    summarized_until_id = Column(Integer, default=0, server_default="0")  # Última mensagem incluída no resumo
     
     # Relacionamento com mensagens
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
     
     # Relacionamento com usuário (opcional)
     user = relationship("User", back_populates="conversations")
+    
+    # Lista de conversas do usuário ordenada por atualização (sidebar)
+    __table_args__ = (
+        Index("ix_conversations_user_id_updated_at", "user_id", "updated_at"),
+    )
 
 
 class Message(Base):
@@ -32,7 +42,16 @@ class Message(Base):
     tokens_used = Column(Integer, default=0)
     input_tokens = Column(Integer, default=0)
     output_tokens = Column(Integer, default=0)
+    cache_creation_input_tokens = Column(Integer, default=0, server_default="0")  # Tokens gravados no prompt cache
+    cache_read_input_tokens = Column(Integer, default=0, server_default="0")  # Tokens lidos do prompt cache
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relacionamento com conversa
-    conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
+    conversation = relationship("Conversation", back_populates="messages")
+    
+    # Histórico paginado de uma conversa (keyset em created_at, id)
+    # e busca textual (FULLTEXT no MySQL; no SQLite a busca usa a tabela FTS5 messages_fts)
+    __table_args__ = (
+        Index("ix_messages_conversation_id_created_at_id", "conversation_id", "created_at", "id"),
+        Index("ix_messages_content_fulltext", "content", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+    )
\ No newline at end of file
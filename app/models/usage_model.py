@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, Date
+from app.database import Base
+
+class UsageRollup(Base):
+    """
+    Uso de tokens acumulado por (usuário, modelo, dia), mantido na mesma
+    transação em que as mensagens são gravadas (ver usage_service)
+    """
+    __tablename__ = "usage_rollups"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)  # 0 = conversas sem usuário
+    model = Column(String(100), primary_key=True)
+    day = Column(Date, primary_key=True)  # Dia (UTC) da mensagem
+    message_count = Column(Integer, default=0, server_default="0")  # Respostas do Claude
+    tokens_used = Column(Integer, default=0, server_default="0")
+    input_tokens = Column(Integer, default=0, server_default="0")
+    output_tokens = Column(Integer, default=0, server_default="0")
+    cache_creation_input_tokens = Column(Integer, default=0, server_default="0")
+    cache_read_input_tokens = Column(Integer, default=0, server_default="0")
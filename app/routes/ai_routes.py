@@ -1,12 +1,20 @@
 # app/routes/ai_routes.py
-from fastapi import APIRouter, HTTPException
+import json
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from app.config import (
+    ANALYZE_BATCH_CONCURRENCY, ANALYZE_BATCH_MAX_ITEMS, COALESCE_CHAT_REQUESTS, COALESCE_ANALYZE_REQUESTS
+)
 from app.schemas import ai_schemas
 from app.services import ai_service
+from app.services.context_service import estimate_tokens
+from app.utils.admission import client_key, get_admission_stats, rate_limiter
+from app.utils.sse import start_stream, stream_events_as_sse
 
 router = APIRouter()
 
 @router.post("/chat", response_model=ai_schemas.ChatResponse)
-def chat(request: ai_schemas.ChatRequest):
+async def chat(request: ai_schemas.ChatRequest, http_request: Request):
     """
     Conversa com o Claude AI (sem salvar no banco)
     
@@ -25,21 +33,36 @@ def chat(request: ai_schemas.ChatRequest):
     - `claude-3-5-sonnet-20241022` (Recomendado - mais inteligente)
     - `claude-3-5-haiku-20241022` (Mais rápido e econômico)
     - `claude-3-opus-20240229` (Alta performance)
+    - `auto`: escolhe entre Haiku (pedidos simples) e Sonnet (complexos);
+      o modelo escolhido volta em `model`, com `routed: true`
+    
+    Acima do limite por cliente responde 429; com o Claude saturado, 503
+    (ambos com `Retry-After`).
     """
+    # Pedido inválido não consome a cota do cliente
+    if not request.message.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Mensagem não pode estar vazia"
+        )
+    
+    rate_key = client_key(http_request)
+    estimated_tokens = estimate_tokens(request.message) + estimate_tokens(request.system_prompt)
+    rate_limiter.acquire(rate_key, estimated_tokens)
+    
     try:
-        if not request.message.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="Mensagem não pode estar vazia"
-            )
-        
-        result = ai_service.chat_with_ai(
+        result = await ai_service.chat_with_ai_async(
             message=request.message,
             system_prompt=request.system_prompt,
             model=request.model,
             max_tokens=request.max_tokens,
-            temperature=request.temperature
+            temperature=request.temperature,
+            use_cache=request.use_cache,
+            coalesce=COALESCE_CHAT_REQUESTS
         )
+        # Resposta do cache ou de chamada compartilhada não gastou tokens deste cliente
+        spent = 0 if result['cached'] or result['coalesced'] else result['tokens_used']
+        rate_limiter.settle(rate_key, estimated_tokens, spent)
         
         return ai_schemas.ChatResponse(
             success=True,
@@ -47,17 +70,69 @@ def chat(request: ai_schemas.ChatRequest):
             tokens_used=result['tokens_used'],
             input_tokens=result['input_tokens'],
             output_tokens=result['output_tokens'],
-            model=result['model']
+            model=result['model'],
+            routed=result['routed'],
+            cached=result['cached'],
+            coalesced=result['coalesced'],
+            cache_similarity=result.get('cache_similarity'),
+            cache_creation_input_tokens=result['cache_creation_input_tokens'],
+            cache_read_input_tokens=result['cache_read_input_tokens']
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao processar mensagem: {str(e)}"
         )
 
+@router.post("/chat/stream")
+async def chat_stream(request: ai_schemas.ChatRequest, http_request: Request):
+    """
+    Conversa com o Claude em streaming (Server-Sent Events)
+    
+    Recebe o mesmo body de `/ai/chat` e emite os eventos:
+    - `start`: `{"input_tokens": 12}`
+    - `delta`: `{"text": "trecho da resposta"}`
+    - `done`: mesmos campos de `ChatResponse` (sem `success`)
+    - `error`: `{"error": "..."}`
+    
+    Com o Claude saturado responde 503 (com `Retry-After`) antes de abrir o stream.
+    """
+    if not request.message.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Mensagem não pode estar vazia"
+        )
+    
+    rate_key = client_key(http_request)
+    estimated_tokens = estimate_tokens(request.message) + estimate_tokens(request.system_prompt)
+    rate_limiter.acquire(rate_key, estimated_tokens)
+    
+    async def events():
+        async for event in ai_service.stream_chat_with_ai(
+            message=request.message,
+            system_prompt=request.system_prompt,
+            model=request.model,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature
+        ):
+            if event["type"] == "done":
+                rate_limiter.settle(rate_key, estimated_tokens, event["tokens_used"])
+            yield event
+    
+    # Antes do 200: Claude saturado responde 503 com Retry-After
+    started_events = await start_stream(events())
+    
+    return StreamingResponse(
+        stream_events_as_sse(started_events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/chat/context", response_model=ai_schemas.ChatWithContextResponse)
-def chat_with_context(request: ai_schemas.ChatWithContextRequest):
+async def chat_with_context(request: ai_schemas.ChatWithContextRequest, http_request: Request):
     """
     Chat com Claude mantendo contexto da conversa (sem salvar no banco)
     
@@ -76,32 +151,46 @@ def chat_with_context(request: ai_schemas.ChatWithContextRequest):
     **Importante:** O histórico deve alternar entre 'user' e 'assistant'.
     A primeira mensagem deve ser sempre do 'user'.
     """
+    # Pedido inválido não consome a cota do cliente
+    if not request.message.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Mensagem não pode estar vazia"
+        )
+    
+    rate_key = client_key(http_request)
+    estimated_tokens = estimate_tokens(request.message) + estimate_tokens(request.system_prompt) + sum(
+        estimate_tokens(msg.content) for msg in request.conversation_history
+    )
+    rate_limiter.acquire(rate_key, estimated_tokens)
+    
     try:
-        if not request.message.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="Mensagem não pode estar vazia"
-            )
-        
         # Converte Pydantic models para dicts
         history = [{"role": msg.role, "content": msg.content} 
                    for msg in request.conversation_history]
         
-        result = ai_service.chat_with_context(
+        result = await ai_service.chat_with_context_async(
             message=request.message,
             conversation_history=history,
             system_prompt=request.system_prompt,
             model=request.model
         )
+        rate_limiter.settle(rate_key, estimated_tokens, result['tokens_used'])
         
         return ai_schemas.ChatWithContextResponse(
             success=True,
             response=result['response'],
             tokens_used=result['tokens_used'],
             input_tokens=result['input_tokens'],
-            output_tokens=result['output_tokens']
+            output_tokens=result['output_tokens'],
+            model=result['model'],
+            routed=result['routed'],
+            cache_creation_input_tokens=result['cache_creation_input_tokens'],
+            cache_read_input_tokens=result['cache_read_input_tokens']
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -109,7 +198,7 @@ def chat_with_context(request: ai_schemas.ChatWithContextRequest):
         )
 
 @router.post("/analyze")
-def analyze_query(request: ai_schemas.ChatRequest):
+async def analyze_query(request: ai_schemas.ChatRequest):
     """
     Analisa a intenção de uma mensagem usando Claude
     
@@ -123,6 +212,9 @@ def analyze_query(request: ai_schemas.ChatRequest):
     **Retorna:**
     - intent: tipo de mensagem (pergunta, ajuda, reclamação, etc)
     - confidence: nível de confiança da análise (0-1)
+    - source: quem classificou (`local`, `cache` ou `claude`)
+    
+    Com o Claude saturado responde 503 (com `Retry-After`).
     """
     try:
         if not request.message.strip():
@@ -131,20 +223,74 @@ def analyze_query(request: ai_schemas.ChatRequest):
                 detail="Mensagem não pode estar vazia"
             )
         
-        result = ai_service.analyze_user_query(request.message)
+        result = await ai_service.analyze_user_query_async(
+            request.message,
+            use_cache=request.use_cache is not False,
+            coalesce=COALESCE_ANALYZE_REQUESTS
+        )
         return {
             "success": True,
             "intent": result.get('intent', 'unknown'),
             "confidence": result.get('confidence', 0.0),
-            "message": request.message
+            "message": request.message,
+            "cached": result.get('cached', False),
+            "coalesced": result.get('coalesced', False),
+            "source": result.get('source')
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao analisar mensagem: {str(e)}"
         )
 
+@router.post("/analyze/batch", response_model=ai_schemas.AnalyzeBatchResponse)
+async def analyze_batch(request: ai_schemas.AnalyzeBatchRequest):
+    """
+    Classifica a intenção de várias mensagens em paralelo
+    
+    **Exemplo:**
+    ```json
+    {
+        "messages": ["Como troco minha senha?", "O sistema caiu de novo"],
+        "concurrency": 10
+    }
+    ```
+    
+    Cada item é independente: uma falha aparece em `error` daquele item sem
+    derrubar o lote (com o Claude sobrecarregado, também em `retry_after`). Os resultados voltam na ordem da entrada; com
+    `"stream": true` a resposta é NDJSON (um item por linha, na ordem em que
+    ficam prontos, identificados por `index`).
+    """
+    if len(request.messages) > ANALYZE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {ANALYZE_BATCH_MAX_ITEMS} mensagens por lote"
+        )
+    
+    concurrency = min(request.concurrency or ANALYZE_BATCH_CONCURRENCY, ANALYZE_BATCH_CONCURRENCY)
+    use_cache = request.use_cache is not False
+    
+    if request.stream:
+        async def ndjson_stream():
+            async for item in ai_service.analyze_batch_stream(
+                request.messages, concurrency, use_cache, COALESCE_ANALYZE_REQUESTS
+            ):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        
+        return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+    
+    results = await ai_service.analyze_batch(
+        request.messages, concurrency, use_cache, COALESCE_ANALYZE_REQUESTS
+    )
+    return ai_schemas.AnalyzeBatchResponse(
+        success=True,
+        results=results,
+        errors=sum(1 for item in results if item["error"])
+    )
+
 @router.get("/models", response_model=ai_schemas.ModelsResponse)
 def list_models():
     """
@@ -153,6 +299,46 @@ def list_models():
     models = ai_service.get_available_models()
     return ai_schemas.ModelsResponse(models=models)
 
+@router.get("/cache/stats", response_model=ai_schemas.CacheStatsResponse)
+def cache_stats():
+    """
+    Contadores do cache de respostas (hits, misses, evictions) para dimensionamento
+    """
+    return ai_service.get_cache_stats()
+
+@router.get("/cache/similar/stats")
+def similar_cache_stats():
+    """
+    Cache por similaridade do /ai/chat: contadores e os últimos acertos
+    (similaridade, texto pedido e texto encontrado) para calibrar
+    AI_SIMILAR_CACHE_THRESHOLD
+    """
+    return ai_service.get_similar_cache_stats()
+
+@router.get("/limits/stats")
+async def limits_stats():
+    """
+    Estado do controle de admissão: recusas por cliente (429) e, nas chamadas
+    ao Claude, vagas ocupadas, tamanho da fila (`queue_depth`) e recusas (503)
+    """
+    return get_admission_stats()
+
+@router.get("/resilience/stats")
+async def resilience_stats():
+    """
+    Novas tentativas, hedges e trocas de modelo feitas até agora, estado do
+    disjuntor de cada modelo e p95 de latência observado (atraso do hedge)
+    """
+    return ai_service.get_resilience_stats()
+
+@router.get("/intent/stats")
+def intent_stats():
+    """
+    Classificador local de intenção: exemplos aprendidos, rótulos do Claude,
+    linhas inválidas puladas no arquivo de treino e se já responde sem o Claude
+    """
+    return ai_service.get_intent_stats()
+
 @router.get("/health")
 def health_check():
     """
@@ -166,4 +352,13 @@ def health_check():
         "status": "online" if has_key else "no_api_key",
         "service": "Anthropic Claude",
         "message": "Claude configurado ✅" if has_key else "⚠️ Configure ANTHROPIC_API_KEY no arquivo .env"
-    }
\ No newline at end of file
+    }
+
+@router.get("/coalescing/stats")
+async def coalescing_stats():
+    """
+    Single-flight: chamadas ao Claude feitas de fato (`leaders`), pedidos que
+    receberam o resultado de uma chamada idêntica em andamento (`coalesced`)
+    e chamadas compartilháveis rodando agora (`in_flight`)
+    """
+    return ai_service.get_coalescing_stats()
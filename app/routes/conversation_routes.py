@@ -1,118 +1,280 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
+import anyio
+import logging
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import CONVERSATION_WRITE_BEHIND
+from app.database import AsyncReadSessionLocal, AsyncSessionLocal, get_async_db
 from app.schemas import conversation_schemas, ai_schemas
-from app.services import conversation_service, ai_service
-from typing import List
+from app.services import conversation_service, ai_service, context_service, transfer_service
+from app.utils.admission import client_key, rate_limiter
+from app.utils.auth import get_current_user
+from app.utils.sse import format_sse, start_stream
+from datetime import date, datetime
+from typing import List, Optional
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+router = APIRouter()
 
 @router.post("/", response_model=conversation_schemas.ConversationResponse)
-def create_conversation(
+async def create_conversation(
     conversation: conversation_schemas.ConversationCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cria uma nova conversa"""
-    return conversation_service.create_conversation(db, conversation)
+    return await conversation_service.create_conversation_async(db, conversation)
+
+@router.get("/", response_model=conversation_schemas.ConversationListPage)
+async def list_conversations(
+    user_id: int = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Lista as conversas, da mais recente para a mais antiga.
+    
+    Paginação por cursor: envie o `next_cursor` da resposta como `cursor`
+    para buscar a próxima página (`next_cursor` nulo indica o fim).
+    """
+    try:
+        items, next_cursor = await conversation_service.list_conversations_async(db, user_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/search", response_model=conversation_schemas.MessageSearchPage)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200, description="Texto a buscar nas mensagens"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Busca nas mensagens das conversas do usuário autenticado
+    (Authorization: Bearer <token>), da mais relevante para a menos relevante.
+    Sem token responde 401: a busca devolve o conteúdo das mensagens.
+    
+    Cada resultado traz um trecho (`snippet`) com os termos encontrados entre
+    `<mark></mark>`. Para a próxima página, some `limit` ao `offset`
+    enquanto `has_more` for verdadeiro.
+    """
+    try:
+        items, has_more = await conversation_service.search_messages_async(db, q, current_user["user_id"], limit, offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "has_more": has_more}
+
+@router.get("/export")
+async def export_conversations(
+    user_id: int = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None
+):
+    """
+    Exporta conversas e mensagens em NDJSON (streaming): uma linha
+    `{"type": "conversation", ...}` seguida das linhas `{"type": "message", ...}`
+    dela. Filtros opcionais: `user_id` e data de criação da conversa
+    (`start`/`end`, inclusive). O arquivo serve de entrada para `/import`.
+    """
+    async def ndjson_stream():
+        # Sessão própria: a do Depends é fechada antes do fim do streaming
+        async with AsyncReadSessionLocal() as db:
+            async for chunk in transfer_service.export_conversations_async(db, user_id, start, end):
+                yield chunk
+    
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="conversations.ndjson"'}
+    )
 
-@router.get("/", response_model=List[conversation_schemas.ConversationListResponse])
-def list_conversations(
+async def _request_lines(request: Request):
+    """Linhas do corpo da requisição, lidas à medida que chegam"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8")
+    if buffer:
+        yield buffer.decode("utf-8")
+
+@router.post("/import", response_model=conversation_schemas.ImportResult)
+async def import_conversations(
+    request: Request,
     user_id: int = None,
-    limit: int = 50,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Lista todas as conversas"""
-    return conversation_service.list_conversations(db, user_id, limit)
+    """
+    Importa o NDJSON gerado por `/export` (corpo da requisição, `application/x-ndjson`).
+    As conversas recebem ids novos; com `user_id`, todas passam a ser desse usuário.
+    As mensagens são gravadas em lotes (um commit por lote): se uma linha for
+    inválida a resposta é 400 e os lotes anteriores a ela continuam gravados.
+    """
+    try:
+        return await transfer_service.import_conversations_async(db, _request_lines(request), user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/{conversation_id}", response_model=conversation_schemas.ConversationResponse)
-def get_conversation(conversation_id: int, db: Session = Depends(get_db)):
-    """Busca uma conversa específica com todas as mensagens"""
-    conversation = conversation_service.get_conversation(db, conversation_id)
+async def get_conversation(conversation_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Busca os dados de uma conversa (sem as mensagens).
+    As mensagens ficam em `GET /conversations/{conversation_id}/messages`.
+    """
+    conversation = await conversation_service.get_conversation_async(db, conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversa não encontrada")
     return conversation
 
+@router.get("/{conversation_id}/messages", response_model=conversation_schemas.MessagePage)
+async def list_messages(
+    conversation_id: int,
+    before: Optional[int] = Query(None, description="Mensagens anteriores a este id"),
+    after: Optional[int] = Query(None, description="Mensagens posteriores a este id"),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Lista as mensagens de uma conversa em ordem cronológica, paginadas.
+    
+    Sem `before`/`after` retorna as mensagens mais recentes. Para rolar o
+    histórico para trás, envie `before` com o id da primeira mensagem da página;
+    para buscar mensagens novas, envie `after` com o id da última.
+    `has_more` indica se existem mais mensagens nessa direção.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use apenas 'before' ou 'after'")
+    
+    messages, has_more = await conversation_service.list_messages_async(
+        db, conversation_id, limit, before_id=before, after_id=after
+    )
+    if not messages and not await conversation_service.get_conversation_async(db, conversation_id):
+        raise HTTPException(status_code=404, detail="Conversa não encontrada")
+    
+    return {"items": messages, "has_more": has_more}
+
 @router.patch("/{conversation_id}", response_model=conversation_schemas.ConversationResponse)
-def update_conversation(
+async def update_conversation(
     conversation_id: int,
     update_data: conversation_schemas.ConversationUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Atualiza o título de uma conversa"""
-    conversation = conversation_service.update_conversation(db, conversation_id, update_data)
+    conversation = await conversation_service.update_conversation_async(db, conversation_id, update_data)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversa não encontrada")
     return conversation
 
 @router.delete("/{conversation_id}")
-def delete_conversation(conversation_id: int, db: Session = Depends(get_db)):
+async def delete_conversation(conversation_id: int, db: AsyncSession = Depends(get_async_db)):
     """Deleta uma conversa"""
-    success = conversation_service.delete_conversation(db, conversation_id)
+    success = await conversation_service.delete_conversation_async(db, conversation_id)
     if not success:
         raise HTTPException(status_code=404, detail="Conversa não encontrada")
     return {"message": "Conversa deletada com sucesso"}
 
+async def _save_turn_write_behind(conversation_id: int, messages: list, summary, summarized_until_id):
+    """
+    Grava o turno com sessão própria: em segundo plano ou no fim de um
+    stream, a sessão da requisição já foi fechada
+    """
+    async with AsyncSessionLocal() as db:
+        await conversation_service.save_turn_async(db, conversation_id, messages, summary, summarized_until_id)
+
+async def _save_unanswered_message(conversation_id: int, user_message):
+    """
+    Claude falhou: grava só a mensagem do usuário. Um erro aqui é registrado
+    no log e não substitui o erro do Claude na resposta.
+    """
+    try:
+        await _save_turn_write_behind(conversation_id, [user_message], None, None)
+    except Exception:
+        logger.exception("falha ao gravar a mensagem sem resposta da conversa %s", conversation_id)
+
 @router.post("/{conversation_id}/message", response_model=ai_schemas.ChatResponse)
-def send_message(
+async def send_message(
     conversation_id: int,
     request: ai_schemas.ChatRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    http_request: Request,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Envia uma mensagem em uma conversa existente e salva no banco.
-    O Claude responderá usando o contexto completo da conversa.
+    O Claude responderá usando o contexto da conversa: as mensagens recentes
+    na íntegra e um resumo das antigas (ver context_service).
+    
+    A mensagem do usuário e a resposta são gravadas juntas, em uma única
+    transação, depois da resposta do Claude. Se a chamada ao Claude falhar
+    (503 ou 500), a mensagem do usuário é gravada sozinha, como antes.
+    
+    Acima do limite por cliente responde 429; com o Claude saturado, 503
+    (ambos com `Retry-After`).
     """
-    # Verifica se a conversa existe
-    conversation = conversation_service.get_conversation(db, conversation_id)
+    user_message = conversation_schemas.MessageCreate(
+        role="user",
+        content=request.message,
+        created_at=datetime.utcnow()
+    )
+    
+    # Verifica se a conversa existe e busca o histórico (só o que ainda não está no resumo)
+    conversation, history = await conversation_service.get_turn_context_async(db, conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversa não encontrada")
     
-    # Salva a mensagem do usuário
-    user_message = conversation_service.add_message(
-        db,
-        conversation_id,
-        conversation_schemas.MessageCreate(
-            role="user",
-            content=request.message
-        )
-    )
-    
-    # Busca histórico da conversa
-    history = conversation_service.get_conversation_history(db, conversation_id)
+    # Só depois do 404: pedido inválido não consome a cota do cliente
+    rate_key = client_key(http_request)
+    estimated_tokens = context_service.estimate_tokens(request.message) + context_service.estimate_tokens(request.system_prompt)
+    rate_limiter.acquire(rate_key, estimated_tokens)
     
-    # Remove a última mensagem (que acabamos de adicionar) do histórico
-    # pois vamos enviá-la separadamente
-    history = history[:-1]
+    summary = conversation.summary
+    model, routed = ai_service.resolve_model(
+        request.model, request.message, history, system_prompt=request.system_prompt
+    )
     
+    result = None
     try:
+        # Aplica o orçamento de tokens: mensagens antigas vão para o resumo
+        history, summary, summarized_until_id = await context_service.prepare_context(
+            summary, history, request.message, model
+        )
+        
         # Chama o Claude com o contexto
-        result = ai_service.chat_with_context(
+        result = await ai_service.chat_with_context_async(
             message=request.message,
             conversation_history=history,
             system_prompt=request.system_prompt,
-            model=request.model
+            model=model,
+            summary=summary
         )
+        rate_limiter.settle(rate_key, estimated_tokens, result['tokens_used'])
         
-        # Salva a resposta do Claude
-        ai_message = conversation_service.add_message(
-            db,
-            conversation_id,
+        # Salva a mensagem do usuário e a resposta do Claude
+        messages = [
+            user_message,
             conversation_schemas.MessageCreate(
                 role="assistant",
                 content=result['response'],
-                model=request.model,
+                model=result['model'],
                 tokens_used=result['tokens_used'],
                 input_tokens=result['input_tokens'],
-                output_tokens=result['output_tokens']
+                output_tokens=result['output_tokens'],
+                cache_creation_input_tokens=result['cache_creation_input_tokens'],
+                cache_read_input_tokens=result['cache_read_input_tokens']
+            )
+        ]
+        if CONVERSATION_WRITE_BEHIND:
+            background_tasks.add_task(
+                _save_turn_write_behind, conversation_id, messages, summary, summarized_until_id
+            )
+        else:
+            await conversation_service.save_turn_async(
+                db, conversation_id, messages, summary, summarized_until_id
             )
-        )
         
         return ai_schemas.ChatResponse(
             success=True,
@@ -120,11 +282,158 @@ def send_message(
             tokens_used=result['tokens_used'],
             input_tokens=result['input_tokens'],
             output_tokens=result['output_tokens'],
-            model=request.model
+            model=result['model'],
+            routed=routed,
+            cache_creation_input_tokens=result['cache_creation_input_tokens'],
+            cache_read_input_tokens=result['cache_read_input_tokens']
         )
     
+    except HTTPException:
+        if result is None:
+            await _save_unanswered_message(conversation_id, user_message)
+        raise
     except Exception as e:
+        if result is None:
+            await _save_unanswered_message(conversation_id, user_message)
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao processar mensagem: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/{conversation_id}/message/stream")
+async def send_message_stream(
+    conversation_id: int,
+    request: ai_schemas.ChatRequest,
+    http_request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Igual a `/{conversation_id}/message`, mas a resposta chega em streaming (SSE).
+    
+    Eventos: `start`, `delta`, `done` e `error` (ver `/ai/chat/stream`).
+    Com o Claude saturado responde 503 (com `Retry-After`) antes de abrir o stream.
+    O turno é salvo quando o stream termina; se o cliente desconectar no
+    meio, o texto parcial recebido até ali é salvo como resposta, com os
+    tokens de saída do último message_delta (ou estimados pelo texto).
+    Se o Claude falhar (503, 500 ou evento `error`), só a mensagem do
+    usuário é salva.
+    """
+    user_message = conversation_schemas.MessageCreate(
+        role="user",
+        content=request.message,
+        created_at=datetime.utcnow()
+    )
+    
+    conversation, history = await conversation_service.get_turn_context_async(db, conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversa não encontrada")
+    
+    # Só depois do 404: pedido inválido não consome a cota do cliente
+    rate_key = client_key(http_request)
+    estimated_tokens = context_service.estimate_tokens(request.message) + context_service.estimate_tokens(request.system_prompt)
+    rate_limiter.acquire(rate_key, estimated_tokens)
+    
+    model, routed = ai_service.resolve_model(
+        request.model, request.message, history, system_prompt=request.system_prompt
+    )
+    
+    # Contexto e primeiro evento antes do 200: Claude saturado responde 503 com Retry-After
+    try:
+        context, context_summary, summarized_until_id = await context_service.prepare_context(
+            conversation.summary, history, request.message, model
+        )
+        claude_events = await start_stream(ai_service.stream_chat_with_context(
+            message=request.message,
+            conversation_history=context,
+            system_prompt=request.system_prompt,
+            model=model,
+            summary=context_summary
+        ))
+    except HTTPException:
+        await _save_unanswered_message(conversation_id, user_message)
+        raise
+    except Exception as e:
+        await _save_unanswered_message(conversation_id, user_message)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao processar mensagem: {str(e)}"
+        )
+    
+    async def event_stream():
+        parts = []
+        usage = {
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0
+        }
+        output_reported = False
+        reply_model = model
+        saved = False
+        
+        async def save_reply():
+            content = "".join(parts)
+            # Stream cortado antes do message_delta: estima pelo texto recebido
+            output_tokens = usage["output_tokens"] if output_reported else context_service.estimate_tokens(content)
+            # Protegido contra cancelamento: roda mesmo se o cliente desconectar.
+            # Sessão própria: a do Depends já foi fechada quando o stream termina.
+            with anyio.CancelScope(shield=True):
+                await _save_turn_write_behind(
+                    conversation_id,
+                    [
+                        user_message,
+                        conversation_schemas.MessageCreate(
+                            role="assistant",
+                            content=content,
+                            model=reply_model,
+                            tokens_used=usage["input_tokens"] + output_tokens,
+                            input_tokens=usage["input_tokens"],
+                            output_tokens=output_tokens,
+                            cache_creation_input_tokens=usage["cache_creation_input_tokens"],
+                            cache_read_input_tokens=usage["cache_read_input_tokens"]
+                        )
+                    ],
+                    context_summary,
+                    summarized_until_id
+                )
+        
+        try:
+            async for event in claude_events:
+                if event["type"] == "start":
+                    for key in usage:
+                        usage[key] = event.get(key, 0)
+                elif event["type"] == "delta":
+                    parts.append(event["text"])
+                elif event["type"] == "usage":
+                    usage["output_tokens"] = event["output_tokens"]
+                    output_reported = True
+                    continue
+                elif event["type"] == "done":
+                    parts = [event["response"]]
+                    reply_model = event["model"]
+                    event["routed"] = routed
+                    for key in usage:
+                        usage[key] = event[key]
+                    output_reported = True
+                    rate_limiter.settle(rate_key, estimated_tokens, event["tokens_used"])
+                    await save_reply()
+                    saved = True
+                
+                yield format_sse(event["type"], {k: v for k, v in event.items() if k != "type"})
+        
+        except Exception as e:
+            # Erro do Claude no meio: o texto parcial não é uma resposta, só a pergunta é salva
+            saved = True
+            await _save_unanswered_message(conversation_id, user_message)
+            yield format_sse("error", {"error": f"Erro ao processar mensagem: {str(e)}"})
+        
+        finally:
+            # Só chega aqui sem salvar com o cliente desconectado (cancelamento/fechamento)
+            if not saved and parts:
+                await save_reply()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
+from app.schemas import usage_schemas
+from app.services import usage_service
+from datetime import date
+from typing import List, Optional
+
+router = APIRouter()
+
+@router.get("/daily", response_model=List[usage_schemas.UsageItem])
+async def get_daily_usage(
+    user_id: Optional[int] = Query(None, description="0 = conversas sem usuário"),
+    model: Optional[str] = None,
+    start: Optional[date] = Query(None, description="Primeiro dia (inclusive)"),
+    end: Optional[date] = Query(None, description="Último dia (inclusive)"),
+    limit: int = Query(366, ge=1, le=5000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Uso de tokens por usuário, modelo e dia, do dia mais recente para o mais antigo"""
+    return await usage_service.get_daily_usage_async(db, user_id, model, start, end, limit)
+
+@router.get("/summary", response_model=usage_schemas.UsageSummaryResponse)
+async def get_usage_summary(
+    group_by: str = Query("model", description="user, model ou day"),
+    user_id: Optional[int] = Query(None, description="0 = conversas sem usuário"),
+    model: Optional[str] = None,
+    start: Optional[date] = Query(None, description="Primeiro dia (inclusive)"),
+    end: Optional[date] = Query(None, description="Último dia (inclusive)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Uso de tokens no período, agrupado por usuário, modelo ou dia, com o total.
+    Calculado a partir dos rollups diários, sem ler a tabela de mensagens.
+    """
+    try:
+        items = await usage_service.get_usage_summary_async(db, group_by, user_id, model, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    total = await usage_service.get_usage_summary_async(db, None, user_id, model, start, end)
+    return {"group_by": group_by, "items": items, "total": total[0]}
@@ -1,22 +1,58 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import ACCESS_TOKEN_EXPIRE_MINUTES
+from app.database import get_async_db
 from app import schemas
 from app.services import user_service
+from app.utils.auth import get_current_user
+from app.utils.security import (
+    create_access_token, hash_password_async, needs_rehash, verify_password_async
+)
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Hash usado quando o usuário não existe, para o login levar o mesmo tempo
+_dummy_hash = None
 
 @router.post("/", response_model=schemas.UserResponse)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    return user_service.create_user(db, user)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    hashed_password = await hash_password_async(user.password)
+    return await user_service.create_user_async(db, user, hashed_password)
 
 @router.get("/", response_model=list[schemas.UserResponse])
-def get_users(db: Session = Depends(get_db)):
-    return user_service.list_users(db)
+async def get_users(db: AsyncSession = Depends(get_async_db)):
+    return await user_service.list_users_async(db)
+
+@router.post("/login", response_model=schemas.TokenResponse)
+async def login(credentials: schemas.LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Verifica usuário (username ou email) e senha e devolve um token de acesso.
+    Use o token nas próximas requisições: `Authorization: Bearer <token>`.
+    """
+    global _dummy_hash
+    
+    user = await user_service.get_user_by_login_async(db, credentials.login)
+    if not user:
+        if _dummy_hash is None:
+            _dummy_hash = await hash_password_async("dummy-password")
+        await verify_password_async(credentials.password, _dummy_hash)
+        raise HTTPException(status_code=401, detail="Usuário ou senha inválidos")
+    
+    user_id, username, hashed_password = user.id, user.username, user.hashed_password
+    if not await verify_password_async(credentials.password, hashed_password):
+        raise HTTPException(status_code=401, detail="Usuário ou senha inválidos")
+    
+    # Custo do bcrypt mudou desde que o hash foi gerado: aproveita a senha em mãos
+    if needs_rehash(hashed_password):
+        new_hash = await hash_password_async(credentials.password)
+        await user_service.update_password_hash_async(db, user_id, new_hash)
+    
+    return schemas.TokenResponse(
+        access_token=create_access_token(user_id, username),
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    )
+
+@router.get("/me", response_model=schemas.CurrentUserResponse)
+def get_me(current_user: dict = Depends(get_current_user)):
+    """Retorna o usuário do token (sem consultar o banco)"""
+    return current_user
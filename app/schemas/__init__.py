@@ -1,2 +1,2 @@
-from .user_schema import UserCreate, UserResponse
+from .user_schema import UserCreate, UserResponse, LoginRequest, TokenResponse, CurrentUserResponse
 from .ai_schemas import *
\ No newline at end of file
@@ -5,9 +5,10 @@ class ChatRequest(BaseModel):
     """Schema para requisição de chat"""
     message: str = Field(..., description="Mensagem para enviar ao Claude")
     system_prompt: Optional[str] = Field(None, description="Instrução de sistema para o Claude")
-    model: Optional[str] = Field("claude-3-5-sonnet-20241022", description="Modelo Claude a usar")
+    model: Optional[str] = Field("claude-3-5-sonnet-20241022", description='Modelo Claude a usar ("auto" escolhe pela complexidade)')
     max_tokens: Optional[int] = Field(1024, ge=1, le=4096, description="Máximo de tokens na resposta")
     temperature: Optional[float] = Field(1.0, ge=0, le=1, description="Temperatura (criatividade)")
+    use_cache: Optional[bool] = Field(None, description="Usa o cache de respostas (padrão: só com temperature 0)")
 
 class ChatResponse(BaseModel):
     """Schema para resposta do chat"""
@@ -17,6 +18,12 @@ class ChatResponse(BaseModel):
     input_tokens: int
     output_tokens: int
     model: str
+    routed: bool = False  # Modelo escolhido pelo model="auto"
+    cached: bool = False
+    coalesced: bool = False  # Resposta compartilhada com um pedido idêntico simultâneo
+    cache_similarity: Optional[float] = None  # Veio do cache de um texto parecido (Jaccard)
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
 
 class ConversationMessage(BaseModel):
     """Schema para uma mensagem na conversa"""
@@ -28,7 +35,7 @@ class ChatWithContextRequest(BaseModel):
     message: str
     conversation_history: List[ConversationMessage] = Field(default=[], description="Histórico da conversa")
     system_prompt: Optional[str] = None
-    model: Optional[str] = "claude-3-5-sonnet-20241022"
+    model: Optional[str] = "claude-3-5-sonnet-20241022"  # ou "auto"
 
 class ChatWithContextResponse(BaseModel):
     """Schema para resposta do chat com contexto"""
@@ -37,6 +44,34 @@ class ChatWithContextResponse(BaseModel):
     tokens_used: int
     input_tokens: int
     output_tokens: int
+    model: Optional[str] = None  # Modelo que respondeu (pode ser o alternativo)
+    routed: bool = False  # Modelo escolhido pelo model="auto"
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+
+class AnalyzeBatchRequest(BaseModel):
+    """Schema para classificação de intenção em lote"""
+    messages: List[str] = Field(..., min_length=1, description="Mensagens a classificar")
+    concurrency: Optional[int] = Field(None, ge=1, description="Chamadas simultâneas ao Claude (limitado pela config)")
+    stream: bool = Field(False, description="Envia os resultados em NDJSON conforme ficam prontos")
+    use_cache: Optional[bool] = Field(None, description="Usa o cache de respostas (padrão: sim)")
+
+class AnalyzeBatchItem(BaseModel):
+    """Schema para o resultado de um item do lote"""
+    index: int
+    message: str
+    intent: str
+    confidence: float
+    cached: bool = False
+    source: Optional[str] = None
+    error: Optional[str] = None
+    retry_after: Optional[int] = None  # Claude sobrecarregado: segundos até tentar de novo
+
+class AnalyzeBatchResponse(BaseModel):
+    """Schema para resposta da classificação em lote"""
+    success: bool
+    results: List[AnalyzeBatchItem]
+    errors: int
 
 class ErrorResponse(BaseModel):
     """Schema para respostas de erro"""
@@ -48,7 +83,18 @@ class ModelInfo(BaseModel):
     id: str
     name: str
     description: str
+    tier: Optional[str] = None  # fast, standard ou premium
 
 class ModelsResponse(BaseModel):
     """Schema para lista de modelos disponíveis"""
-    models: List[ModelInfo]
\ No newline at end of file
+    models: List[ModelInfo]
+
+class CacheStatsResponse(BaseModel):
+    """Schema para os contadores do cache de respostas"""
+    entries: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
\ No newline at end of file
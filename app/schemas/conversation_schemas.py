@@ -11,6 +11,9 @@ class MessageCreate(MessageBase):
     tokens_used: Optional[int] = 0
     input_tokens: Optional[int] = 0
     output_tokens: Optional[int] = 0
+    cache_creation_input_tokens: Optional[int] = 0
+    cache_read_input_tokens: Optional[int] = 0
+    created_at: Optional[datetime] = None
 
 class MessageResponse(MessageBase):
     id: int
@@ -19,6 +22,8 @@ class MessageResponse(MessageBase):
     tokens_used: int
     input_tokens: int
     output_tokens: int
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
     created_at: datetime
 
     class Config:
@@ -34,11 +39,33 @@ class ConversationResponse(BaseModel):
     user_id: Optional[int]
     created_at: datetime
     updated_at: datetime
-    messages: List[MessageResponse] = []
+    summary: Optional[str] = None
+    message_count: int = 0
 
     class Config:
         from_attributes = True
 
+class MessagePage(BaseModel):
+    items: List[MessageResponse]
+    has_more: bool
+
+class MessageSearchResult(BaseModel):
+    message_id: int
+    conversation_id: int
+    conversation_title: Optional[str] = None
+    role: str
+    snippet: str  # Trecho da mensagem com os termos entre <mark></mark>
+    created_at: datetime
+    score: float  # Relevância (maior = mais relevante)
+
+class MessageSearchPage(BaseModel):
+    items: List[MessageSearchResult]
+    has_more: bool
+
+class ImportResult(BaseModel):
+    conversations: int
+    messages: int
+
 class ConversationListResponse(BaseModel):
     id: int
     title: str
@@ -46,5 +73,9 @@ class ConversationListResponse(BaseModel):
     updated_at: datetime
     message_count: int
 
+class ConversationListPage(BaseModel):
+    items: List[ConversationListResponse]
+    next_cursor: Optional[str] = None
+
 class ConversationUpdate(BaseModel):
     title: Optional[str] = None
\ No newline at end of file
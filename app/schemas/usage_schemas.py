@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from datetime import date
+from typing import List, Optional
+
+class UsageItem(BaseModel):
+    # Dimensões: todas preenchidas em /usage/daily, só a agrupada em /usage/summary
+    user_id: Optional[int] = None
+    model: Optional[str] = None
+    day: Optional[date] = None
+    message_count: int = 0
+    tokens_used: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+
+class UsageSummaryResponse(BaseModel):
+    group_by: str
+    items: List[UsageItem]
+    total: UsageItem
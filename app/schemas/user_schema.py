@@ -12,3 +12,16 @@ class UserResponse(BaseModel):
 
     class Config:
         orm_mode = True
+
+class LoginRequest(BaseModel):
+    login: str  # username ou email
+    password: str
+
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+class CurrentUserResponse(BaseModel):
+    user_id: int
+    username: str
@@ -1,16 +1,461 @@
-from anthropic import Anthropic
+import anthropic
+from anthropic import Anthropic, AsyncAnthropic, DefaultAsyncHttpxClient
+import asyncio
+import httpx
+import json
+import logging
 import os
+import threading
+import time
 from typing import Optional
+from app.config import (
+    ANTHROPIC_MAX_CONNECTIONS, ANTHROPIC_TIMEOUT,
+    AI_CALL_TIMEOUT, AI_MAX_RETRIES, AI_RETRY_BASE_DELAY, AI_RETRY_MAX_DELAY, AI_HEDGE_ENABLED,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS, MODEL_FALLBACKS,
+    AI_CACHE_MAX_ENTRIES, AI_CACHE_TTL_SECONDS, SUMMARY_MODEL,
+    AI_SIMILAR_CACHE_ENABLED, AI_SIMILAR_CACHE_MAX_ENTRIES, AI_SIMILAR_CACHE_THRESHOLD,
+    INTENT_LOCAL_THRESHOLD, INTENT_LOCAL_MIN_EXAMPLES, INTENT_LEARN_MIN_CONFIDENCE, INTENT_TRAINING_FILE
+)
+from app.services.intent_classifier import INTENTS, IntentClassifier, build_default_classifier
+from app.services.model_router import AUTO_MODEL, route_model
+from app.utils.admission import AdmissionRejected, upstream_limiter
+from app.utils.cache import LRUCache
+from app.utils.metrics import record_claude_call
+from app.utils.resilience import (
+    CircuitBreaker, LatencyTracker, backoff_delay, is_retryable, retry_after_seconds
+)
+from app.utils.similarity_cache import SimilarityCache
+from app.utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "claude-3-5-sonnet-20241022"
+
+INTENT_SYSTEM_PROMPT = """Você é um analisador de intenções. 
+        Analise a mensagem do usuário e responda APENAS no formato JSON:
+        {"intent": "pergunta|ajuda|reclamacao|elogio|outro", "confidence": 0.0-1.0}"""
+
+SUMMARY_SYSTEM_PROMPT = """Você mantém o resumo de uma conversa entre um usuário e um assistente.
+Reescreva o resumo atual incorporando as novas mensagens. Preserve fatos, decisões,
+nomes, números e pedidos em aberto. Responda apenas com o resumo, em português."""
+
+# Clientes Anthropic (Claude), criados no primeiro uso: importar o módulo não
+# monta pool HTTP. ai_service.client e ai_service.async_client continuam valendo.
+_client = None
+_async_client = None
+_clients_lock = threading.Lock()
+
+
+def get_client() -> Anthropic:
+    """Cliente síncrono compartilhado (sem retries do SDK: quem tenta de novo é _create_message_sync)"""
+    global _client
+    if _client is None:
+        with _clients_lock:
+            if _client is None:
+                _client = Anthropic(
+                    api_key=os.getenv('ANTHROPIC_API_KEY'),
+                    timeout=ANTHROPIC_TIMEOUT,
+                    max_retries=0
+                )
+    return _client
+
+
+def get_async_client() -> AsyncAnthropic:
+    """
+    Cliente assíncrono compartilhado, com um único pool HTTP para todas as rotas
+    (sem retries do SDK: quem tenta de novo é _create_message)
+    """
+    global _async_client
+    if _async_client is None:
+        with _clients_lock:
+            if _async_client is None:
+                _async_client = AsyncAnthropic(
+                    api_key=os.getenv('ANTHROPIC_API_KEY'),
+                    timeout=ANTHROPIC_TIMEOUT,
+                    max_retries=0,
+                    http_client=DefaultAsyncHttpxClient(
+                        limits=httpx.Limits(
+                            max_connections=ANTHROPIC_MAX_CONNECTIONS,
+                            max_keepalive_connections=ANTHROPIC_MAX_CONNECTIONS
+                        )
+                    )
+                )
+    return _async_client
+
+
+async def close_clients() -> None:
+    """Fecha os pools HTTP (desligamento da aplicação); um próximo uso cria clientes novos"""
+    global _client, _async_client
+    with _clients_lock:
+        client, async_client = _client, _async_client
+        _client = _async_client = None
+    if async_client is not None:
+        await async_client.close()
+    if client is not None:
+        client.close()
+
+
+# Classificador local: atende /ai/analyze sem Claude quando está confiante.
+# Criado (e treinado com INTENT_TRAINING_FILE) no primeiro uso.
+_intent_classifier = None
+_intent_lock = threading.Lock()
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """Classificador compartilhado; linhas inválidas do arquivo de treino são puladas"""
+    global _intent_classifier
+    if _intent_classifier is None:
+        with _intent_lock:
+            if _intent_classifier is None:
+                classifier = build_default_classifier()
+                if INTENT_TRAINING_FILE and os.path.exists(INTENT_TRAINING_FILE):
+                    learned = classifier.train_from_file(INTENT_TRAINING_FILE)
+                    logger.info(
+                        "classificador de intenção: %d exemplos de %s (%d linhas inválidas)",
+                        learned, INTENT_TRAINING_FILE, classifier.skipped_lines
+                    )
+                _intent_classifier = classifier
+    return _intent_classifier
+
+
+def get_intent_stats() -> dict:
+    """Exemplos do classificador local e se ele já responde sem o Claude"""
+    classifier = get_intent_classifier()
+    return {
+        **classifier.stats(),
+        "local_enabled": classifier.labelled_examples >= INTENT_LOCAL_MIN_EXAMPLES,
+        "min_labelled_examples": INTENT_LOCAL_MIN_EXAMPLES,
+        "threshold": INTENT_LOCAL_THRESHOLD
+    }
+
+
+def __getattr__(name: str):
+    if name == "client":
+        return get_client()
+    if name == "async_client":
+        return get_async_client()
+    if name == "intent_classifier":
+        return get_intent_classifier()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Cache de respostas por match exato de (model, system_prompt, message, temperature, max_tokens)
+response_cache = LRUCache(AI_CACHE_MAX_ENTRIES, AI_CACHE_TTL_SECONDS)
+
+# Cache por similaridade do texto, consultado depois do exato (só chat sem histórico)
+similar_cache = SimilarityCache(AI_SIMILAR_CACHE_MAX_ENTRIES, AI_CACHE_TTL_SECONDS, AI_SIMILAR_CACHE_THRESHOLD)
+
+# Resiliência: disjuntor por modelo, latências (atraso do hedge) e contadores
+circuit_breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+latency_tracker = LatencyTracker()
+resilience_counters = {"retries": 0, "hedges": 0, "hedge_wins": 0, "fallbacks": 0, "unavailable": 0}
+
+# Chamadas idênticas em andamento (coalesce=True) compartilham o resultado
+single_flight = SingleFlight()
+
+
+def _cache_enabled(use_cache: Optional[bool], temperature: float) -> bool:
+    """Por padrão só usa o cache em configurações determinísticas (temperature 0)"""
+    if use_cache is None:
+        return temperature == 0
+    return use_cache
+
+
+def _cache_key(model: str, system_prompt: str, message: str, temperature: float, max_tokens: int) -> tuple:
+    return (model, system_prompt, message, float(temperature), max_tokens)
+
+
+def get_cache_stats() -> dict:
+    """Retorna os contadores do cache de respostas"""
+    return response_cache.stats()
+
+
+def get_similar_cache_stats() -> dict:
+    """Contadores do cache por similaridade e os últimos acertos (para calibrar o threshold)"""
+    return {"enabled": AI_SIMILAR_CACHE_ENABLED, **similar_cache.stats()}
+
+
+def _get_cached_chat(cache_key: tuple) -> Optional[dict]:
+    """Resposta de chat em cache: primeiro o match exato, depois um texto parecido"""
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return {**cached, "cached": True}
+    
+    if AI_SIMILAR_CACHE_ENABLED:
+        model, system_prompt, message, temperature, max_tokens = cache_key
+        similar = similar_cache.get((model, system_prompt, temperature, max_tokens), message)
+        if similar is not None:
+            value, similarity = similar
+            return {**value, "cached": True, "cache_similarity": round(similarity, 3)}
+    
+    return None
+
+
+def _served_by_fallback(requested_model: str, response) -> bool:
+    """
+    Resposta do modelo alternativo (disjuntor do pedido aberto). Não vai para
+    o cache, que é por modelo pedido: serviria a resposta do alternativo até o
+    TTL expirar, mesmo com o principal de volta.
+    """
+    served_model = getattr(response, "model", None)
+    return served_model is not None and served_model != requested_model
+
+
+def _set_cached_chat(cache_key: tuple, result: dict) -> None:
+    response_cache.set(cache_key, result)
+    if AI_SIMILAR_CACHE_ENABLED:
+        model, system_prompt, message, temperature, max_tokens = cache_key
+        similar_cache.set((model, system_prompt, temperature, max_tokens), message, result)
+
+
+def _coalesce_key(kind: str, model: str, system_prompt: str, message: str, *params) -> tuple:
+    """Chave do single-flight: mensagem normalizada (espaços colapsados) e parâmetros da chamada"""
+    return (kind, model, system_prompt, " ".join(message.split()), *params)
+
+
+def get_coalescing_stats() -> dict:
+    """Chamadas feitas de fato (leaders) e quantas pegaram carona numa igual em andamento (coalesced)"""
+    return single_flight.stats()
+
+
+def resolve_model(
+    model: str,
+    message: str,
+    conversation_history: Optional[list] = None,
+    max_tokens: int = 1024,
+    system_prompt: Optional[str] = None
+):
+    """
+    Troca model="auto" pelo modelo escolhido pelo model_router.
+    
+    Returns:
+        (modelo, True se foi escolhido automaticamente)
+    """
+    if model != AUTO_MODEL:
+        return model, False
+    return route_model(get_available_models(), message, conversation_history, max_tokens, system_prompt), True
+
+
+def get_resilience_stats() -> dict:
+    """Contadores de retries/hedges/fallbacks, estado dos disjuntores e p95 por modelo"""
+    return {
+        **resilience_counters,
+        "circuits": circuit_breaker.stats(),
+        "p95_seconds": {
+            model: latency_tracker.percentile(model)
+            for model in latency_tracker.models()
+        }
+    }
+
+
+def _select_model(model: str) -> str:
+    """
+    O modelo pedido ou, com o disjuntor dele aberto, o alternativo de
+    MODEL_FALLBACKS. Levanta AdmissionRejected (503) se nenhum estiver disponível.
+    """
+    if circuit_breaker.allow(model):
+        return model
+    
+    fallback = MODEL_FALLBACKS.get(model)
+    if fallback and circuit_breaker.allow(fallback):
+        resilience_counters["fallbacks"] += 1
+        return fallback
+    
+    resilience_counters["unavailable"] += 1
+    raise AdmissionRejected(503, "Claude indisponível no momento, tente novamente em instantes", circuit_breaker.retry_after(model))
+
+
+def _unavailable(error: Exception) -> AdmissionRejected:
+    """Erro transitório que persistiu após as novas tentativas: 503 em vez de 500"""
+    resilience_counters["unavailable"] += 1
+    return AdmissionRejected(
+        503,
+        "Claude indisponível no momento, tente novamente em instantes",
+        retry_after_seconds(error) or AI_RETRY_MAX_DELAY
+    )
+
+
+def _timed_create_sync(params: dict):
+    """
+    Uma tentativa no cliente síncrono: timeout e registro da latência.
+    Não passa pelo upstream_limiter, que é do event loop.
+    """
+    started = time.monotonic()
+    try:
+        response = get_client().messages.create(**params, timeout=AI_CALL_TIMEOUT)
+    except Exception as e:
+        outcome = "timeout" if isinstance(e, anthropic.APITimeoutError) else "error"
+        record_claude_call(params["model"], "create", time.monotonic() - started, outcome=outcome)
+        raise
+    elapsed = time.monotonic() - started
+    latency_tracker.record(params["model"], elapsed)
+    record_claude_call(params["model"], "create", elapsed, response.usage)
+    return response
+
+
+def _create_message_sync(**params):
+    """
+    Versão síncrona de _create_message: mesmas novas tentativas, disjuntor
+    e modelo alternativo (sem hedge)
+    """
+    requested_model = params["model"]
+    for attempt in range(AI_MAX_RETRIES + 1):
+        model = _select_model(requested_model)
+        try:
+            response = _timed_create_sync({**params, "model": model})
+        except Exception as e:
+            if not is_retryable(e):
+                circuit_breaker.release(model)
+                raise
+            circuit_breaker.record_failure(model)
+            if attempt == AI_MAX_RETRIES:
+                raise _unavailable(e)
+            resilience_counters["retries"] += 1
+            time.sleep(backoff_delay(attempt, AI_RETRY_BASE_DELAY, AI_RETRY_MAX_DELAY, e))
+            continue
+        
+        circuit_breaker.record_success(model)
+        return response
+
+
+async def _timed_create(params: dict):
+    """Uma tentativa: vaga no limite de chamadas simultâneas, timeout e registro da latência"""
+    async with upstream_limiter.slot():
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(get_async_client().messages.create(**params), AI_CALL_TIMEOUT)
+        except Exception as e:
+            outcome = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            record_claude_call(params["model"], "create", time.monotonic() - started, outcome=outcome)
+            raise
+    elapsed = time.monotonic() - started
+    latency_tracker.record(params["model"], elapsed)
+    record_claude_call(params["model"], "create", elapsed, response.usage)
+    return response
+
+
+async def _hedged_create(params: dict):
+    """
+    Com AI_HEDGE_ENABLED, se a chamada passar do p95 observado do modelo,
+    dispara uma segunda igual e fica com a que responder primeiro
+    """
+    hedge_delay = latency_tracker.percentile(params["model"]) if AI_HEDGE_ENABLED else None
+    if hedge_delay is None:
+        return await _timed_create(params)
+    
+    tasks = [asyncio.ensure_future(_timed_create(params))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if not done:
+            resilience_counters["hedges"] += 1
+            tasks.append(asyncio.ensure_future(_timed_create(params)))
+        
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not tasks[0]:
+                        resilience_counters["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # A chamada perdedora (ou as duas, se o cliente desistiu) é cancelada
+        for task in tasks:
+            task.cancel()
+
+
+async def _create_message(**params):
+    """
+    messages.create com resiliência: timeout por tentativa, novas tentativas
+    com backoff e jitter para sobrecarga/5xx/timeout, hedge opcional e troca
+    para o modelo alternativo enquanto o disjuntor do modelo pedido estiver aberto.
+    O modelo efetivamente usado vem em response.model.
+    """
+    requested_model = params["model"]
+    for attempt in range(AI_MAX_RETRIES + 1):
+        model = _select_model(requested_model)
+        try:
+            response = await _hedged_create({**params, "model": model})
+        except Exception as e:
+            if not is_retryable(e):
+                circuit_breaker.release(model)
+                raise
+            circuit_breaker.record_failure(model)
+            if attempt == AI_MAX_RETRIES:
+                raise _unavailable(e)
+            resilience_counters["retries"] += 1
+            await asyncio.sleep(backoff_delay(attempt, AI_RETRY_BASE_DELAY, AI_RETRY_MAX_DELAY, e))
+            continue
+        
+        circuit_breaker.record_success(model)
+        return response
+
+
+def _build_messages(message: str, conversation_history: list) -> list:
+    """Monta a lista de mensagens no formato da API a partir do histórico"""
+    messages = [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in conversation_history
+    ]
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def _build_cached_context(
+    message: str,
+    conversation_history: list,
+    system_prompt: str,
+    summary: Optional[str] = None
+) -> dict:
+    """
+    Monta system e messages com breakpoints de prompt caching (cache_control):
+    um no system prompt e outro no fim do histórico, que é o prefixo estável
+    da conversa. Assim só o turno novo é processado sem cache.
+    O resumo das mensagens antigas (se houver) vai no system.
+    """
+    system = [{"type": "text", "text": system_prompt}]
+    if summary:
+        system.append({
+            "type": "text",
+            "text": f"Resumo da conversa até aqui:\n{summary}"
+        })
+    system[-1]["cache_control"] = {"type": "ephemeral"}
+    
+    messages = _build_messages(message, conversation_history)
+    if len(messages) > 1:
+        last_history_message = messages[-2]
+        last_history_message["content"] = [{
+            "type": "text",
+            "text": last_history_message["content"],
+            "cache_control": {"type": "ephemeral"}
+        }]
+    
+    return {"system": system, "messages": messages}
+
+
+def _format_response(response, model: Optional[str] = None) -> dict:
+    """Extrai texto, modelo usado e uso de tokens de uma resposta da API"""
+    return {
+        "response": response.content[0].text,
+        "model": getattr(response, "model", None) or model,
+        "tokens_used": response.usage.input_tokens + response.usage.output_tokens,
+        "input_tokens": response.usage.input_tokens,
+        "output_tokens": response.usage.output_tokens,
+        "cache_creation_input_tokens": getattr(response.usage, "cache_creation_input_tokens", None) or 0,
+        "cache_read_input_tokens": getattr(response.usage, "cache_read_input_tokens", None) or 0
+    }
 
-# Inicializa cliente Anthropic (Claude)
-client = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
 
 def chat_with_ai(
     message: str, 
     system_prompt: Optional[str] = None,
-    model: str = "claude-3-5-sonnet-20241022",
+    model: str = DEFAULT_MODEL,
     max_tokens: int = 1024,
-    temperature: float = 1.0
+    temperature: float = 1.0,
+    use_cache: Optional[bool] = None,
+    coalesce: bool = False
 ) -> dict:
     """
     Envia uma mensagem para o Claude e retorna a resposta
@@ -18,38 +463,104 @@ def chat_with_ai(
     Args:
         message: Mensagem do usuário
         system_prompt: Prompt de sistema (opcional)
-        model: Modelo a ser usado
+        model: Modelo a ser usado ("auto" escolhe pela complexidade do pedido)
         max_tokens: Número máximo de tokens na resposta
         temperature: Criatividade da resposta (0-1)
+        use_cache: Usa o cache de respostas (None = só quando temperature é 0);
+            além do match exato, aceita a resposta de um texto parecido
+        coalesce: Compartilha a chamada com pedidos idênticos em andamento
     
     Returns:
-        dict com 'response', 'tokens_used' e 'model'
+        dict com 'response', 'tokens_used', 'model' (o que respondeu), 'routed',
+        'coalesced' (resposta veio da chamada de outro pedido) e, quando a
+        resposta veio de um texto parecido, 'cache_similarity'
     """
     try:
         if system_prompt is None:
             system_prompt = "Você é um assistente útil e amigável que responde em português."
+        model, routed = resolve_model(model, message, None, max_tokens, system_prompt)
         
-        response = client.messages.create(
-            model=model,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": message}
-            ]
-        )
+        cache_key = _cache_key(model, system_prompt, message, temperature, max_tokens)
+        cache_enabled = _cache_enabled(use_cache, temperature)
+        if cache_enabled:
+            cached = _get_cached_chat(cache_key)
+            if cached is not None:
+                return {**cached, "routed": routed, "coalesced": False}
         
-        ai_response = response.content[0].text
-        tokens_used = response.usage.input_tokens + response.usage.output_tokens
+        def call():
+            return _create_message_sync(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system=system_prompt,
+                messages=_build_messages(message, [])
+            )
         
-        return {
-            "response": ai_response,
-            "tokens_used": tokens_used,
-            "input_tokens": response.usage.input_tokens,
-            "output_tokens": response.usage.output_tokens,
-            "model": model
-        }
+        if coalesce:
+            key = _coalesce_key("chat", model, system_prompt, message, float(temperature), max_tokens)
+            response, shared = single_flight.do(key, call)
+        else:
+            response, shared = call(), False
+        
+        result = {**_format_response(response, model), "cached": False}
+        if cache_enabled and not _served_by_fallback(model, response):
+            _set_cached_chat(cache_key, result)
+        
+        return {**result, "routed": routed, "coalesced": shared}
+    
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        raise Exception(f"Erro ao chamar Claude: {str(e)}")
+
+
+async def chat_with_ai_async(
+    message: str,
+    system_prompt: Optional[str] = None,
+    model: str = DEFAULT_MODEL,
+    max_tokens: int = 1024,
+    temperature: float = 1.0,
+    use_cache: Optional[bool] = None,
+    coalesce: bool = False
+) -> dict:
+    """
+    Versão assíncrona de chat_with_ai, usando o cliente AsyncAnthropic compartilhado
+    """
+    try:
+        if system_prompt is None:
+            system_prompt = "Você é um assistente útil e amigável que responde em português."
+        model, routed = resolve_model(model, message, None, max_tokens, system_prompt)
+        
+        cache_key = _cache_key(model, system_prompt, message, temperature, max_tokens)
+        cache_enabled = _cache_enabled(use_cache, temperature)
+        if cache_enabled:
+            cached = _get_cached_chat(cache_key)
+            if cached is not None:
+                return {**cached, "routed": routed, "coalesced": False}
+        
+        def call():
+            return _create_message(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system=system_prompt,
+                messages=_build_messages(message, [])
+            )
+        
+        if coalesce:
+            key = _coalesce_key("chat", model, system_prompt, message, float(temperature), max_tokens)
+            response, shared = await single_flight.do_async(key, call)
+        else:
+            response, shared = await call(), False
+        
+        result = {**_format_response(response, model), "cached": False}
+        if cache_enabled and not _served_by_fallback(model, response):
+            _set_cached_chat(cache_key, result)
+        
+        return {**result, "routed": routed, "coalesced": shared}
     
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise Exception(f"Erro ao chamar Claude: {str(e)}")
 
@@ -58,7 +569,8 @@ def chat_with_context(
     message: str,
     conversation_history: list,
     system_prompt: Optional[str] = None,
-    model: str = "claude-3-5-sonnet-20241022"
+    model: str = DEFAULT_MODEL,
+    summary: Optional[str] = None
 ) -> dict:
     """
     Chat com contexto de conversa anterior
@@ -68,6 +580,7 @@ def chat_with_context(
         conversation_history: Lista de mensagens anteriores
         system_prompt: Prompt de sistema
         model: Modelo Claude a usar
+        summary: Resumo das mensagens antigas que ficaram fora do histórico
     
     Returns:
         dict com resposta e tokens
@@ -75,95 +588,437 @@ def chat_with_context(
     try:
         if system_prompt is None:
             system_prompt = "Você é um assistente útil que responde em português."
+        model, routed = resolve_model(model, message, conversation_history, 1024, system_prompt)
         
-        messages = []
-        for msg in conversation_history:
-            messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
+        response = _create_message_sync(
+            model=model,
+            max_tokens=1024,
+            temperature=1.0,
+            **_build_cached_context(message, conversation_history, system_prompt, summary)
+        )
         
-        messages.append({"role": "user", "content": message})
+        return {**_format_response(response, model), "routed": routed}
+    
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        raise Exception(f"Erro ao chamar Claude: {str(e)}")
+
+
+async def chat_with_context_async(
+    message: str,
+    conversation_history: list,
+    system_prompt: Optional[str] = None,
+    model: str = DEFAULT_MODEL,
+    summary: Optional[str] = None
+) -> dict:
+    """
+    Versão assíncrona de chat_with_context
+    """
+    try:
+        if system_prompt is None:
+            system_prompt = "Você é um assistente útil que responde em português."
+        model, routed = resolve_model(model, message, conversation_history, 1024, system_prompt)
         
-        response = client.messages.create(
+        response = await _create_message(
             model=model,
             max_tokens=1024,
             temperature=1.0,
-            system=system_prompt,
-            messages=messages
+            **_build_cached_context(message, conversation_history, system_prompt, summary)
         )
         
-        ai_response = response.content[0].text
-        tokens_used = response.usage.input_tokens + response.usage.output_tokens
-        
-        return {
-            "response": ai_response,
-            "tokens_used": tokens_used,
-            "input_tokens": response.usage.input_tokens,
-            "output_tokens": response.usage.output_tokens
-        }
+        return {**_format_response(response, model), "routed": routed}
     
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise Exception(f"Erro ao chamar Claude: {str(e)}")
 
 
-def analyze_user_query(query: str) -> dict:
+async def _stream_messages(**params):
+    """
+    Consome messages.stream e emite eventos simples:
+    'start' (tokens de entrada), 'delta' (texto), 'usage' (tokens de saída até
+    ali, do message_delta; uso interno, não vai para o cliente) e 'done'
+    (resposta completa)
+    
+    Tem a mesma troca de modelo e as mesmas novas tentativas de _create_message,
+    mas só enquanto nenhum evento foi emitido (depois disso o erro é repassado).
+    """
+    requested_model = params["model"]
+    for attempt in range(AI_MAX_RETRIES + 1):
+        model = _select_model(requested_model)
+        started = False
+        call_started = None
+        first_token_seconds = None
+        try:
+            # A vaga no limite de chamadas simultâneas fica ocupada até o fim do stream
+            async with upstream_limiter.slot():
+                call_started = time.monotonic()
+                async with get_async_client().messages.stream(**{**params, "model": model}, timeout=AI_CALL_TIMEOUT) as stream:
+                    async for event in stream:
+                        if event.type == "message_start":
+                            usage = event.message.usage
+                            started = True
+                            yield {
+                                "type": "start",
+                                "input_tokens": usage.input_tokens,
+                                "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+                                "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0
+                            }
+                        elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                            started = True
+                            if first_token_seconds is None:
+                                first_token_seconds = time.monotonic() - call_started
+                            yield {"type": "delta", "text": event.delta.text}
+                        elif event.type == "message_delta" and getattr(event, "usage", None) is not None:
+                            yield {"type": "usage", "output_tokens": event.usage.output_tokens}
+                    
+                    final_message = await stream.get_final_message()
+        except Exception as e:
+            if call_started is not None:
+                record_claude_call(model, "stream", time.monotonic() - call_started, outcome="error")
+            if not is_retryable(e):
+                circuit_breaker.release(model)
+                raise
+            circuit_breaker.record_failure(model)
+            if started:
+                raise
+            if attempt == AI_MAX_RETRIES:
+                raise _unavailable(e)
+            resilience_counters["retries"] += 1
+            await asyncio.sleep(backoff_delay(attempt, AI_RETRY_BASE_DELAY, AI_RETRY_MAX_DELAY, e))
+            continue
+        
+        record_claude_call(
+            model, "stream", time.monotonic() - call_started, final_message.usage,
+            first_token_seconds=first_token_seconds
+        )
+        circuit_breaker.record_success(model)
+        yield {"type": "done", **_format_response(final_message, model)}
+        return
+
+
+async def stream_chat_with_ai(
+    message: str,
+    system_prompt: Optional[str] = None,
+    model: str = DEFAULT_MODEL,
+    max_tokens: int = 1024,
+    temperature: float = 1.0
+):
+    """
+    Versão em streaming de chat_with_ai
+    
+    Yields:
+        dicts com 'type' igual a 'start', 'delta' ou 'done'.
+        O evento 'done' traz os mesmos campos de chat_with_ai.
+    """
+    if system_prompt is None:
+        system_prompt = "Você é um assistente útil e amigável que responde em português."
+    model, routed = resolve_model(model, message, None, max_tokens, system_prompt)
+    
+    async for event in _stream_messages(
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        system=system_prompt,
+        messages=_build_messages(message, [])
+    ):
+        if event["type"] == "done":
+            event["routed"] = routed
+        yield event
+
+
+async def stream_chat_with_context(
+    message: str,
+    conversation_history: list,
+    system_prompt: Optional[str] = None,
+    model: str = DEFAULT_MODEL,
+    summary: Optional[str] = None
+):
+    """
+    Versão em streaming de chat_with_context (mesmos eventos de stream_chat_with_ai)
+    """
+    if system_prompt is None:
+        system_prompt = "Você é um assistente útil que responde em português."
+    model, routed = resolve_model(model, message, conversation_history, 1024, system_prompt)
+    
+    async for event in _stream_messages(
+        model=model,
+        max_tokens=1024,
+        temperature=1.0,
+        **_build_cached_context(message, conversation_history, system_prompt, summary)
+    ):
+        if event["type"] == "done":
+            event["routed"] = routed
+        yield event
+
+
+async def summarize_conversation_async(previous_summary: Optional[str], messages: list) -> str:
+    """
+    Atualiza o resumo de uma conversa com as mensagens que saíram da janela
+    de contexto (incremental: só as mensagens novas são enviadas)
+    """
+    transcript = "\n".join(
+        f"{'Usuário' if msg['role'] == 'user' else 'Assistente'}: {msg['content']}"
+        for msg in messages
+    )
+    
+    response = await _create_message(
+        model=SUMMARY_MODEL,
+        max_tokens=1024,
+        temperature=0,
+        system=SUMMARY_SYSTEM_PROMPT,
+        messages=[{
+            "role": "user",
+            "content": f"Resumo atual:\n{previous_summary or '(vazio)'}\n\nNovas mensagens:\n{transcript}"
+        }]
+    )
+    
+    return response.content[0].text
+
+
+def _learn_intent(query: str, result) -> None:
+    """Usa rótulos confiantes do Claude para treinar o classificador local"""
+    if not isinstance(result, dict) or result.get("intent") not in INTENTS:
+        return
+    try:
+        confidence = float(result.get("confidence", 0))
+    except (TypeError, ValueError):
+        return
+    if confidence >= INTENT_LEARN_MIN_CONFIDENCE:
+        get_intent_classifier().learn(query, result["intent"])
+
+
+def _classify_locally(query: str) -> Optional[dict]:
+    """
+    Resposta do classificador local, se confiante. Só com INTENT_LOCAL_MIN_EXAMPLES
+    rótulos do Claude: treinado só com os exemplos iniciais a confiança não é calibrada.
+    """
+    classifier = get_intent_classifier()
+    if classifier.labelled_examples < INTENT_LOCAL_MIN_EXAMPLES:
+        return None
+    local = classifier.classify(query)
+    if local["confidence"] < INTENT_LOCAL_THRESHOLD:
+        return None
+    return {**local, "source": "local"}
+
+
+def analyze_user_query(query: str, use_cache: bool = True, use_local: bool = True, coalesce: bool = False) -> dict:
     """
     Analisa uma query do usuário e classifica a intenção
+    
+    Tenta primeiro o classificador local (depois de INTENT_LOCAL_MIN_EXAMPLES
+    rótulos do Claude); o Claude é chamado quando a confiança local fica
+    abaixo de INTENT_LOCAL_THRESHOLD.
+    O campo 'source' indica quem respondeu: 'local', 'cache' ou 'claude'.
+    Com coalesce=True, análises iguais em andamento compartilham a chamada ao Claude.
     """
     try:
-        system_prompt = """Você é um analisador de intenções. 
-        Analise a mensagem do usuário e responda APENAS no formato JSON:
-        {"intent": "pergunta|ajuda|reclamacao|elogio|outro", "confidence": 0.0-1.0}"""
+        if use_local:
+            local = _classify_locally(query)
+            if local is not None:
+                return local
         
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=200,
-            temperature=0.3,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": query}
-            ]
-        )
+        cache_key = _cache_key(DEFAULT_MODEL, INTENT_SYSTEM_PROMPT, query, 0.3, 200)
+        if use_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return {**cached, "cached": True, "source": "cache"}
+        
+        def call():
+            return _create_message_sync(
+                model=DEFAULT_MODEL,
+                max_tokens=200,
+                temperature=0.3,
+                system=INTENT_SYSTEM_PROMPT,
+                messages=[
+                    {"role": "user", "content": query}
+                ]
+            )
+        
+        if coalesce:
+            key = _coalesce_key("analyze", DEFAULT_MODEL, INTENT_SYSTEM_PROMPT, query, 0.3, 200)
+            response, shared = single_flight.do(key, call)
+        else:
+            response, shared = call(), False
         
-        import json
         result = json.loads(response.content[0].text)
+        if not shared:
+            # Quem pegou carona não repete o aprendizado nem a escrita no cache
+            if use_cache and not _served_by_fallback(DEFAULT_MODEL, response):
+                response_cache.set(cache_key, result)
+            _learn_intent(query, result)
         
-        return result
+        return {**result, "source": "claude", "coalesced": shared}
     
+    except AdmissionRejected:
+        raise
     except Exception as e:
-        return {"intent": "unknown", "confidence": 0.0, "error": str(e)}
+        return {"intent": "unknown", "confidence": 0.0, "error": str(e), "source": "claude"}
+
+
+async def analyze_user_query_async(
+    query: str,
+    use_cache: bool = True,
+    use_local: bool = True,
+    coalesce: bool = False
+) -> dict:
+    """
+    Versão assíncrona de analyze_user_query
+    """
+    try:
+        if use_local:
+            local = _classify_locally(query)
+            if local is not None:
+                return local
+        
+        cache_key = _cache_key(DEFAULT_MODEL, INTENT_SYSTEM_PROMPT, query, 0.3, 200)
+        if use_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return {**cached, "cached": True, "source": "cache"}
+        
+        def call():
+            return _create_message(
+                model=DEFAULT_MODEL,
+                max_tokens=200,
+                temperature=0.3,
+                system=INTENT_SYSTEM_PROMPT,
+                messages=[
+                    {"role": "user", "content": query}
+                ]
+            )
+        
+        if coalesce:
+            key = _coalesce_key("analyze", DEFAULT_MODEL, INTENT_SYSTEM_PROMPT, query, 0.3, 200)
+            response, shared = await single_flight.do_async(key, call)
+        else:
+            response, shared = await call(), False
+        
+        result = json.loads(response.content[0].text)
+        if not shared:
+            # Quem pegou carona não repete o aprendizado nem a escrita no cache
+            if use_cache and not _served_by_fallback(DEFAULT_MODEL, response):
+                response_cache.set(cache_key, result)
+            _learn_intent(query, result)
+        
+        return {**result, "source": "claude", "coalesced": shared}
+    
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        return {"intent": "unknown", "confidence": 0.0, "error": str(e), "source": "claude"}
+
+
+async def _analyze_batch_item(
+    index: int,
+    query: str,
+    semaphore: asyncio.Semaphore,
+    use_cache: bool,
+    coalesce: bool = False
+) -> dict:
+    """
+    Classifica um item do lote; erros ficam no próprio item (sobrecarga do
+    Claude vem com 'retry_after', em segundos)
+    """
+    item = {
+        "index": index, "message": query, "intent": "unknown", "confidence": 0.0,
+        "cached": False, "source": None, "error": None, "retry_after": None
+    }
+    if not query.strip():
+        item["error"] = "Mensagem não pode estar vazia"
+        return item
+    
+    try:
+        async with semaphore:
+            result = await analyze_user_query_async(query, use_cache=use_cache, coalesce=coalesce)
+    except AdmissionRejected as e:
+        item.update(error=e.detail, retry_after=e.retry_after)
+        return item
+    
+    try:
+        item.update(
+            intent=str(result.get("intent", "unknown")),
+            confidence=float(result.get("confidence", 0.0)),
+            cached=result.get("cached", False),
+            source=result.get("source"),
+            error=result.get("error")
+        )
+    except Exception as e:
+        item["error"] = f"Resposta inválida do Claude: {str(e)}"
+    
+    return item
+
+
+async def analyze_batch_stream(queries: list, concurrency: int, use_cache: bool = True, coalesce: bool = False):
+    """
+    Classifica vários textos em paralelo (no máximo `concurrency` chamadas
+    simultâneas ao Claude), emitindo cada resultado assim que fica pronto
+    
+    Yields:
+        dicts com 'index' (posição na entrada), 'message', 'intent',
+        'confidence', 'cached', 'error' e 'retry_after'
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [
+        asyncio.ensure_future(_analyze_batch_item(index, query, semaphore, use_cache, coalesce))
+        for index, query in enumerate(queries)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Cliente desconectou (ou erro): não deixa chamadas órfãs rodando
+        for task in tasks:
+            task.cancel()
+
+
+async def analyze_batch(queries: list, concurrency: int, use_cache: bool = True, coalesce: bool = False) -> list:
+    """Igual a analyze_batch_stream, mas retorna todos os resultados na ordem da entrada"""
+    results = [None] * len(queries)
+    async for item in analyze_batch_stream(queries, concurrency, use_cache, coalesce):
+        results[item["index"]] = item
+    return results
 
 
 def get_available_models() -> list:
     """
     Retorna lista de modelos Claude disponíveis
     ATUALIZADO com os modelos corretos em Novembro 2025
+    
+    'tier' é usado pelo model="auto": 'fast' para pedidos simples, 'standard'
+    para os complexos (o primeiro de cada categoria na lista é o escolhido)
     """
     return [
         {
             "id": "claude-3-5-sonnet-20241022",
             "name": "Claude 3.5 Sonnet (Oct 2024)",
-            "description": "Modelo mais recente e inteligente"
+            "description": "Modelo mais recente e inteligente",
+            "tier": "standard"
         },
         {
             "id": "claude-3-5-haiku-20241022", 
             "name": "Claude 3.5 Haiku (Oct 2024)",
-            "description": "Mais rápido e econômico"
+            "description": "Mais rápido e econômico",
+            "tier": "fast"
         },
         {
             "id": "claude-3-opus-20240229",
             "name": "Claude 3 Opus",
-            "description": "Modelo anterior de alta performance"
+            "description": "Modelo anterior de alta performance",
+            "tier": "premium"
         },
         {
             "id": "claude-3-sonnet-20240229",
             "name": "Claude 3 Sonnet",
-            "description": "Versão anterior do Sonnet"
+            "description": "Versão anterior do Sonnet",
+            "tier": "standard"
         },
         {
             "id": "claude-3-haiku-20240307",
             "name": "Claude 3 Haiku",
-            "description": "Versão anterior do Haiku"
+            "description": "Versão anterior do Haiku",
+            "tier": "fast"
         }
     ]
\ No newline at end of file
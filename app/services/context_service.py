@@ -0,0 +1,75 @@
+from app.config import CONTEXT_TOKEN_BUDGET, CONTEXT_TOKEN_BUDGETS, CONTEXT_RECENT_MESSAGES
+from app.services import ai_service
+from typing import Optional
+
+# Proporção da janela que sobra após um resumo (evita resumir a cada turno)
+SUMMARY_TARGET_RATIO = 0.5
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estimativa local e conservadora de tokens (~3 caracteres por token)"""
+    if not text:
+        return 0
+    return len(text) // 3 + 1
+
+
+def get_token_budget(model: str) -> int:
+    """Orçamento de tokens de contexto para o modelo (config por modelo ou padrão)"""
+    return CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET)
+
+
+def split_history(history: list, summary: Optional[str], message: str, model: str):
+    """
+    Divide o histórico em (mensagens a resumir, mensagens mantidas na íntegra).
+    
+    Nada é resumido enquanto o contexto cabe no orçamento. Quando estoura,
+    as mensagens mais antigas são resumidas até o contexto cair para
+    SUMMARY_TARGET_RATIO do orçamento, mantendo as CONTEXT_RECENT_MESSAGES
+    mais recentes (que só saem se sozinhas ainda estourarem o orçamento).
+    """
+    budget = get_token_budget(model)
+    fixed_tokens = estimate_tokens(message) + estimate_tokens(summary)
+    sizes = [estimate_tokens(msg["content"]) for msg in history]
+    total = fixed_tokens + sum(sizes)
+    
+    if total <= budget:
+        return [], history
+    
+    target = budget * SUMMARY_TARGET_RATIO
+    protected_from = max(len(history) - CONTEXT_RECENT_MESSAGES, 0)
+    cut = 0
+    while cut < len(history) and total > target:
+        if cut >= protected_from and total <= budget:
+            break
+        total -= sizes[cut]
+        cut += 1
+    
+    # O histórico enviado ao Claude precisa começar com uma mensagem do usuário
+    while cut < len(history) and history[cut]["role"] != "user":
+        cut += 1
+    
+    return history[:cut], history[cut:]
+
+
+async def prepare_context(
+    summary: Optional[str],
+    history: list,
+    message: str,
+    model: str
+):
+    """
+    Aplica a janela de contexto ao histórico de uma conversa.
+    Se necessário, atualiza (de forma incremental) o resumo; quem chama
+    grava o novo resumo junto com o turno (conversation_service.save_turn).
+    
+    Returns:
+        (histórico mantido na íntegra, resumo a enviar no system,
+         id da última mensagem resumida ou None se o resumo não mudou)
+    """
+    to_summarize, kept = split_history(history, summary, message, model)
+    
+    if not to_summarize:
+        return kept, summary, None
+    
+    summary = await ai_service.summarize_conversation_async(summary, to_summarize)
+    return kept, summary, to_summarize[-1]["id"]
@@ -1,8 +1,268 @@
+import re
+from sqlalchemy import DateTime, Float, and_, delete, func, or_, select, text, update
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.models import conversation_model
 from app.schemas import conversation_schemas
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.text import normalize_text, tokenize
+from app.services.history_cache import HistoryCache
+from app.services import usage_service
+from app.config import HISTORY_CACHE_MAX_CONVERSATIONS, HISTORY_CACHE_MAX_BYTES
+from datetime import datetime
 from typing import List, Optional
 
+# Históricos recentes em memória, validados pela versão (updated_at, message_count) da conversa
+history_cache = HistoryCache(HISTORY_CACHE_MAX_CONVERSATIONS, HISTORY_CACHE_MAX_BYTES)
+
+def _version_timestamp() -> datetime:
+    """
+    updated_at sem microssegundos: o valor gravado volta idêntico do banco
+    (DATETIME do MySQL não guarda frações), o que permite usá-lo como versão
+    """
+    return datetime.utcnow().replace(microsecond=0)
+
+def _history_item(message) -> dict:
+    return {"id": message.id, "role": message.role, "content": message.content}
+
+# Consultas compartilhadas entre as versões síncrona (Session) e assíncrona (AsyncSession)
+
+def _conversation_statement(conversation_id: int):
+    return select(conversation_model.Conversation).where(
+        conversation_model.Conversation.id == conversation_id
+    )
+
+def _list_conversations_statement(user_id: Optional[int], limit: int, cursor: Optional[str]):
+    Conversation = conversation_model.Conversation
+    statement = select(
+        Conversation.id,
+        Conversation.title,
+        Conversation.created_at,
+        Conversation.updated_at,
+        Conversation.message_count
+    )
+    
+    if user_id:
+        statement = statement.where(Conversation.user_id == user_id)
+    
+    if cursor:
+        updated_at, conversation_id = decode_cursor(cursor)
+        statement = statement.where(or_(
+            Conversation.updated_at < updated_at,
+            and_(Conversation.updated_at == updated_at, Conversation.id < conversation_id)
+        ))
+    
+    return statement.order_by(
+        Conversation.updated_at.desc(),
+        Conversation.id.desc()
+    ).limit(limit + 1)
+
+def _conversations_page(rows: list, limit: int):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].id)
+    
+    result = [
+        {
+            "id": row.id,
+            "title": row.title,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+            "message_count": row.message_count or 0
+        }
+        for row in rows
+    ]
+    
+    return result, next_cursor
+
+def _list_messages_statement(
+    conversation_id: int,
+    limit: int,
+    before_id: Optional[int],
+    after_id: Optional[int]
+):
+    Message = conversation_model.Message
+    statement = select(Message).where(Message.conversation_id == conversation_id)
+    
+    anchor_id = before_id if before_id is not None else after_id
+    if anchor_id is not None:
+        anchor_created_at = select(Message.created_at).where(
+            Message.id == anchor_id
+        ).scalar_subquery()
+        if before_id is not None:
+            statement = statement.where(or_(
+                Message.created_at < anchor_created_at,
+                and_(Message.created_at == anchor_created_at, Message.id < anchor_id)
+            ))
+        else:
+            statement = statement.where(or_(
+                Message.created_at > anchor_created_at,
+                and_(Message.created_at == anchor_created_at, Message.id > anchor_id)
+            ))
+    
+    if after_id is not None:
+        statement = statement.order_by(Message.created_at.asc(), Message.id.asc())
+    else:
+        statement = statement.order_by(Message.created_at.desc(), Message.id.desc())
+    
+    return statement.limit(limit + 1)
+
+def _messages_page(messages: list, limit: int, after_id: Optional[int]):
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    
+    if after_id is None:
+        messages.reverse()
+    
+    return messages, has_more
+
+def _history_statement(conversation_id: int, after_id: int):
+    return select(conversation_model.Message).where(
+        conversation_model.Message.conversation_id == conversation_id,
+        conversation_model.Message.id > after_id
+    ).order_by(
+        conversation_model.Message.created_at,
+        conversation_model.Message.id
+    )
+
+def _new_message(conversation_id: int, message_data: conversation_schemas.MessageCreate, now: datetime):
+    return conversation_model.Message(
+        conversation_id=conversation_id,
+        role=message_data.role,
+        content=message_data.content,
+        model=message_data.model,
+        tokens_used=message_data.tokens_used,
+        input_tokens=message_data.input_tokens,
+        output_tokens=message_data.output_tokens,
+        cache_creation_input_tokens=message_data.cache_creation_input_tokens,
+        cache_read_input_tokens=message_data.cache_read_input_tokens,
+        created_at=message_data.created_at or now
+    )
+
+def _touch_conversation_statement(
+    conversation_id: int,
+    added_messages: int,
+    updated_at: datetime,
+    summary: Optional[str] = None,
+    summarized_until_id: Optional[int] = None
+):
+    """UPDATE único da conversa após gravar mensagens (timestamp, contador e resumo)"""
+    Conversation = conversation_model.Conversation
+    values = {
+        "updated_at": updated_at,
+        "message_count": Conversation.message_count + added_messages
+    }
+    if summarized_until_id is not None:
+        values["summary"] = summary
+        values["summarized_until_id"] = summarized_until_id
+    
+    return update(Conversation).where(Conversation.id == conversation_id).values(**values)
+
+# Busca textual: MySQL usa o índice FULLTEXT (MATCH ... AGAINST), SQLite a tabela FTS5 messages_fts
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+SNIPPET_WORDS = 16  # Tamanho do trecho retornado, em palavras
+_WORD_RE = re.compile(r"\w+")
+
+_SQLITE_SEARCH_SQL = """
+SELECT m.id AS message_id, m.conversation_id, c.title AS conversation_title, m.role, m.created_at,
+       snippet(messages_fts, 0, :snippet_start, :snippet_end, '…', :snippet_words) AS snippet,
+       -bm25(messages_fts) AS score
+FROM messages_fts
+JOIN messages m ON m.id = messages_fts.rowid
+JOIN conversations c ON c.id = m.conversation_id
+WHERE messages_fts MATCH :query {user_filter}
+ORDER BY bm25(messages_fts), m.id DESC
+LIMIT :limit OFFSET :offset
+"""
+
+def _search_terms(query: str) -> list:
+    """Palavras da busca, normalizadas e sem repetição. Levanta ValueError se não sobrar nenhuma."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        raise ValueError("Busca vazia")
+    return terms
+
+def _make_snippet(content: str, terms: list) -> str:
+    """Trecho da mensagem em volta do primeiro termo encontrado, com os termos marcados"""
+    words = list(_WORD_RE.finditer(content or ""))
+    if not words:
+        return content or ""
+    
+    term_set = set(terms)
+    hits = [i for i, word in enumerate(words) if normalize_text(word.group()) in term_set]
+    first = hits[0] if hits else 0
+    start = max(0, first - SNIPPET_WORDS // 4)
+    end = min(len(words), start + SNIPPET_WORDS)
+    
+    parts = ["…" if start > 0 else ""]
+    position = words[start].start()
+    for i in range(start, end):
+        word = words[i]
+        parts.append(content[position:word.start()])
+        if i in hits:
+            parts.append(f"{SNIPPET_START}{word.group()}{SNIPPET_END}")
+        else:
+            parts.append(word.group())
+        position = word.end()
+    if end < len(words):
+        parts.append("…")
+    
+    return "".join(parts)
+
+def _search_statement(dialect: str, terms: list, user_id: Optional[int], limit: int, offset: int):
+    if dialect == "sqlite":
+        user_filter = "AND c.user_id = :user_id" if user_id is not None else ""
+        params = {
+            # Termos entre aspas: a busca do usuário não é interpretada como sintaxe do FTS5
+            "query": " OR ".join(f'"{term}"' for term in terms),
+            "snippet_start": SNIPPET_START,
+            "snippet_end": SNIPPET_END,
+            "snippet_words": SNIPPET_WORDS,
+            "limit": limit + 1,
+            "offset": offset
+        }
+        if user_id is not None:
+            params["user_id"] = user_id
+        return text(_SQLITE_SEARCH_SQL.format(user_filter=user_filter)).columns(
+            created_at=DateTime, score=Float
+        ).bindparams(**params)
+    
+    Message = conversation_model.Message
+    Conversation = conversation_model.Conversation
+    score = match(Message.content, against=" ".join(terms)).in_natural_language_mode()
+    statement = select(
+        Message.id.label("message_id"),
+        Message.conversation_id,
+        Conversation.title.label("conversation_title"),
+        Message.role,
+        Message.created_at,
+        Message.content,
+        score.label("score")
+    ).join(Conversation, Conversation.id == Message.conversation_id).where(score > 0)
+    
+    if user_id is not None:
+        statement = statement.where(Conversation.user_id == user_id)
+    
+    return statement.order_by(score.desc(), Message.id.desc()).offset(offset).limit(limit + 1)
+
+def _search_page(rows: list, terms: list, limit: int):
+    has_more = len(rows) > limit
+    result = []
+    for row in rows[:limit]:
+        item = row._asdict()
+        if "content" in item:
+            item["snippet"] = _make_snippet(item.pop("content"), terms)
+        item["score"] = float(item["score"] or 0)
+        result.append(item)
+    return result, has_more
+
+def _turn_version(conversation):
+    return (conversation.updated_at, conversation.message_count or 0)
+
+
 def create_conversation(db: Session, conversation_data: conversation_schemas.ConversationCreate):
     """Cria uma nova conversa"""
     conversation = conversation_model.Conversation(
@@ -16,33 +276,23 @@ def create_conversation(db: Session, conversation_data: conversation_schemas.Con
 
 def get_conversation(db: Session, conversation_id: int):
     """Busca uma conversa por ID"""
-    return db.query(conversation_model.Conversation).filter(
-        conversation_model.Conversation.id == conversation_id
-    ).first()
+    return db.execute(_conversation_statement(conversation_id)).scalars().first()
 
-def list_conversations(db: Session, user_id: Optional[int] = None, limit: int = 50):
-    """Lista conversas (opcionalmente filtra por usuário)"""
-    query = db.query(conversation_model.Conversation)
-    
-    if user_id:
-        query = query.filter(conversation_model.Conversation.user_id == user_id)
-    
-    conversations = query.order_by(
-        conversation_model.Conversation.updated_at.desc()
-    ).limit(limit).all()
-    
-    # Adiciona contagem de mensagens
-    result = []
-    for conv in conversations:
-        result.append({
-            "id": conv.id,
-            "title": conv.title,
-            "created_at": conv.created_at,
-            "updated_at": conv.updated_at,
-            "message_count": len(conv.messages)
-        })
+def list_conversations(
+    db: Session,
+    user_id: Optional[int] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
+    """
+    Lista conversas (opcionalmente filtra por usuário), da mais recente
+    para a mais antiga, com paginação por cursor (keyset em updated_at, id).
     
-    return result
+    Returns:
+        (lista de conversas, cursor da próxima página ou None)
+    """
+    rows = db.execute(_list_conversations_statement(user_id, limit, cursor)).all()
+    return _conversations_page(rows, limit)
 
 def update_conversation(db: Session, conversation_id: int, update_data: conversation_schemas.ConversationUpdate):
     """Atualiza uma conversa"""
@@ -65,6 +315,7 @@ def delete_conversation(db: Session, conversation_id: int):
     
     db.delete(conversation)
     db.commit()
+    history_cache.invalidate(conversation_id)
     return True
 
 def add_message(
@@ -73,32 +324,249 @@ def add_message(
     message_data: conversation_schemas.MessageCreate
 ):
     """Adiciona uma mensagem à conversa"""
-    message = conversation_model.Message(
-        conversation_id=conversation_id,
-        role=message_data.role,
-        content=message_data.content,
-        model=message_data.model,
-        tokens_used=message_data.tokens_used,
-        input_tokens=message_data.input_tokens,
-        output_tokens=message_data.output_tokens
-    )
+    message = _new_message(conversation_id, message_data, datetime.utcnow())
     db.add(message)
+    db.flush()
+    history_item = _history_item(message)
+    usage_service.record_usage(db, conversation_id, [message])
+    
+    # Atualiza o timestamp e o contador de mensagens da conversa
+    updated_at = _version_timestamp()
+    db.execute(_touch_conversation_statement(conversation_id, 1, updated_at))
     db.commit()
+    history_cache.append(conversation_id, updated_at, [history_item])
     db.refresh(message)
     
-    # Atualiza o timestamp da conversa
+    return message
+
+def list_messages(
+    db: Session,
+    conversation_id: int,
+    limit: int = 50,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None
+):
+    """
+    Página de mensagens de uma conversa em ordem cronológica (keyset em created_at, id).
+    
+    Sem before_id/after_id retorna as mensagens mais recentes; com before_id,
+    as anteriores a essa mensagem; com after_id, as posteriores.
+    
+    Returns:
+        (lista de mensagens, há mais mensagens na direção pedida)
+    """
+    statement = _list_messages_statement(conversation_id, limit, before_id, after_id)
+    messages = list(db.execute(statement).scalars().all())
+    return _messages_page(messages, limit, after_id)
+
+def search_messages(
+    db: Session,
+    query: str,
+    user_id: Optional[int] = None,
+    limit: int = 20,
+    offset: int = 0
+):
+    """
+    Busca textual nas mensagens (opcionalmente só nas conversas do usuário),
+    ordenada por relevância. Cada resultado traz um trecho da mensagem, não o texto todo.
+    
+    Returns:
+        (lista de resultados, há mais resultados)
+    """
+    terms = _search_terms(query)
+    statement = _search_statement(db.get_bind().dialect.name, terms, user_id, limit, offset)
+    return _search_page(db.execute(statement).all(), terms, limit)
+
+def get_conversation_history(db: Session, conversation_id: int, after_id: int = 0):
+    """
+    Retorna o histórico de mensagens de uma conversa
+    (after_id ignora as mensagens já incluídas no resumo)
+    """
+    messages = db.execute(_history_statement(conversation_id, after_id)).scalars().all()
+    return [_history_item(msg) for msg in messages]
+
+def get_turn_context(db: Session, conversation_id: int):
+    """
+    Carrega, na mesma sessão, o que um turno de chat precisa ler:
+    a conversa e o histórico que ainda não está no resumo.
+    
+    Returns:
+        (conversa ou None, histórico)
+    """
     conversation = get_conversation(db, conversation_id)
-    if conversation:
-        from datetime import datetime
-        conversation.updated_at = datetime.utcnow()
-        db.commit()
+    if not conversation:
+        return None, []
     
-    return message
+    # O histórico em cache só é usado se ninguém (nem outro worker) gravou depois
+    after_id = conversation.summarized_until_id or 0
+    version = _turn_version(conversation)
+    history = history_cache.get(conversation_id, version, after_id)
+    if history is None:
+        history = get_conversation_history(db, conversation_id, after_id)
+        history_cache.put(conversation_id, version, history)
+    
+    return conversation, history
+
+def save_turn(
+    db: Session,
+    conversation_id: int,
+    messages: List[conversation_schemas.MessageCreate],
+    summary: Optional[str] = None,
+    summarized_until_id: Optional[int] = None
+):
+    """
+    Grava um turno completo (mensagem do usuário e resposta do Claude) em uma
+    única transação: os INSERTs das mensagens, o rollup de uso de tokens e um
+    único UPDATE da conversa (updated_at, message_count e, se mudou, o resumo).
+    Sem refresh/re-query.
+    """
+    now = datetime.utcnow()
+    new_messages = [_new_message(conversation_id, message_data, now) for message_data in messages]
+    db.add_all(new_messages)
+    db.flush()
+    history_items = [_history_item(message) for message in new_messages]
+    usage_service.record_usage(db, conversation_id, new_messages)
+    
+    updated_at = _version_timestamp()
+    db.execute(_touch_conversation_statement(
+        conversation_id, len(messages), updated_at, summary, summarized_until_id
+    ))
+    db.commit()
+    history_cache.append(conversation_id, updated_at, history_items)
+
+def recount_messages(db: Session):
+    """Recalcula message_count de todas as conversas a partir da tabela messages"""
+    Message = conversation_model.Message
+    count_subquery = select(func.count(Message.id)).where(
+        Message.conversation_id == conversation_model.Conversation.id
+    ).scalar_subquery()
+    
+    # updated_at explícito para o onupdate não reordenar todas as conversas
+    db.execute(update(conversation_model.Conversation).values(
+        message_count=count_subquery,
+        updated_at=conversation_model.Conversation.updated_at
+    ))
+    db.commit()
+    history_cache.clear()
+
+
+# Versões assíncronas (AsyncSession), usadas pelas rotas
 
-def get_conversation_history(db: Session, conversation_id: int):
-    """Retorna o histórico de mensagens de uma conversa"""
-    messages = db.query(conversation_model.Message).filter(
-        conversation_model.Message.conversation_id == conversation_id
-    ).order_by(conversation_model.Message.created_at).all()
+async def create_conversation_async(db: AsyncSession, conversation_data: conversation_schemas.ConversationCreate):
+    """Versão assíncrona de create_conversation"""
+    conversation = conversation_model.Conversation(
+        title=conversation_data.title,
+        user_id=conversation_data.user_id
+    )
+    db.add(conversation)
+    await db.commit()
+    await db.refresh(conversation)
+    return conversation
+
+async def get_conversation_async(db: AsyncSession, conversation_id: int):
+    """Versão assíncrona de get_conversation"""
+    result = await db.execute(_conversation_statement(conversation_id))
+    return result.scalars().first()
+
+async def list_conversations_async(
+    db: AsyncSession,
+    user_id: Optional[int] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
+    """Versão assíncrona de list_conversations"""
+    result = await db.execute(_list_conversations_statement(user_id, limit, cursor))
+    return _conversations_page(result.all(), limit)
+
+async def update_conversation_async(
+    db: AsyncSession,
+    conversation_id: int,
+    update_data: conversation_schemas.ConversationUpdate
+):
+    """Versão assíncrona de update_conversation"""
+    conversation = await get_conversation_async(db, conversation_id)
+    if not conversation:
+        return None
+    
+    if update_data.title:
+        conversation.title = update_data.title
+    
+    await db.commit()
+    await db.refresh(conversation)
+    return conversation
+
+async def delete_conversation_async(db: AsyncSession, conversation_id: int):
+    """
+    Versão assíncrona de delete_conversation. Apaga com DELETEs diretos
+    (sem carregar as mensagens para o cascade do ORM)
+    """
+    Message = conversation_model.Message
+    Conversation = conversation_model.Conversation
+    await db.execute(delete(Message).where(Message.conversation_id == conversation_id))
+    result = await db.execute(delete(Conversation).where(Conversation.id == conversation_id))
+    await db.commit()
+    history_cache.invalidate(conversation_id)
+    return result.rowcount > 0
+
+async def list_messages_async(
+    db: AsyncSession,
+    conversation_id: int,
+    limit: int = 50,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None
+):
+    """Versão assíncrona de list_messages"""
+    statement = _list_messages_statement(conversation_id, limit, before_id, after_id)
+    result = await db.execute(statement)
+    return _messages_page(list(result.scalars().all()), limit, after_id)
+
+async def search_messages_async(
+    db: AsyncSession,
+    query: str,
+    user_id: Optional[int] = None,
+    limit: int = 20,
+    offset: int = 0
+):
+    """Versão assíncrona de search_messages"""
+    terms = _search_terms(query)
+    statement = _search_statement(db.get_bind().dialect.name, terms, user_id, limit, offset)
+    result = await db.execute(statement)
+    return _search_page(result.all(), terms, limit)
+
+async def get_turn_context_async(db: AsyncSession, conversation_id: int):
+    """Versão assíncrona de get_turn_context"""
+    conversation = await get_conversation_async(db, conversation_id)
+    if not conversation:
+        return None, []
+    
+    after_id = conversation.summarized_until_id or 0
+    version = _turn_version(conversation)
+    history = history_cache.get(conversation_id, version, after_id)
+    if history is None:
+        result = await db.execute(_history_statement(conversation_id, after_id))
+        history = [_history_item(msg) for msg in result.scalars().all()]
+        history_cache.put(conversation_id, version, history)
+    
+    return conversation, history
+
+async def save_turn_async(
+    db: AsyncSession,
+    conversation_id: int,
+    messages: List[conversation_schemas.MessageCreate],
+    summary: Optional[str] = None,
+    summarized_until_id: Optional[int] = None
+):
+    """Versão assíncrona de save_turn (mesma transação única)"""
+    now = datetime.utcnow()
+    new_messages = [_new_message(conversation_id, message_data, now) for message_data in messages]
+    db.add_all(new_messages)
+    await db.flush()
+    history_items = [_history_item(message) for message in new_messages]
+    await usage_service.record_usage_async(db, conversation_id, new_messages)
     
-    return [{"role": msg.role, "content": msg.content} for msg in messages]
\ No newline at end of file
+    updated_at = _version_timestamp()
+    await db.execute(_touch_conversation_statement(
+        conversation_id, len(messages), updated_at, summary, summarized_until_id
+    ))
+    await db.commit()
+    history_cache.append(conversation_id, updated_at, history_items)
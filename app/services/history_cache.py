@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Custo aproximado de cada mensagem em cache além do texto (dict, strings, ids)
+MESSAGE_OVERHEAD_BYTES = 200
+
+
+def _message_size(message: dict) -> int:
+    return len(message["content"].encode("utf-8")) + MESSAGE_OVERHEAD_BYTES
+
+
+class HistoryCache:
+    """
+    Cache em memória dos históricos de conversa, com limite de conversas
+    e de bytes totais (LRU).
+    
+    Cada entrada guarda a versão da conversa (updated_at, message_count).
+    A leitura só é servida se a versão bater com a do banco, então uma
+    escrita feita por outro worker do uvicorn invalida a cópia local.
+    """
+
+    def __init__(self, max_conversations: int, max_bytes: int):
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conversation_id: int, version: tuple, after_id: int = 0) -> Optional[list]:
+        """Histórico em cache (mensagens com id > after_id) ou None se ausente/desatualizado"""
+        with self._lock:
+            entry = self._data.get(conversation_id)
+            if entry is None or entry["version"] != version:
+                self.misses += 1
+                return None
+            
+            self._data.move_to_end(conversation_id)
+            self.hits += 1
+            
+            # Descarta o que já foi para o resumo da conversa
+            messages = entry["messages"]
+            if messages and messages[0]["id"] <= after_id:
+                kept = [msg for msg in messages if msg["id"] > after_id]
+                self._resize(entry, kept)
+                entry["messages"] = messages = kept
+            
+            return list(messages)
+
+    def put(self, conversation_id: int, version: tuple, messages: list) -> None:
+        """Guarda o histórico carregado do banco"""
+        with self._lock:
+            self._remove(conversation_id)
+            entry = {"version": version, "messages": [], "size": 0}
+            self._resize(entry, list(messages))
+            entry["messages"] = list(messages)
+            self._data[conversation_id] = entry
+            self._evict()
+
+    def append(self, conversation_id: int, updated_at, messages: list) -> None:
+        """
+        Acrescenta mensagens recém-gravadas (se a conversa estiver em cache)
+        e avança a versão para (updated_at, message_count + len(messages))
+        """
+        with self._lock:
+            entry = self._data.get(conversation_id)
+            if entry is None:
+                return
+            
+            _, message_count = entry["version"]
+            new_messages = entry["messages"] + list(messages)
+            self._resize(entry, new_messages)
+            entry["messages"] = new_messages
+            entry["version"] = (updated_at, message_count + len(messages))
+            self._data.move_to_end(conversation_id)
+            self._evict()
+
+    def invalidate(self, conversation_id: int) -> None:
+        with self._lock:
+            self._remove(conversation_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "conversations": len(self._data),
+                "max_conversations": self.max_conversations,
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _resize(self, entry: dict, messages: list) -> None:
+        size = sum(_message_size(msg) for msg in messages)
+        self.total_bytes += size - entry["size"]
+        entry["size"] = size
+
+    def _remove(self, conversation_id: int) -> None:
+        entry = self._data.pop(conversation_id, None)
+        if entry is not None:
+            self.total_bytes -= entry["size"]
+
+    def _evict(self) -> None:
+        while self._data and (
+            len(self._data) > self.max_conversations or self.total_bytes > self.max_bytes
+        ):
+            _, entry = self._data.popitem(last=False)
+            self.total_bytes -= entry["size"]
@@ -0,0 +1,166 @@
+import json
+import math
+import threading
+from collections import defaultdict
+from app.utils.text import tokenize
+
+INTENTS = ["pergunta", "ajuda", "reclamacao", "elogio", "outro"]
+
+# Exemplos iniciais por intenção; o modelo continua aprendendo com os rótulos do Claude
+SEED_EXAMPLES = {
+    "pergunta": [
+        "o que é isso?", "como funciona?", "qual o horário de atendimento?",
+        "quando chega meu pedido?", "onde fica a loja?", "quanto custa o plano?",
+        "por que isso acontece?", "vocês têm aplicativo?", "é possível parcelar?",
+        "gostaria de saber o prazo", "qual a diferença entre os planos?"
+    ],
+    "ajuda": [
+        "preciso de ajuda", "me ajuda por favor", "não consigo acessar minha conta",
+        "como faço para trocar a senha", "esqueci minha senha", "não sei como configurar",
+        "pode me ajudar com o cadastro", "estou com um problema no sistema",
+        "deu erro ao fazer login", "não consigo fazer o pagamento", "preciso de suporte"
+    ],
+    "reclamacao": [
+        "péssimo atendimento", "serviço horrível", "isso é um absurdo",
+        "quero reclamar do atendimento", "estou muito insatisfeito", "a entrega demorou demais",
+        "quero cancelar e pedir reembolso", "o sistema caiu de novo", "produto veio com defeito",
+        "ninguém resolve meu problema", "que descaso com o cliente", "muito ruim"
+    ],
+    "elogio": [
+        "obrigado pela ajuda", "parabéns pelo trabalho", "excelente atendimento",
+        "ótimo serviço", "adorei o produto", "muito bom mesmo", "vocês são incríveis",
+        "ficou perfeito", "gostei muito", "atendimento maravilhoso", "muito obrigada"
+    ],
+    "outro": [
+        "oi", "olá", "bom dia", "boa tarde", "boa noite", "teste", "tchau",
+        "ok", "beleza", "tudo bem", "até mais"
+    ]
+}
+
+
+# Palavras muito comuns que não ajudam a separar as intenções
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "de", "da", "do", "das", "dos", "e", "em",
+    "no", "na", "nos", "nas", "para", "pra", "com", "que", "se", "por", "ao",
+    "eu", "voce", "voces", "meu", "minha", "isso", "esse", "essa", "foi", "muito"
+}
+
+
+def _features(text: str) -> list:
+    """Unigramas e bigramas (sem stopwords) e um marcador de interrogação"""
+    words = tokenize(text)
+    features = [word for word in words if word not in STOPWORDS]
+    features += [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if "?" in text:
+        features.append("<?>")
+    return features
+
+
+class IntentClassifier:
+    """
+    Naive Bayes multinomial sobre n-gramas de palavras: classifica em
+    microssegundos e aprende online com os rótulos vindos do Claude
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._feature_counts = {intent: defaultdict(int) for intent in INTENTS}
+        self._total_features = {intent: 0 for intent in INTENTS}
+        self._vocabulary = set()
+        self.examples_learned = 0
+        self.seed_examples = 0  # Exemplos de SEED_EXAMPLES (não calibram a confiança)
+        self.skipped_lines = 0  # Linhas inválidas ignoradas em train_from_file
+
+    def learn(self, text: str, intent: str) -> None:
+        """Adiciona um exemplo rotulado ao modelo"""
+        if intent not in self._feature_counts:
+            return
+        
+        features = _features(text)
+        with self._lock:
+            for feature in features:
+                self._feature_counts[intent][feature] += 1
+                self._vocabulary.add(feature)
+            self._total_features[intent] += len(features)
+            self.examples_learned += 1
+
+    @property
+    def labelled_examples(self) -> int:
+        """Exemplos rotulados pelo Claude (arquivo de treino e aprendizado online)"""
+        return self.examples_learned - self.seed_examples
+
+    def classify(self, text: str) -> dict:
+        """
+        Returns:
+            dict com 'intent' e 'confidence' (probabilidade a posteriori).
+            Sem nenhuma palavra conhecida a confiança é 0.
+        """
+        features = _features(text)
+        with self._lock:
+            known = [feature for feature in features if feature in self._vocabulary]
+            if not known:
+                return {"intent": "outro", "confidence": 0.0}
+            
+            vocabulary_size = len(self._vocabulary)
+            scores = {}
+            for intent in INTENTS:
+                counts = self._feature_counts[intent]
+                denominator = self._total_features[intent] + vocabulary_size
+                scores[intent] = sum(
+                    math.log((counts.get(feature, 0) + 1) / denominator)
+                    for feature in known
+                )
+        
+        best = max(scores, key=scores.get)
+        top_score = scores[best]
+        total = sum(math.exp(score - top_score) for score in scores.values())
+        return {"intent": best, "confidence": round(1 / total, 4)}
+
+    def train_from_file(self, path: str) -> int:
+        """
+        Treina com um arquivo NDJSON de rótulos anteriores, um objeto por linha
+        com 'message' e 'intent' (ex.: a saída de /ai/analyze/batch com stream).
+        Só entram linhas com 'source' igual a 'claude' ou sem 'source': os
+        palpites do próprio classificador ('local') não voltam para o treino.
+        Linhas inválidas (JSON quebrado, sem 'message' de texto) são puladas
+        e contadas em skipped_lines.
+
+        Returns:
+            número de exemplos aprendidos
+        """
+        learned = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    item = None
+                if not isinstance(item, dict) or not isinstance(item.get("message"), str):
+                    self.skipped_lines += 1
+                    continue
+                if item.get("source", "claude") != "claude":
+                    continue
+                if item.get("intent") in self._feature_counts and not item.get("error"):
+                    self.learn(item["message"], item["intent"])
+                    learned += 1
+        return learned
+
+    def stats(self) -> dict:
+        return {
+            "examples_learned": self.examples_learned,
+            "labelled_examples": self.labelled_examples,
+            "skipped_lines": self.skipped_lines,
+            "vocabulary": len(self._vocabulary)
+        }
+
+
+def build_default_classifier() -> IntentClassifier:
+    classifier = IntentClassifier()
+    for intent, examples in SEED_EXAMPLES.items():
+        for example in examples:
+            classifier.learn(example, intent)
+    classifier.seed_examples = classifier.examples_learned
+    return classifier
@@ -0,0 +1,72 @@
+import re
+from typing import Optional
+from app.config import ROUTER_COMPLEX_THRESHOLD
+from app.utils.text import tokenize
+
+# Valor de `model` que pede a escolha automática
+AUTO_MODEL = "auto"
+
+# Palavras (normalizadas, sem acento) que indicam pedido que exige raciocínio
+COMPLEX_KEYWORDS = {
+    "explique", "explicar", "explica", "analise", "analisar", "compare", "comparar",
+    "diferenca", "diferencas", "implemente", "implementar", "codigo", "algoritmo",
+    "otimize", "otimizar", "depure", "depurar", "refatore", "refatorar", "prove",
+    "demonstre", "calcule", "resolva", "detalhadamente", "detalhado", "estrategia",
+    "arquitetura", "planeje", "planejar", "projete", "avalie", "justifique",
+    "explain", "analyze", "compare", "implement", "code", "algorithm", "debug",
+    "refactor", "prove", "design", "architecture", "optimize", "evaluate",
+}
+
+# Trechos de código no prompt
+CODE_RE = re.compile(r"```|\bdef \w+\(|\bclass \w+|\bfunction\b|\bSELECT\b.+\bFROM\b|=>|\{\s*$", re.MULTILINE)
+
+
+def complexity_score(
+    message: str,
+    history: Optional[list] = None,
+    max_tokens: int = 1024,
+    system_prompt: Optional[str] = None
+) -> float:
+    """
+    Nota de complexidade do pedido, calculada localmente (sem chamar o Claude).
+    Soma sinais de tamanho, palavras de raciocínio, código, número de perguntas,
+    tamanho do histórico e resposta longa pedida (max_tokens).
+    """
+    words = tokenize(message)
+    score = min(len(words) / 80, 2.0)
+
+    score += min(sum(1 for word in set(words) if word in COMPLEX_KEYWORDS), 2)
+
+    if CODE_RE.search(message):
+        score += 2
+
+    if message.count("?") > 1:
+        score += 0.5
+
+    if history:
+        score += min(len(history) / 10, 1.0)
+
+    if max_tokens and max_tokens > 1024:
+        score += 1
+
+    if system_prompt and len(system_prompt) > 500:
+        score += 0.5
+
+    return score
+
+
+def route_model(
+    models: list,
+    message: str,
+    history: Optional[list] = None,
+    max_tokens: int = 1024,
+    system_prompt: Optional[str] = None
+) -> str:
+    """
+    Escolhe o modelo no catálogo (get_available_models): o primeiro da
+    categoria 'fast' para pedidos simples e o primeiro da 'standard' para os
+    complexos (nota >= ROUTER_COMPLEX_THRESHOLD)
+    """
+    score = complexity_score(message, history, max_tokens, system_prompt)
+    tier = "standard" if score >= ROUTER_COMPLEX_THRESHOLD else "fast"
+    return next(model["id"] for model in models if model.get("tier") == tier)
@@ -0,0 +1,368 @@
+"""
+Exportação e importação em massa de conversas em NDJSON.
+
+Formato: uma linha {"type": "conversation", ...} seguida das linhas
+{"type": "message", ...} dessa conversa, em ordem.
+"""
+import json
+from types import SimpleNamespace
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import bindparam, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.config import EXPORT_BATCH_SIZE, IMPORT_BATCH_SIZE
+from app.models import conversation_model
+from app.services import usage_service
+from typing import Optional
+
+Conversation = conversation_model.Conversation
+Message = conversation_model.Message
+
+CONVERSATION_FIELDS = ("user_id", "title", "summary", "summarized_until_id", "created_at", "updated_at")
+MESSAGE_FIELDS = (
+    "role", "content", "model", "tokens_used", "input_tokens", "output_tokens",
+    "cache_creation_input_tokens", "cache_read_input_tokens", "created_at",
+)
+DATETIME_FIELDS = ("created_at", "updated_at")
+# Contadores de mensagem que, ausentes na linha, gravam 0 (como o default do model)
+MESSAGE_COUNTERS = (
+    "tokens_used", "input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens",
+)
+
+
+def _export_statement(user_id: Optional[int], start: Optional[date], end: Optional[date]):
+    """
+    Conversas (criadas entre start e end, inclusive) com as mensagens, numa
+    única consulta. A ordem (conversa, created_at, id) é a do índice de messages.
+    """
+    statement = select(
+        Conversation.id.label("conversation_id"),
+        *[getattr(Conversation, field).label(f"conversation_{field}") for field in CONVERSATION_FIELDS],
+        Message.id.label("message_id"),
+        *[getattr(Message, field).label(f"message_{field}") for field in MESSAGE_FIELDS]
+    ).outerjoin(
+        Message, Message.conversation_id == Conversation.id
+    ).order_by(Conversation.id, Message.created_at, Message.id)
+
+    if user_id is not None:
+        statement = statement.where(Conversation.user_id == user_id)
+    if start:
+        statement = statement.where(Conversation.created_at >= datetime.combine(start, time.min))
+    if end:
+        statement = statement.where(Conversation.created_at < datetime.combine(end + timedelta(days=1), time.min))
+    return statement
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _export_chunk(rows: list, previous_id: Optional[int]) -> tuple:
+    """
+    NDJSON de um lote de linhas: a conversa aparece na primeira linha dela
+    (que pode estar num lote anterior, por isso o previous_id).
+
+    Returns:
+        (texto, id da última conversa do lote)
+    """
+    lines = []
+    for row in rows:
+        if row.conversation_id != previous_id:
+            previous_id = row.conversation_id
+            record = {"type": "conversation", "id": row.conversation_id}
+            for field in CONVERSATION_FIELDS:
+                record[field] = _json_value(getattr(row, f"conversation_{field}"))
+            lines.append(json.dumps(record, ensure_ascii=False))
+        if row.message_id is not None:
+            record = {"type": "message", "id": row.message_id, "conversation_id": row.conversation_id}
+            for field in MESSAGE_FIELDS:
+                record[field] = _json_value(getattr(row, f"message_{field}"))
+            lines.append(json.dumps(record, ensure_ascii=False))
+    return "".join(line + "\n" for line in lines), previous_id
+
+
+def export_conversations(
+    db: Session,
+    user_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+):
+    """
+    Gera o NDJSON das conversas em pedaços de até batch_size linhas do banco.
+    Usa cursor no servidor (yield_per): a memória não cresce com o volume.
+    """
+    statement = _export_statement(user_id, start, end).execution_options(yield_per=batch_size)
+    previous_id = None
+    for rows in db.execute(statement).partitions():
+        chunk, previous_id = _export_chunk(rows, previous_id)
+        yield chunk
+
+
+async def export_conversations_async(
+    db: AsyncSession,
+    user_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+):
+    """Versão assíncrona de export_conversations"""
+    statement = _export_statement(user_id, start, end).execution_options(yield_per=batch_size)
+    result = await db.stream(statement)
+    previous_id = None
+    async for rows in result.partitions():
+        chunk, previous_id = _export_chunk(rows, previous_id)
+        yield chunk
+
+
+def _parse_datetimes(record: dict) -> dict:
+    for field in DATETIME_FIELDS:
+        if record.get(field):
+            record[field] = datetime.fromisoformat(record[field])
+    return record
+
+
+class _Import:
+    """
+    Estado de uma importação: o lote de conversas e de mensagens ainda não
+    gravadas e os resumos esperando o id novo da última mensagem que cobrem.
+
+    Cada conversa recebe um número de ordem na importação (as linhas trazem os
+    ids de origem, que podem se repetir entre arquivos); as mensagens do lote
+    apontam para esse número até as conversas serem gravadas e terem id novo.
+    """
+
+    def __init__(self, user_id: Optional[int], batch_size: int):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.conversation_refs = {}  # id de origem -> número de ordem da conversa
+        self.new_ids = {}  # número de ordem -> id novo (conversas já gravadas)
+        self.pending_conversations = []
+        self.pending = []
+        self.current_summary = None  # Resumo da conversa em leitura: [número de ordem, resumo, summarized_until_id de origem, mensagens cobertas]
+        self.summaries = []  # (número de ordem, resumo, mensagens cobertas) de conversas já lidas por inteiro
+        self.conversations = 0
+        self.messages = 0
+        self.started_at = datetime.utcnow()
+
+    def parse(self, line: str, line_number: int) -> Optional[dict]:
+        """Linha validada, ou None se for vazia. Levanta ValueError com o número da linha."""
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("a linha deve ser um objeto JSON")
+            if record.get("type") not in ("conversation", "message"):
+                raise ValueError("'type' deve ser 'conversation' ou 'message'")
+            if record["type"] == "message" and record.get("conversation_id") not in self.conversation_refs:
+                raise ValueError("mensagem antes da linha da conversa dela")
+            return _parse_datetimes(record)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Linha {line_number}: {str(e)}")
+
+    def add_conversation(self, record: dict) -> bool:
+        """Enfileira a conversa; True quando o lote está cheio"""
+        self.finish_conversation()
+        ref = self.conversations
+        self.conversation_refs[record.get("id")] = ref
+        self.conversations += 1
+        # Todas as linhas com as mesmas colunas (defaults do model preenchidos aqui): um único INSERT
+        created_at = record.get("created_at") or self.started_at
+        self.pending_conversations.append({
+            "user_id": self.user_id if self.user_id is not None else record.get("user_id"),
+            "title": record.get("title") or "Nova Conversa",
+            "created_at": created_at,
+            "updated_at": record.get("updated_at") or self.started_at
+        })
+        # Resumo sem o limite das mensagens que cobre não tem como ser usado: fica de fora
+        if record.get("summary") and record.get("summarized_until_id"):
+            self.current_summary = [ref, record["summary"], record["summarized_until_id"], 0]
+        return len(self.pending_conversations) + len(self.pending) >= self.batch_size
+
+    def take_conversations(self) -> list:
+        """Conversas do lote, na ordem em que devem receber os ids (ver set_conversation_ids)"""
+        rows, self.pending_conversations = self.pending_conversations, []
+        return rows
+
+    def set_conversation_ids(self, new_ids: list) -> None:
+        """Ids novos das conversas de take_conversations, na mesma ordem"""
+        first_ref = len(self.new_ids)
+        for offset, new_id in enumerate(new_ids):
+            self.new_ids[first_ref + offset] = new_id
+
+    def finish_conversation(self) -> None:
+        """Todas as mensagens da conversa em leitura já foram vistas"""
+        if self.current_summary is not None:
+            new_id, summary, _, covered = self.current_summary
+            if covered:
+                self.summaries.append((new_id, summary, covered))
+            self.current_summary = None
+
+    def add_message(self, record: dict) -> bool:
+        """Enfileira a mensagem; True quando o lote está cheio"""
+        # Todas as linhas com as mesmas colunas: o lote vira um único INSERT executemany
+        values = {field: record.get(field) for field in MESSAGE_FIELDS}
+        for field in MESSAGE_COUNTERS:
+            values[field] = values[field] or 0
+        values["created_at"] = values["created_at"] or self.started_at
+        values["conversation_id"] = self.conversation_refs[record["conversation_id"]]
+        self.pending.append(values)
+        summary = self.current_summary
+        if summary is not None and summary[0] == values["conversation_id"] and (record.get("id") or 0) <= summary[2]:
+            summary[3] += 1
+        return len(self.pending_conversations) + len(self.pending) >= self.batch_size
+
+    def take_batch(self) -> tuple:
+        """
+        Statements do lote (depois de gravadas as conversas dele): um INSERT
+        executemany das mensagens, um UPDATE executemany de message_count, as
+        mensagens (para os rollups de uso) e os resumos das conversas já lidas
+        por inteiro
+        """
+        # INSERT do Core na tabela: o do ORM grava linha a linha quando precisa dos ids
+        rows, self.pending = self.pending, []
+        self.messages += len(rows)
+        for row in rows:
+            row["conversation_id"] = self.new_ids[row["conversation_id"]]
+        counts = {}
+        for row in rows:
+            counts[row["conversation_id"]] = counts.get(row["conversation_id"], 0) + 1
+
+        table = Conversation.__table__
+        count_statement = update(table).where(table.c.id == bindparam("b_id")).values(
+            message_count=table.c.message_count + bindparam("b_count"),
+            updated_at=table.c.updated_at
+        )
+        count_params = [{"b_id": conversation_id, "b_count": count} for conversation_id, count in counts.items()]
+
+        # record_usage só lê atributos: não precisa de objetos do ORM
+        by_conversation = {}
+        for row in rows:
+            by_conversation.setdefault(row["conversation_id"], []).append(SimpleNamespace(**row))
+
+        # As mensagens entram na ordem do export: a N-ésima (por id novo) é a última coberta pelo resumo
+        last_covered = select(Message.id).where(
+            Message.conversation_id == bindparam("b_id")
+        ).order_by(Message.id).limit(1).offset(bindparam("b_offset")).scalar_subquery()
+        summary_statement = update(table).where(table.c.id == bindparam("b_id")).values(
+            summary=bindparam("b_summary"),
+            summarized_until_id=last_covered,
+            updated_at=table.c.updated_at
+        )
+        summary_params = [
+            {"b_id": self.new_ids[ref], "b_summary": summary, "b_offset": covered - 1}
+            for ref, summary, covered in self.summaries
+        ]
+        self.summaries = []
+        return rows, count_statement, count_params, by_conversation, summary_statement, summary_params
+
+    def result(self) -> dict:
+        return {"conversations": self.conversations, "messages": self.messages}
+
+
+def _insert_conversations(db: Session, rows: list) -> list:
+    """Grava as conversas em um único INSERT e retorna os ids novos, na ordem das linhas"""
+    table = Conversation.__table__
+    if db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        return list(db.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows).scalars())
+    # MySQL (sem RETURNING): um INSERT de várias linhas com número de linhas conhecido
+    # reserva ids consecutivos (de auto_increment_increment em auto_increment_increment);
+    # lastrowid é o da primeira linha
+    first_id = db.execute(insert(table).values(rows)).lastrowid
+    step = db.execute(text("SELECT @@auto_increment_increment")).scalar()
+    return [first_id + offset * step for offset in range(len(rows))]
+
+
+async def _insert_conversations_async(db: AsyncSession, rows: list) -> list:
+    """Versão assíncrona de _insert_conversations"""
+    table = Conversation.__table__
+    if db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        result = await db.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows)
+        return list(result.scalars())
+    first_id = (await db.execute(insert(table).values(rows))).lastrowid
+    step = (await db.execute(text("SELECT @@auto_increment_increment"))).scalar()
+    return [first_id + offset * step for offset in range(len(rows))]
+
+
+def _flush_import(db: Session, state: _Import) -> None:
+    conversations = state.take_conversations()
+    if conversations:
+        state.set_conversation_ids(_insert_conversations(db, conversations))
+    rows, count_statement, count_params, by_conversation, summary_statement, summary_params = state.take_batch()
+    if rows:
+        db.execute(insert(Message.__table__), rows)
+        db.execute(count_statement, count_params)
+        for conversation_id, messages in by_conversation.items():
+            usage_service.record_usage(db, conversation_id, messages)
+    if summary_params:
+        db.execute(summary_statement, summary_params)
+    db.commit()
+
+
+async def _flush_import_async(db: AsyncSession, state: _Import) -> None:
+    conversations = state.take_conversations()
+    if conversations:
+        state.set_conversation_ids(await _insert_conversations_async(db, conversations))
+    rows, count_statement, count_params, by_conversation, summary_statement, summary_params = state.take_batch()
+    if rows:
+        await db.execute(insert(Message.__table__), rows)
+        await db.execute(count_statement, count_params)
+        for conversation_id, messages in by_conversation.items():
+            await usage_service.record_usage_async(db, conversation_id, messages)
+    if summary_params:
+        await db.execute(summary_statement, summary_params)
+    await db.commit()
+
+
+def import_conversations(db: Session, lines, user_id: Optional[int] = None, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    Importa o NDJSON de export_conversations. As conversas ganham ids novos
+    (user_id, se informado, substitui o das linhas); conversas e mensagens são
+    gravadas em lotes de batch_size linhas, com um INSERT para as conversas,
+    um INSERT executemany para as mensagens e um commit por lote.
+
+    O resumo da conversa é gravado depois das mensagens, com summarized_until_id
+    apontando para o id novo da última mensagem que ele cobre.
+
+    Levanta ValueError na primeira linha inválida; os lotes anteriores já
+    estão gravados (conversas cujo resumo ainda não foi gravado ficam sem ele
+    e o resumo é refeito no próximo turno).
+
+    Returns:
+        dict com o número de conversas e mensagens importadas
+    """
+    state = _Import(user_id, batch_size)
+    for line_number, line in enumerate(lines, start=1):
+        record = state.parse(line, line_number)
+        if record is None:
+            continue
+        full = state.add_conversation(record) if record["type"] == "conversation" else state.add_message(record)
+        if full:
+            _flush_import(db, state)
+    state.finish_conversation()
+    _flush_import(db, state)
+    return state.result()
+
+
+async def import_conversations_async(
+    db: AsyncSession,
+    lines,
+    user_id: Optional[int] = None,
+    batch_size: int = IMPORT_BATCH_SIZE
+) -> dict:
+    """Versão assíncrona de import_conversations (`lines` é um iterável assíncrono)"""
+    state = _Import(user_id, batch_size)
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        record = state.parse(line, line_number)
+        if record is None:
+            continue
+        full = state.add_conversation(record) if record["type"] == "conversation" else state.add_message(record)
+        if full:
+            await _flush_import_async(db, state)
+    state.finish_conversation()
+    await _flush_import_async(db, state)
+    return state.result()
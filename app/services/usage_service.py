@@ -0,0 +1,208 @@
+from sqlalchemy import Date, Integer, delete, func, literal, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models import conversation_model
+from app.models.usage_model import UsageRollup
+from datetime import date
+from typing import Optional
+
+# Contadores somados em cada linha de usage_rollups
+USAGE_FIELDS = (
+    "message_count",
+    "tokens_used",
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+KEY_FIELDS = ("user_id", "model", "day")
+
+# Dimensões aceitas em get_usage_summary
+GROUP_BY_COLUMNS = {
+    "user": UsageRollup.user_id,
+    "model": UsageRollup.model,
+    "day": UsageRollup.day,
+}
+
+def _upsert_statement(dialect: str, select_statement):
+    """INSERT ... SELECT que soma nos contadores se a linha (user_id, model, day) já existe"""
+    columns = [*KEY_FIELDS, *USAGE_FIELDS]
+    if dialect == "mysql":
+        statement = mysql_insert(UsageRollup).from_select(columns, select_statement)
+        return statement.on_duplicate_key_update({
+            field: getattr(UsageRollup, field) + statement.inserted[field] for field in USAGE_FIELDS
+        })
+
+    statement = sqlite_insert(UsageRollup).from_select(columns, select_statement)
+    return statement.on_conflict_do_update(
+        index_elements=list(KEY_FIELDS),
+        set_={field: getattr(UsageRollup, field) + statement.excluded[field] for field in USAGE_FIELDS}
+    )
+
+def _rollup_statements(dialect: str, conversation_id: int, messages: list):
+    """
+    Um upsert por (modelo, dia) das mensagens novas. Só entram mensagens com
+    modelo (as respostas do Claude); o user_id vem da conversa, no próprio SELECT.
+    """
+    groups = {}
+    for message in messages:
+        if not message.model:
+            continue
+        totals = groups.setdefault((message.model, message.created_at.date()), dict.fromkeys(USAGE_FIELDS, 0))
+        totals["message_count"] += 1
+        for field in USAGE_FIELDS[1:]:
+            totals[field] += getattr(message, field) or 0
+
+    Conversation = conversation_model.Conversation
+    for (model, day), totals in groups.items():
+        select_statement = select(
+            func.coalesce(Conversation.user_id, 0),
+            literal(model),
+            literal(day, Date),
+            *[literal(totals[field], Integer) for field in USAGE_FIELDS]
+        ).where(Conversation.id == conversation_id)
+        yield _upsert_statement(dialect, select_statement)
+
+def record_usage(db: Session, conversation_id: int, messages: list):
+    """
+    Soma o uso das mensagens (já com flush) nos rollups, sem commit:
+    quem chama commita junto com as mensagens
+    """
+    for statement in _rollup_statements(db.get_bind().dialect.name, conversation_id, messages):
+        db.execute(statement)
+
+async def record_usage_async(db: AsyncSession, conversation_id: int, messages: list):
+    """Versão assíncrona de record_usage"""
+    for statement in _rollup_statements(db.get_bind().dialect.name, conversation_id, messages):
+        await db.execute(statement)
+
+def _filter_usage(statement, user_id: Optional[int], model: Optional[str], start: Optional[date], end: Optional[date]):
+    if user_id is not None:
+        statement = statement.where(UsageRollup.user_id == user_id)
+    if model:
+        statement = statement.where(UsageRollup.model == model)
+    if start:
+        statement = statement.where(UsageRollup.day >= start)
+    if end:
+        statement = statement.where(UsageRollup.day <= end)
+    return statement
+
+def _daily_usage_statement(user_id, model, start, end, limit: int):
+    statement = select(UsageRollup)
+    statement = _filter_usage(statement, user_id, model, start, end)
+    return statement.order_by(
+        UsageRollup.day.desc(), UsageRollup.user_id, UsageRollup.model
+    ).limit(limit)
+
+def _usage_summary_statement(group_by: Optional[str], user_id, model, start, end):
+    sums = [func.coalesce(func.sum(getattr(UsageRollup, field)), 0).label(field) for field in USAGE_FIELDS]
+    if group_by is None:
+        return _filter_usage(select(*sums), user_id, model, start, end)
+
+    if group_by not in GROUP_BY_COLUMNS:
+        raise ValueError(f"group_by inválido (use: {', '.join(GROUP_BY_COLUMNS)})")
+    column = GROUP_BY_COLUMNS[group_by]
+    statement = _filter_usage(select(column, *sums), user_id, model, start, end)
+    return statement.group_by(column).order_by(column)
+
+def _usage_items(rows: list):
+    return [row._asdict() for row in rows]
+
+def get_daily_usage(
+    db: Session,
+    user_id: Optional[int] = None,
+    model: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = 366
+):
+    """Linhas de usage_rollups (usuário, modelo, dia), do dia mais recente para o mais antigo"""
+    return db.execute(_daily_usage_statement(user_id, model, start, end, limit)).scalars().all()
+
+def get_usage_summary(
+    db: Session,
+    group_by: Optional[str] = None,
+    user_id: Optional[int] = None,
+    model: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None
+):
+    """
+    Uso agregado a partir dos rollups (nunca da tabela messages), agrupado por
+    'user', 'model' ou 'day' (None = só o total). Levanta ValueError se group_by for inválido.
+    """
+    return _usage_items(db.execute(_usage_summary_statement(group_by, user_id, model, start, end)).all())
+
+async def get_daily_usage_async(
+    db: AsyncSession,
+    user_id: Optional[int] = None,
+    model: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = 366
+):
+    """Versão assíncrona de get_daily_usage"""
+    result = await db.execute(_daily_usage_statement(user_id, model, start, end, limit))
+    return result.scalars().all()
+
+async def get_usage_summary_async(
+    db: AsyncSession,
+    group_by: Optional[str] = None,
+    user_id: Optional[int] = None,
+    model: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None
+):
+    """Versão assíncrona de get_usage_summary"""
+    result = await db.execute(_usage_summary_statement(group_by, user_id, model, start, end))
+    return _usage_items(result.all())
+
+def rebuild_usage(db: Session, batch_size: int = 5000, on_batch=None):
+    """
+    Reconstrói usage_rollups a partir da tabela messages, em faixas de
+    batch_size ids (uma transação por faixa, agregando no banco).
+
+    Só processa mensagens até o maior id existente no início: as gravadas
+    depois já entram nos rollups por record_usage.
+
+    Returns:
+        número de faixas processadas
+    """
+    Message = conversation_model.Message
+    Conversation = conversation_model.Conversation
+    dialect = db.get_bind().dialect.name
+
+    db.execute(delete(UsageRollup))
+    max_id = db.execute(select(func.max(Message.id))).scalar() or 0
+    db.commit()
+
+    user_id = func.coalesce(Conversation.user_id, 0)
+    day = func.date(Message.created_at)
+    batches = 0
+    low = 0
+    while low < max_id:
+        high = min(low + batch_size, max_id)
+        select_statement = select(
+            user_id,
+            Message.model,
+            day,
+            func.count(Message.id),
+            *[func.coalesce(func.sum(getattr(Message, field)), 0) for field in USAGE_FIELDS[1:]]
+        ).join(
+            Conversation, Conversation.id == Message.conversation_id
+        ).where(
+            Message.id > low,
+            Message.id <= high,
+            Message.model.isnot(None)
+        ).group_by(user_id, Message.model, day)
+
+        db.execute(_upsert_statement(dialect, select_statement))
+        db.commit()
+        batches += 1
+        low = high
+        if on_batch:
+            on_batch(high, max_id)
+
+    return batches
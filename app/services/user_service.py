@@ -1,18 +1,66 @@
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app import models, schemas
 from app.utils.security import hash_password
+from typing import Optional
 
-def create_user(db: Session, user_data: schemas.UserCreate):
-    hashed_pw = hash_password(user_data.password)
-    new_user = models.user_model.User(
+def _new_user(user_data: schemas.UserCreate, hashed_password: Optional[str]):
+    return models.user_model.User(
         username=user_data.username,
         email=user_data.email,
-        hashed_password=hashed_pw,
+        hashed_password=hashed_password or hash_password(user_data.password),
     )
+
+def _user_by_login_statement(login: str):
+    User = models.user_model.User
+    return select(User).where(or_(User.username == login, User.email == login))
+
+def _password_hash_statement(user_id: int, hashed_password: str):
+    User = models.user_model.User
+    return update(User).where(User.id == user_id).values(hashed_password=hashed_password)
+
+def create_user(db: Session, user_data: schemas.UserCreate, hashed_password: Optional[str] = None):
+    """Cria um usuário (hashed_password permite gerar o hash fora da sessão, ex.: no executor do bcrypt)"""
+    new_user = _new_user(user_data, hashed_password)
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
     return new_user
 
 def list_users(db: Session):
-    return db.query(models.user_model.User).all()
+    return db.execute(select(models.user_model.User)).scalars().all()
+
+def get_user_by_login(db: Session, login: str):
+    """Busca um usuário pelo username ou email"""
+    return db.execute(_user_by_login_statement(login)).scalars().first()
+
+def update_password_hash(db: Session, user_id: int, hashed_password: str):
+    """Troca o hash salvo (rehash quando o custo do bcrypt muda)"""
+    db.execute(_password_hash_statement(user_id, hashed_password))
+    db.commit()
+
+
+# Versões assíncronas (AsyncSession), usadas pelas rotas
+
+async def create_user_async(db: AsyncSession, user_data: schemas.UserCreate, hashed_password: Optional[str] = None):
+    """Versão assíncrona de create_user"""
+    new_user = _new_user(user_data, hashed_password)
+    db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    return new_user
+
+async def list_users_async(db: AsyncSession):
+    result = await db.execute(select(models.user_model.User))
+    return result.scalars().all()
+
+async def get_user_by_login_async(db: AsyncSession, login: str):
+    """Versão assíncrona de get_user_by_login"""
+    result = await db.execute(_user_by_login_statement(login))
+    return result.scalars().first()
+
+async def update_password_hash_async(db: AsyncSession, user_id: int, hashed_password: str):
+    """Versão assíncrona de update_password_hash"""
+    await db.execute(_password_hash_statement(user_id, hashed_password))
+    await db.commit()
@@ -0,0 +1,222 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, Request
+from app.config import (
+    RATE_LIMIT_REQUESTS_PER_MINUTE, RATE_LIMIT_TOKENS_PER_MINUTE, RATE_LIMIT_MAX_KEYS,
+    UPSTREAM_MAX_CONCURRENCY, UPSTREAM_MAX_QUEUE, UPSTREAM_QUEUE_TIMEOUT, TRUSTED_PROXY_HOPS
+)
+from app.utils.auth import identify_token
+from app.utils.metrics import registry
+
+admission_rejected = registry.counter(
+    "admission_rejected_total", "Requisições recusadas: limite por cliente (429) ou fila do Claude (503)", ("reason",)
+)
+
+
+class AdmissionRejected(HTTPException):
+    """Requisição recusada por limite (429) ou sobrecarga (503), com Retry-After em segundos"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+
+class TokenBucket:
+    """
+    Balde de fichas: até `capacity` de rajada, reposto a `rate` por segundo.
+    O saldo pode ficar negativo (cobrança do uso real depois da chamada).
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Segundos até haver `amount` fichas (0 = já há)"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """
+    Limite por cliente (usuário do token ou IP): requisições e tokens por minuto.
+    Guarda no máximo `max_keys` clientes (os menos recentes são descartados).
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_keys: int = 100000):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _get_buckets(self, key: str):
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            buckets = (
+                TokenBucket(self.requests_per_minute, self.requests_per_minute / 60),
+                TokenBucket(self.tokens_per_minute, self.tokens_per_minute / 60)
+            )
+            self._buckets[key] = buckets
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return buckets
+
+    def acquire(self, key: str, estimated_tokens: int = 0) -> None:
+        """Consome 1 requisição e os tokens estimados. Levanta AdmissionRejected (429) se não houver saldo."""
+        if self.requests_per_minute <= 0 and self.tokens_per_minute <= 0:
+            return
+
+        with self._lock:
+            requests, tokens = self._get_buckets(key)
+            now = time.monotonic()
+            wait = 0.0
+            if self.requests_per_minute > 0:
+                wait = max(wait, requests.wait_time(1, now))
+            if self.tokens_per_minute > 0:
+                wait = max(wait, tokens.wait_time(estimated_tokens, now))
+            if wait > 0:
+                self.rejected += 1
+                admission_rejected.inc("rate_limit")
+                raise AdmissionRejected(429, "Limite de requisições excedido, tente novamente mais tarde", wait)
+
+            requests.take(1)
+            tokens.take(estimated_tokens)
+
+    def settle(self, key: str, estimated_tokens: int, actual_tokens: int) -> None:
+        """Acerta o saldo de tokens com o uso real da chamada"""
+        if self.tokens_per_minute <= 0:
+            return
+        with self._lock:
+            self._get_buckets(key)[1].take(actual_tokens - estimated_tokens)
+
+    def stats(self) -> dict:
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "clients": len(self._buckets),
+            "rejected": self.rejected
+        }
+
+
+class ConcurrencyLimiter:
+    """
+    Limita as chamadas simultâneas ao Claude. Acima do limite, as chamadas
+    esperam numa fila de até `max_queue` posições por no máximo `queue_timeout`
+    segundos; com a fila cheia (ou o tempo esgotado) a chamada é recusada na hora (503).
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._avg_duration = 1.0  # Média móvel da duração das chamadas (estimativa do Retry-After)
+
+    def _retry_after(self) -> float:
+        return self._avg_duration * (self.waiting + 1) / self.max_concurrent
+
+    @asynccontextmanager
+    async def slot(self):
+        """Reserva uma vaga para uma chamada ao Claude (AdmissionRejected 503 se não houver)"""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()  # Há vaga: não suspende
+        else:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                admission_rejected.inc("upstream")
+                raise AdmissionRejected(503, "Serviço sobrecarregado, tente novamente em instantes", self._retry_after())
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                admission_rejected.inc("upstream")
+                raise AdmissionRejected(503, "Serviço sobrecarregado, tente novamente em instantes", self._retry_after())
+            finally:
+                self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            self._avg_duration = 0.9 * self._avg_duration + 0.1 * (time.monotonic() - started)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_call_seconds": round(self._avg_duration, 3)
+        }
+
+
+rate_limiter = RateLimiter(RATE_LIMIT_REQUESTS_PER_MINUTE, RATE_LIMIT_TOKENS_PER_MINUTE, RATE_LIMIT_MAX_KEYS)
+upstream_limiter = ConcurrencyLimiter(UPSTREAM_MAX_CONCURRENCY, UPSTREAM_MAX_QUEUE, UPSTREAM_QUEUE_TIMEOUT)
+
+registry.gauge(
+    "upstream_calls", "Chamadas ao Claude ocupando vaga (active) e esperando na fila (queued)", ("state",),
+    lambda: {("active",): upstream_limiter.active, ("queued",): upstream_limiter.waiting}
+)
+
+
+def client_ip(request: Request) -> str:
+    """
+    IP do cliente. Atrás de TRUSTED_PROXY_HOPS proxies, é o endereço que o mais
+    externo deles anotou no X-Forwarded-For (os anteriores vêm do cliente e
+    podem ser forjados); sem o header, o IP da conexão.
+    """
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+def client_key(request: Request) -> str:
+    """Chave do limite: o usuário do token, se houver um válido, senão o IP"""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        identity = identify_token(token)
+        if identity is not None:
+            return f"user:{identity['user_id']}"
+
+    return f"ip:{client_ip(request)}"
+
+
+def get_admission_stats() -> dict:
+    return {"rate_limit": rate_limiter.stats(), "upstream": upstream_limiter.stats()}
@@ -0,0 +1,58 @@
+import time
+from typing import Optional
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from app.utils.cache import LRUCache
+from app.utils.security import decode_access_token
+
+# Tokens já validados: evita refazer HMAC + JSON a cada requisição
+_identity_cache = LRUCache(max_entries=10000, ttl_seconds=300)
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def _decode_identity(token: str) -> dict:
+    """Valida o token (com cache). Levanta ValueError se for inválido."""
+    identity = _identity_cache.get(token)
+    if identity is None:
+        claims = decode_access_token(token)
+        identity = {
+            "user_id": int(claims["sub"]),
+            "username": claims.get("username"),
+            "exp": claims["exp"]
+        }
+        _identity_cache.set(token, identity)
+    return identity
+
+
+def identify_token(token: str) -> Optional[dict]:
+    """Usuário do token ou None se for inválido/expirado (para quem não exige login)"""
+    try:
+        identity = _decode_identity(token)
+    except ValueError:
+        return None
+    if identity["exp"] < time.time():
+        return None
+    return {"user_id": identity["user_id"], "username": identity["username"]}
+
+
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(_bearer)) -> dict:
+    """
+    Dependência que exige um token válido (Authorization: Bearer <token>).
+    Não consulta o banco nem roda bcrypt.
+    
+    Returns:
+        dict com 'user_id' e 'username'
+    """
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Token não informado")
+    
+    try:
+        identity = _decode_identity(credentials.credentials)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    
+    if identity["exp"] < time.time():
+        raise HTTPException(status_code=401, detail="Token expirado")
+    
+    return {"user_id": identity["user_id"], "username": identity["username"]}
@@ -0,0 +1,249 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Optional
+
+# Limites (segundos) dos histogramas de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+RATE_BUCKETS = (5, 10, 20, 40, 60, 80, 100, 150, 200, 300)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador Prometheus; os valores das labels são passados na ordem de `labelnames`"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    """
+    Histograma Prometheus com limites fixos. observe() só faz uma busca
+    binária e três somas sob um lock: custo desprezível no caminho da requisição.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [contagem por faixa..., soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{_number(float(bound))}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            le = _labels(self.labelnames, labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{le} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}"
+
+
+class Gauge:
+    """Gauge lido na hora da coleta: `collect` retorna {(valores das labels): valor}"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple, collect: Callable[[], dict]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect().items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class MetricsRegistry:
+    """Métricas da aplicação, exportadas no formato texto do Prometheus"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple, collect: Callable[[], dict]) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# HTTP (MetricsMiddleware)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Duração das requisições HTTP até o fim da resposta (inclui streaming)",
+    ("method", "route", "status")
+)
+
+# Claude (ai_service)
+claude_request_duration = registry.histogram(
+    "claude_request_duration_seconds",
+    "Duração de cada chamada ao Claude",
+    ("model", "kind", "outcome")
+)
+claude_time_to_first_token = registry.histogram(
+    "claude_time_to_first_token_seconds",
+    "Tempo até o primeiro texto nas chamadas em streaming",
+    ("model",)
+)
+claude_output_tokens_per_second = registry.histogram(
+    "claude_output_tokens_per_second",
+    "Tokens de saída por segundo de cada chamada",
+    ("model",),
+    RATE_BUCKETS
+)
+claude_tokens = registry.counter(
+    "claude_tokens_total",
+    "Tokens consumidos no Claude",
+    ("model", "type")
+)
+
+# Banco (eventos do SQLAlchemy em app.database)
+db_statement_duration = registry.histogram(
+    "db_statement_duration_seconds",
+    "Duração de cada statement SQL",
+    ("engine", "operation"),
+    DB_BUCKETS
+)
+db_pool_checkout_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Espera por uma conexão do pool",
+    ("engine",),
+    DB_BUCKETS
+)
+
+
+def record_claude_call(
+    model: str,
+    kind: str,
+    seconds: float,
+    usage=None,
+    outcome: str = "ok",
+    first_token_seconds: Optional[float] = None
+) -> None:
+    """Latência, TTFT, tokens/s e tokens de uma chamada ao Claude (`usage` do SDK, se houver)"""
+    claude_request_duration.observe(seconds, model, kind, outcome)
+    if first_token_seconds is not None:
+        claude_time_to_first_token.observe(first_token_seconds, model)
+    if usage is None:
+        return
+
+    output_tokens = getattr(usage, "output_tokens", 0) or 0
+    generation_seconds = seconds - (first_token_seconds or 0)
+    if output_tokens and generation_seconds > 0:
+        claude_output_tokens_per_second.observe(output_tokens / generation_seconds, model)
+    claude_tokens.inc(model, "input", amount=getattr(usage, "input_tokens", 0) or 0)
+    claude_tokens.inc(model, "output", amount=output_tokens)
+    claude_tokens.inc(model, "cache_read", amount=getattr(usage, "cache_read_input_tokens", 0) or 0)
+    claude_tokens.inc(model, "cache_creation", amount=getattr(usage, "cache_creation_input_tokens", 0) or 0)
+
+
+def _route_template(scope) -> str:
+    """Template da rota atendida, com o prefixo do router (ou 'unmatched')"""
+    # FastAPI com routers incluídos sob demanda: a rota em scope["route"] não tem o prefixo
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    if context is not None:
+        return context.path
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI (sem BaseHTTPMiddleware, que custa uma task por
+    requisição): mede cada requisição até o último pedaço da resposta e
+    rotula pela rota (o template, como /conversations/{conversation_id}),
+    não pelo path, para não criar uma série por id.
+    """
+
+    def __init__(self, app, exclude: tuple = ("/metrics",)):
+        self.app = app
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_request_duration.observe(
+                time.perf_counter() - started, scope["method"], _route_template(scope), str(status[0])
+            )
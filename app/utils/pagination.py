@@ -0,0 +1,19 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    """Gera um cursor opaco (base64) a partir da chave de ordenação (data, id)"""
+    raw = json.dumps([created_at.isoformat(), item_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    """Lê um cursor gerado por encode_cursor. Levanta ValueError se for inválido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii"))
+        timestamp, item_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(item_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
@@ -0,0 +1,140 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+import anthropic
+
+
+def is_retryable(error: Exception) -> bool:
+    """Erros transitórios do Claude: sobrecarga (429/529), 5xx, timeout e falha de conexão"""
+    if isinstance(error, (asyncio.TimeoutError, anthropic.APIConnectionError)):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Valor do header retry-after da resposta de erro, se houver"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float, max_delay: float, error: Optional[Exception] = None) -> float:
+    """
+    Espera antes da próxima tentativa: backoff exponencial com jitter completo
+    (respeita o retry-after do Claude, limitado a max_delay)
+    """
+    retry_after = retry_after_seconds(error) if error is not None else None
+    if retry_after is not None:
+        return min(retry_after, max_delay)
+    return random.uniform(0, min(max_delay, base * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """Últimas `window` latências por modelo, para estimar o p95 (atraso do hedge)"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def models(self) -> list:
+        with self._lock:
+            return list(self._samples)
+
+    def percentile(self, model: str, fraction: float = 0.95) -> Optional[float]:
+        """None enquanto não houver amostras suficientes"""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class CircuitBreaker:
+    """
+    Disjuntor por modelo: após `failure_threshold` falhas transitórias seguidas
+    o modelo fica "aberto" por `reset_seconds`. Passado esse tempo, uma única
+    chamada de teste é liberada (meio-aberto): um sucesso fecha, uma falha
+    reabre. As outras continuam recusadas enquanto o teste está em andamento;
+    um teste sem resultado (cancelado) libera a vaga após `reset_seconds`.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = {}
+        self._opened_at = {}
+        self._probing = {}  # modelo -> início da chamada de teste (meio-aberto)
+        self._lock = threading.Lock()
+
+    def allow(self, model: str) -> bool:
+        with self._lock:
+            opened_at = self._opened_at.get(model)
+            if opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - opened_at < self.reset_seconds:
+                return False
+            probe_started = self._probing.get(model)
+            if probe_started is not None and now - probe_started < self.reset_seconds:
+                return False
+            self._probing[model] = now
+            return True
+
+    def release(self, model: str) -> None:
+        """Chamada de teste terminou sem dizer nada do modelo (ex.: erro 4xx): libera a vaga"""
+        with self._lock:
+            self._probing.pop(model, None)
+
+    def retry_after(self, model: str) -> float:
+        """Segundos até o modelo voltar a ser tentado"""
+        with self._lock:
+            opened_at = self._opened_at.get(model)
+        if opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - opened_at))
+
+    def record_success(self, model: str) -> None:
+        with self._lock:
+            self._failures.pop(model, None)
+            self._opened_at.pop(model, None)
+            self._probing.pop(model, None)
+
+    def record_failure(self, model: str) -> None:
+        with self._lock:
+            failures = self._failures.get(model, 0) + 1
+            self._failures[model] = failures
+            self._probing.pop(model, None)
+            # Meio-aberto (tempo de espera já passou): uma falha basta para reabrir
+            if failures >= self.failure_threshold or model in self._opened_at:
+                self._opened_at[model] = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = set(self._failures) | set(self._opened_at)
+            now = time.monotonic()
+            return {
+                model: {
+                    "state": (
+                        "closed" if model not in self._opened_at
+                        else "open" if now - self._opened_at[model] < self.reset_seconds
+                        else "half_open"
+                    ),
+                    "consecutive_failures": self._failures.get(model, 0)
+                }
+                for model in models
+            }
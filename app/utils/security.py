@@ -1,10 +1,24 @@
+import asyncio
+import base64
 import bcrypt
+import hashlib
+import hmac
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.config import SECRET_KEY, ALLOW_INSECURE_SECRET_KEY, BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, ACCESS_TOKEN_EXPIRE_MINUTES
+
+logger = logging.getLogger(__name__)
+
+# Executor dedicado e limitado: o bcrypt (~250 ms) não ocupa o threadpool das rotas
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
     # Trunca para 72 bytes (limite do bcrypt)
     password_bytes = password[:72].encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
@@ -13,3 +27,85 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     password_bytes = plain_password[:72].encode('utf-8')
     hashed_bytes = hashed_password.encode('utf-8')
     return bcrypt.checkpw(password_bytes, hashed_bytes)
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True se o hash foi gerado com um custo diferente de BCRYPT_ROUNDS"""
+    try:
+        rounds = int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return True
+    return rounds != BCRYPT_ROUNDS
+
+async def hash_password_async(password: str) -> str:
+    """hash_password no executor dedicado do bcrypt"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password no executor dedicado do bcrypt"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+
+
+# Valores que qualquer um pode usar para forjar tokens
+INSECURE_SECRET_KEYS = {"", "changeme"}
+
+def check_secret_key() -> None:
+    """
+    Chamado no startup: com SECRET_KEY ausente ou padrão, qualquer um forja
+    tokens. Levanta RuntimeError, ou só avisa com ALLOW_INSECURE_SECRET_KEY.
+    """
+    if SECRET_KEY.strip() not in INSECURE_SECRET_KEYS:
+        return
+    if ALLOW_INSECURE_SECRET_KEY:
+        logger.warning(
+            "SECRET_KEY INSEGURO (ausente ou 'changeme'): tokens de login podem ser forjados. "
+            "Aceito só porque ALLOW_INSECURE_SECRET_KEY=true; nunca use assim em produção."
+        )
+        return
+    raise RuntimeError(
+        "SECRET_KEY ausente ou igual a 'changeme': defina um valor aleatório "
+        "(ex.: python -c \"import secrets; print(secrets.token_urlsafe(32))\")"
+    )
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(message: bytes) -> bytes:
+    return hmac.new(SECRET_KEY.encode("utf-8"), message, hashlib.sha256).digest()
+
+def create_access_token(user_id: int, username: str) -> str:
+    """Gera um token assinado (JWT HS256) com o SECRET_KEY"""
+    header = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}).encode("utf-8"))
+    payload = _b64encode(json.dumps({
+        "sub": str(user_id),
+        "username": username,
+        "exp": int(time.time()) + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }).encode("utf-8"))
+    signature = _b64encode(_sign(f"{header}.{payload}".encode("ascii")))
+    return f"{header}.{payload}.{signature}"
+
+def decode_access_token(token: str) -> dict:
+    """
+    Valida assinatura (comparação em tempo constante) e expiração do token.
+    Levanta ValueError se o token for inválido ou estiver expirado.
+    """
+    try:
+        header, payload, signature = token.split(".")
+        expected = _sign(f"{header}.{payload}".encode("ascii"))
+        valid = hmac.compare_digest(_b64decode(signature), expected)
+    except Exception:
+        raise ValueError("Token inválido")
+    
+    if not valid:
+        raise ValueError("Token inválido")
+    
+    claims = json.loads(_b64decode(payload))
+    if claims.get("exp", 0) < time.time():
+        raise ValueError("Token expirado")
+    
+    return claims
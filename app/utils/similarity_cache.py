@@ -0,0 +1,223 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Hashable, Optional
+from app.utils.text import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Palavras de cortesia (normalizadas), que não mudam o pedido. Preposições,
+# negações e números ficam: "dólares para reais" não é "reais para dólares".
+FILLER_WORDS = {"favor", "pf", "pfv", "please", "pls"}
+
+# Primo de Mersenne 2^61 - 1 para as permutações (a * x + b) mod p do MinHash
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def shingles(text: str, ngram: int = 2) -> frozenset:
+    """
+    Conjunto de termos do texto normalizado (minúsculas, sem acento e
+    pontuação): as palavras inteiras e as sequências de até `ngram` palavras
+    na ordem do texto. Trocar uma palavra ("austria"/"australia") ou a ordem
+    ("dolares para reais"/"reais para dolares") muda vários termos.
+    """
+    words = [word for word in tokenize(text) if word not in FILLER_WORDS]
+    return frozenset(
+        " ".join(words[start:start + size])
+        for size in range(1, ngram + 1)
+        for start in range(len(words) - size + 1)
+    )
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard exato entre os termos de dois textos (o que o cache compara)"""
+    return jaccard(shingles(a), shingles(b))
+
+
+def evaluate_threshold(pairs: list, threshold: float) -> dict:
+    """
+    Confere um threshold com pares rotulados [(texto_a, texto_b, é_o_mesmo_pedido), ...].
+    Falsos positivos são respostas erradas servidas do cache.
+    """
+    false_positives, false_negatives = [], []
+    for a, b, same in pairs:
+        score = similarity(a, b)
+        if score >= threshold and not same:
+            false_positives.append((a, b, round(score, 3)))
+        elif score < threshold and same:
+            false_negatives.append((a, b, round(score, 3)))
+    return {
+        "pairs": len(pairs),
+        "threshold": threshold,
+        "false_positives": false_positives,
+        "false_negatives": false_negatives,
+    }
+
+
+class MinHasher:
+    """Assinatura MinHash de `num_perm` valores: a fração de valores iguais estima a similaridade de Jaccard"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        self.num_perm = num_perm
+        self._permutations = [
+            (_hash64(f"{seed}:a:{i}") % (_MERSENNE_PRIME - 1) + 1, _hash64(f"{seed}:b:{i}") % _MERSENNE_PRIME)
+            for i in range(num_perm)
+        ]
+
+    def signature(self, terms: frozenset) -> tuple:
+        hashes = [_hash64(term) for term in terms]
+        return tuple(
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+            for a, b in self._permutations
+        )
+
+
+class SimilarityCache:
+    """
+    Cache de respostas por similaridade do texto (MinHash + LSH), sem serviço externo.
+
+    As assinaturas são divididas em `bands` faixas; dois textos viram candidatos
+    se coincidirem em ao menos uma faixa do mesmo escopo (modelo, prompt de
+    sistema, parâmetros). Entre os candidatos vale o de maior Jaccard exato,
+    desde que >= `threshold`. Limite de entradas (LRU) e TTL como o LRUCache.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        min_terms: int = 2,
+        recent_hits: int = 50
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm deve ser múltiplo de bands")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.min_terms = min_terms
+        self._hasher = MinHasher(num_perm)
+        self._entries = OrderedDict()  # id -> (expires_at, termos, chaves das faixas, texto, valor)
+        self._buckets = {}  # chave da faixa -> ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._recent_hits = deque(maxlen=recent_hits)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _band_keys(self, scope: Hashable, terms: frozenset) -> list:
+        signature = self._hasher.signature(terms)
+        return [
+            (scope, band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def _remove(self, entry_id: int) -> None:
+        _, _, band_keys, _, _ = self._entries.pop(entry_id)
+        for key in band_keys:
+            ids = self._buckets.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._buckets[key]
+
+    def get(self, scope: Hashable, text: str) -> Optional[tuple]:
+        """
+        Resposta guardada para um texto parecido no mesmo escopo.
+
+        Returns:
+            (valor, similaridade) ou None
+        """
+        terms = shingles(text)
+        if len(terms) < self.min_terms:
+            return None
+
+        band_keys = self._band_keys(scope, terms)
+        now = time.monotonic()
+        with self._lock:
+            candidates = set()
+            for key in band_keys:
+                candidates.update(self._buckets.get(key, ()))
+
+            best_id, best_similarity = None, 0.0
+            for entry_id in candidates:
+                expires_at, entry_terms, _, _, _ = self._entries[entry_id]
+                if expires_at < now:
+                    self._remove(entry_id)
+                    continue
+                similarity = jaccard(terms, entry_terms)
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            _, _, _, matched_text, value = self._entries[best_id]
+            self.hits += 1
+            self._recent_hits.append({
+                "similarity": round(best_similarity, 3),
+                "query": text[:200],
+                "matched": matched_text[:200]
+            })
+
+        # Para calibrar o threshold: quais textos foram considerados iguais
+        logger.info("similarity cache hit (%.3f): %r ~ %r", best_similarity, text[:200], matched_text[:200])
+        return value, best_similarity
+
+    def set(self, scope: Hashable, text: str, value: Any) -> None:
+        """Guarda a resposta de um texto, removendo a menos usada se o limite for atingido"""
+        if self.max_entries <= 0:
+            return
+        terms = shingles(text)
+        if len(terms) < self.min_terms:
+            return
+
+        band_keys = self._band_keys(scope, terms)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (time.monotonic() + self.ttl_seconds, terms, band_keys, text, value)
+            for key in band_keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        """Contadores e os últimos acertos (similaridade, texto pedido e texto encontrado)"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "recent_hits": list(self._recent_hits)
+            }
@@ -0,0 +1,96 @@
+import asyncio
+import concurrent.futures
+import threading
+
+
+class SingleFlight:
+    """
+    Deduplica chamadas idênticas em andamento: quem chega com a mesma chave
+    enquanto a primeira chamada (a "líder") ainda está rodando espera e recebe
+    o mesmo resultado (ou a mesma exceção), sem nova chamada.
+
+    Funciona entre threads e entre corrotinas: o resultado é publicado num
+    concurrent.futures.Future, que threads esperam direto e corrotinas via
+    asyncio.wrap_future (de qualquer event loop).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._tasks = set()  # Referência às tasks das chamadas assíncronas até terminarem
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        """Retorna (future da chamada, True se quem chamou é o líder)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+
+            future = concurrent.futures.Future()
+            self._calls[key] = future
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None) -> None:
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, func):
+        """
+        Versão para threads: executa func() ou espera a chamada igual em andamento.
+
+        Returns:
+            (resultado, True se foi compartilhado com outra chamada)
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result, False
+
+    async def do_async(self, key, func):
+        """
+        Versão assíncrona: func() retorna o awaitable da chamada. A chamada
+        roda numa task própria, então o cancelamento de quem a iniciou (cliente
+        desconectou) não derruba quem está esperando por ela.
+
+        Returns:
+            (resultado, True se foi compartilhado com outra chamada)
+        """
+        future, leader = self._join(key)
+        if leader:
+            def on_done(task):
+                if task.cancelled():
+                    self._finish(key, future, error=asyncio.CancelledError())
+                elif task.exception() is not None:
+                    self._finish(key, future, error=task.exception())
+                else:
+                    self._finish(key, future, result=task.result())
+
+            task = asyncio.ensure_future(func())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(on_done)
+
+        # shield: cancelar esta espera não cancela o future compartilhado
+        result = await asyncio.shield(asyncio.wrap_future(future))
+        return result, not leader
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": in_flight}
@@ -0,0 +1,56 @@
+import json
+from app.utils.admission import AdmissionRejected
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Formata um evento no padrão Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_events_as_sse(events):
+    """
+    Converte os eventos do ai_service em SSE.
+    Erros durante a geração viram um evento 'error' (o status HTTP já foi enviado).
+    Eventos 'usage' são só para contabilidade interna e não são enviados.
+    """
+    try:
+        async for event in events:
+            if event["type"] == "usage":
+                continue
+            yield format_sse(event["type"], {k: v for k, v in event.items() if k != "type"})
+    except Exception as e:
+        yield format_sse("error", {"error": f"Erro ao chamar Claude: {str(e)}"})
+
+
+async def start_stream(events):
+    """
+    Busca o primeiro evento antes de a resposta começar: recusa de admissão
+    (fila do Claude cheia, disjuntor aberto) sobe como 503 com Retry-After em
+    vez de virar um evento 'error' num stream 200. Outros erros continuam
+    chegando pelo stream.
+
+    Returns:
+        iterador com todos os eventos, o primeiro incluído
+    """
+    try:
+        first = await events.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        error = e
+
+        async def failed():
+            raise error
+            yield
+
+        return failed()
+
+    async def resumed():
+        if first is not None:
+            yield first
+            async for event in events:
+                yield event
+
+    return resumed()
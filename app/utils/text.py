@@ -0,0 +1,15 @@
+import re
+import unicodedata
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas e sem acentos ("Você É" -> "voce e")"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> list:
+    """Palavras do texto normalizado"""
+    return _WORD_RE.findall(normalize_text(text))
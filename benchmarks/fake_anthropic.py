@@ -0,0 +1,124 @@
+"""
+Substituto local da Messages API da Anthropic para os benchmarks.
+
+Responde POST /v1/messages (normal e streaming SSE) com latência e
+velocidade de geração configuráveis por variáveis de ambiente:
+
+    FAKE_FIRST_TOKEN_SECONDS  tempo até o primeiro token (padrão 0.05)
+    FAKE_TOKENS_PER_SECOND    velocidade de geração (padrão 500)
+    FAKE_OUTPUT_TOKENS        tokens de saída por resposta (padrão 60, limitado a max_tokens)
+
+Uso:
+    uvicorn benchmarks.fake_anthropic:app --port 8100
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8100 uvicorn main:app
+"""
+import asyncio
+import itertools
+import json
+import os
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FIRST_TOKEN_SECONDS = float(os.getenv("FAKE_FIRST_TOKEN_SECONDS", "0.05"))
+TOKENS_PER_SECOND = float(os.getenv("FAKE_TOKENS_PER_SECOND", "500"))
+OUTPUT_TOKENS = int(os.getenv("FAKE_OUTPUT_TOKENS", "60"))
+
+# Tokens por pedaço no streaming
+CHUNK_TOKENS = 5
+
+# Resposta do analisador de intenções do ai_service (precisa ser JSON)
+INTENT_REPLY = '{"intent": "pergunta", "confidence": 0.9}'
+
+app = FastAPI(title="Fake Anthropic Messages API")
+_ids = itertools.count(1)
+
+
+def _text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+def _input_tokens(body: dict) -> int:
+    """Estimativa de ~3 caracteres por token, a mesma de context_service.estimate_tokens"""
+    text = _text_of(body.get("system") or "")
+    text += "".join(_text_of(message.get("content", "")) for message in body.get("messages", []))
+    return len(text) // 3 + 1
+
+
+def _reply(body: dict) -> tuple:
+    """(texto, tokens de saída) da resposta a um pedido"""
+    if "analisador de intenções" in _text_of(body.get("system") or ""):
+        return INTENT_REPLY, 12
+    output_tokens = min(OUTPUT_TOKENS, body.get("max_tokens", OUTPUT_TOKENS))
+    return " ".join(["lorem"] * output_tokens), output_tokens
+
+
+def _usage(input_tokens: int, output_tokens: int) -> dict:
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 0
+    }
+
+
+def _message(body: dict, content: list, usage: dict, stop_reason) -> dict:
+    return {
+        "id": f"msg_fake_{next(_ids)}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "claude-fake"),
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": usage
+    }
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream(body: dict, text: str, input_tokens: int, output_tokens: int):
+    yield _sse("message_start", {
+        "type": "message_start",
+        "message": _message(body, [], _usage(input_tokens, 1), None)
+    })
+    yield _sse("content_block_start", {
+        "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}
+    })
+    await asyncio.sleep(FIRST_TOKEN_SECONDS)
+
+    words = text.split(" ")
+    for start in range(0, len(words), CHUNK_TOKENS):
+        chunk = " ".join(words[start:start + CHUNK_TOKENS])
+        if start:
+            chunk = " " + chunk
+            await asyncio.sleep(CHUNK_TOKENS / TOKENS_PER_SECOND)
+        yield _sse("content_block_delta", {
+            "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}
+        })
+
+    yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+    yield _sse("message_delta", {
+        "type": "message_delta",
+        "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+        "usage": {"output_tokens": output_tokens}
+    })
+    yield _sse("message_stop", {"type": "message_stop"})
+
+
+@app.post("/v1/messages")
+async def create_message(request: Request):
+    body = await request.json()
+    text, output_tokens = _reply(body)
+    input_tokens = _input_tokens(body)
+
+    if body.get("stream"):
+        return StreamingResponse(_stream(body, text, input_tokens, output_tokens), media_type="text/event-stream")
+
+    await asyncio.sleep(FIRST_TOKEN_SECONDS + output_tokens / TOKENS_PER_SECOND)
+    return JSONResponse(_message(
+        body, [{"type": "text", "text": text}], _usage(input_tokens, output_tokens), "end_turn"
+    ))
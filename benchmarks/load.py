@@ -0,0 +1,163 @@
+"""
+Gerador de carga das rotas principais e cálculo das estatísticas
+(RPS, p50/p95/p99, erros e queries ao banco por requisição).
+"""
+import asyncio
+import itertools
+import time
+import httpx
+
+# Mensagens variadas para não acertar os caches de resposta do ai_service
+MESSAGES = [
+    "Como faço para trocar minha senha?",
+    "Explique a diferença entre processos e threads",
+    "O sistema está muito lento hoje",
+    "Vocês têm suporte aos sábados?",
+    "Adorei a nova versão do aplicativo",
+    "Resuma as vantagens de usar índices no MySQL",
+    "Não consigo acessar minha conta desde ontem",
+    "Qual é o prazo de entrega para São Paulo?",
+]
+
+
+def _message(index: int) -> str:
+    return f"{MESSAGES[index % len(MESSAGES)]} (#{index})"
+
+
+async def _chat(client, state, index):
+    return await client.post("/ai/chat", json={"message": _message(index)})
+
+
+async def _chat_stream(client, state, index):
+    return await client.post("/ai/chat/stream", json={"message": _message(index)})
+
+
+async def _analyze(client, state, index):
+    return await client.post("/ai/analyze", json={"message": _message(index), "use_cache": False})
+
+
+async def _conversation_create(client, state, index):
+    return await client.post("/conversations/", json={"title": f"Benchmark {index}"})
+
+
+async def _conversation_list(client, state, index):
+    return await client.get("/conversations/", params={"limit": 20})
+
+
+async def _conversation_get(client, state, index):
+    conversation_id = state["conversation_ids"][index % len(state["conversation_ids"])]
+    return await client.get(f"/conversations/{conversation_id}")
+
+
+async def _conversation_message(client, state, index):
+    conversation_id = state["conversation_ids"][index % len(state["conversation_ids"])]
+    return await client.post(f"/conversations/{conversation_id}/message", json={"message": _message(index)})
+
+
+async def _conversation_message_stream(client, state, index):
+    conversation_id = state["conversation_ids"][index % len(state["conversation_ids"])]
+    return await client.post(f"/conversations/{conversation_id}/message/stream", json={"message": _message(index)})
+
+
+# Nome do cenário -> função que faz uma requisição
+SCENARIOS = {
+    "chat": _chat,
+    "chat_stream": _chat_stream,
+    "analyze": _analyze,
+    "conversation_create": _conversation_create,
+    "conversation_list": _conversation_list,
+    "conversation_get": _conversation_get,
+    "conversation_message": _conversation_message,
+    "conversation_message_stream": _conversation_message_stream,
+}
+
+
+async def prepare(client: httpx.AsyncClient, conversations: int = 20) -> dict:
+    """Conversas usadas pelos cenários de leitura e de mensagem"""
+    ids = []
+    for index in range(conversations):
+        response = await client.post("/conversations/", json={"title": f"Benchmark base {index}"})
+        response.raise_for_status()
+        ids.append(response.json()["id"])
+    return {"conversation_ids": ids}
+
+
+async def db_statement_count(client: httpx.AsyncClient) -> float:
+    """Total de statements SQL executados pelo servidor (soma das séries do /metrics)"""
+    response = await client.get("/metrics")
+    response.raise_for_status()
+    return sum(
+        float(line.rsplit(" ", 1)[1])
+        for line in response.text.splitlines()
+        if line.startswith("db_statement_duration_seconds_count")
+    )
+
+
+def is_failure(response: httpx.Response) -> bool:
+    """Status de erro ou, nos streams SSE (que já começaram com 200), um evento 'error'"""
+    if response.status_code >= 400:
+        return True
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        return "event: error" in response.text
+    return False
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Percentil por posição mais próxima (lista já ordenada)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    name: str,
+    requests: int,
+    concurrency: int,
+    state: dict
+) -> dict:
+    """
+    Dispara `requests` requisições do cenário com até `concurrency` em paralelo.
+    Os cenários rodam um de cada vez para as queries por requisição serem só deles.
+    Nos cenários de streaming a latência vai até o fim do stream.
+    """
+    scenario = SCENARIOS[name]
+    counter = itertools.count()
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for index in iter(lambda: next(counter), None):
+            if index >= requests:
+                return
+            started = time.perf_counter()
+            try:
+                response = await scenario(client, state, index)
+                if is_failure(response):
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    statements_before = await db_statement_count(client)
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    # Gravações em segundo plano (write-behind) terminam logo após a resposta
+    await asyncio.sleep(0.2)
+    statements = await db_statement_count(client) - statements_before
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "queries_per_request": round(statements / requests, 2) if requests else 0.0,
+    }
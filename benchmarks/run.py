@@ -0,0 +1,191 @@
+"""
+Benchmark offline: sobe o servidor falso da Anthropic e a API (uvicorn)
+num banco local, gera carga nas rotas principais e imprime RPS,
+p50/p95/p99 e queries por requisição de cada cenário.
+
+Uso:
+    python -m benchmarks.run [--requests 200] [--concurrency 20]
+    python -m benchmarks.run --save-baseline benchmarks/baselines/sqlite.json
+    python -m benchmarks.run --baseline benchmarks/baselines/sqlite.json
+
+Termina com código 1 se algum cenário tiver requisições com erro (os tempos
+de um cenário quebrado não valem) e, com --baseline, se algum piorar além
+da tolerância.
+Por padrão usa um SQLite temporário; --database-url aceita um MySQL local.
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks.load import SCENARIOS, prepare, run_scenario
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Métricas comparadas com o baseline: (campo, maior é pior)
+COMPARED_FIELDS = (("rps", False), ("p50_ms", True), ("p95_ms", True), ("p99_ms", True))
+
+
+def _start_server(module: str, port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env={**os.environ, **env}
+    )
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Servidor em {url} terminou ao iniciar (código {process.returncode})")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Servidor em {url} não respondeu em {timeout}s")
+
+
+async def _run_load(base_url: str, scenarios: list, requests: int, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        state = await prepare(client)
+        results = {}
+        for name in scenarios:
+            results[name] = await run_scenario(client, name, requests, concurrency, state)
+            print(_format_row(name, results[name]), flush=True)
+        return results
+
+
+def _format_row(name: str, result: dict) -> str:
+    return (
+        f"{name:<28} {result['rps']:>9.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+        f"{result['p99_ms']:>9.1f} {result['queries_per_request']:>8.2f} {result['errors']:>7}"
+    )
+
+
+def failed_scenarios(results: dict) -> list:
+    """Cenários com alguma requisição com erro"""
+    return [name for name, result in results.items() if result["errors"]]
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Regressões em relação ao baseline: RPS ou latências piores que a
+    tolerância relativa, mais queries por requisição ou mais erros
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("scenarios", {}).get(name)
+        if reference is None:
+            continue
+        for field, higher_is_worse in COMPARED_FIELDS:
+            old, new = reference[field], result[field]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append(f"{name}: {field} {old} -> {new} ({change:+.0%})")
+        if result["queries_per_request"] > reference["queries_per_request"] + 0.5:
+            regressions.append(
+                f"{name}: queries_per_request {reference['queries_per_request']} -> {result['queries_per_request']}"
+            )
+        if result["error_rate"] > reference["error_rate"] + 0.01:
+            regressions.append(f"{name}: error_rate {reference['error_rate']} -> {result['error_rate']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline da API (sem Anthropic e sem banco remoto)")
+    parser.add_argument("--requests", type=int, default=200, help="Requisições por cenário")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requisições simultâneas")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--database-url", help="Banco da API (padrão: SQLite temporário)")
+    parser.add_argument("--app-port", type=int, default=8090)
+    parser.add_argument("--fake-port", type=int, default=8100)
+    parser.add_argument("--first-token-seconds", type=float, default=0.05, help="Latência do servidor falso")
+    parser.add_argument("--tokens-per-second", type=float, default=500, help="Velocidade de geração do servidor falso")
+    parser.add_argument("--output-tokens", type=int, default=60, help="Tokens de saída por resposta do servidor falso")
+    parser.add_argument("--output", help="Grava o relatório em JSON")
+    parser.add_argument("--baseline", help="Compara com um relatório salvo (código 1 se houver regressão)")
+    parser.add_argument("--save-baseline", help="Grava este resultado como baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Piora relativa aceita (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    fake_env = {
+        "FAKE_FIRST_TOKEN_SECONDS": str(args.first_token_seconds),
+        "FAKE_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "FAKE_OUTPUT_TOKENS": str(args.output_tokens),
+    }
+    app_env = {
+        "DATABASE_URL": database_url,
+        "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{args.fake_port}",
+        "ANTHROPIC_API_KEY": "benchmark",
+        "SECRET_KEY": secrets.token_urlsafe(32),
+        # O benchmark mede a API, não o controle de admissão
+        "RATE_LIMIT_REQUESTS_PER_MINUTE": "0",
+        "RATE_LIMIT_TOKENS_PER_MINUTE": "0",
+    }
+
+    fake = _start_server("benchmarks.fake_anthropic:app", args.fake_port, fake_env)
+    api = None
+    try:
+        _wait_ready(f"http://127.0.0.1:{args.fake_port}/docs", fake)
+        api = _start_server("main:app", args.app_port, app_env)
+        _wait_ready(f"http://127.0.0.1:{args.app_port}/ready", api)
+
+        print(f"{'cenário':<28} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'q/req':>8} {'erros':>7}")
+        results = asyncio.run(_run_load(
+            f"http://127.0.0.1:{args.app_port}", args.scenarios, args.requests, args.concurrency
+        ))
+    finally:
+        for process in (api, fake):
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=10)
+
+    report = {
+        "database": database_url.split(":", 1)[0],
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "fake_anthropic": fake_env,
+        "scenarios": results,
+    }
+    failed = failed_scenarios(results)
+    # Um baseline com cenários quebrados esconderia as próximas regressões
+    for path in (args.output, None if failed else args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+                file.write("\n")
+
+    if failed:
+        print("\nFALHOU: cenários com erros (tempos inválidos):")
+        for name in failed:
+            print(f"  - {name}: {results[name]['errors']}/{results[name]['requests']} requisições com erro")
+        if args.save_baseline:
+            print(f"Baseline não gravado em {args.save_baseline}")
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print("\nRegressões em relação ao baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\nSem regressões em relação ao baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,84 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from app.routes import user_routes, ai_routes, conversation_routes
-from app.database import init_db
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from app.config import STARTUP_DB_TIMEOUT
+from app.routes import user_routes, ai_routes, conversation_routes, usage_routes
+from app.database import dispose_engines, ping, prepare_database
+from app.services import ai_service
+from app.utils.metrics import MetricsMiddleware, registry
+from app.utils.security import check_secret_key
+import asyncio
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+# Estado do startup, exposto em /ready
+startup_state = {"database": False, "error": None}
+
+async def _prepare_database_until_ready():
+    """Checagem do schema + aquecimento do pool, tentando de novo enquanto o banco não responder"""
+    delay = 1
+    while True:
+        try:
+            await prepare_database()
+        except Exception as e:
+            startup_state["error"] = str(e)
+            logger.warning("Banco indisponível no startup (nova tentativa em %ss): %s", delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+            continue
+        startup_state.update(database=True, error=None)
+        return
+
+async def require_database():
+    """
+    Rotas que usam o banco: 503 enquanto o startup não conferiu o schema
+    (depois de STARTUP_DB_TIMEOUT a app já atende, com init_db ainda rodando)
+    """
+    if not startup_state["database"]:
+        raise HTTPException(
+            status_code=503,
+            detail="Banco de dados ainda não está pronto, tente novamente em instantes",
+            headers={"Retry-After": "5"}
+        )
+
+async def _load_intent_classifier():
+    """Treina o classificador local fora do event loop (senão o primeiro /ai/analyze paga o treino)"""
+    try:
+        await asyncio.to_thread(ai_service.get_intent_classifier)
+    except Exception as e:
+        logger.warning("Classificador de intenção não carregou no startup: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tokens assinados com uma chave conhecida: não sobe
+    check_secret_key()
+    
+    # O boot espera o banco no máximo STARTUP_DB_TIMEOUT segundos; depois disso
+    # a preparação continua em segundo plano e o /ready e as rotas do banco
+    # respondem 503 até terminar
+    task = asyncio.ensure_future(_prepare_database_until_ready())
+    classifier_task = asyncio.ensure_future(_load_intent_classifier())
+    try:
+        await asyncio.wait_for(asyncio.shield(task), STARTUP_DB_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    
+    yield
+    
+    task.cancel()
+    classifier_task.cancel()
+    await ai_service.close_clients()
+    await dispose_engines()
+
 app = FastAPI(
     title="API Backend - FastAPI + Claude AI",
     description="Backend com autenticação, Claude AI e sistema de conversas",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -20,23 +89,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Inicializa o banco de dados
-init_db()
+# Latência por rota (histograma exportado em /metrics)
+app.add_middleware(MetricsMiddleware)
 
-# Rotas da API
-app.include_router(user_routes.router, prefix="/users", tags=["Users"])
+# Rotas da API (as que usam o banco respondem 503 até o schema estar pronto)
+database_ready = [Depends(require_database)]
+app.include_router(user_routes.router, prefix="/users", tags=["Users"], dependencies=database_ready)
 app.include_router(ai_routes.router, prefix="/ai", tags=["Claude AI"])
-app.include_router(conversation_routes.router, prefix="/conversations", tags=["Conversations"])
+app.include_router(conversation_routes.router, prefix="/conversations", tags=["Conversations"], dependencies=database_ready)
+app.include_router(usage_routes.router, prefix="/usage", tags=["Usage"], dependencies=database_ready)
 
 @app.get("/")
 def home():
     return {
         "message": "API online 🚀",
-        "services": ["Users", "Claude AI", "Conversations"],
+        "services": ["Users", "Claude AI", "Conversations", "Usage"],
         "docs": "/docs",
         "chat_interface": "/chat"
     }
 
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """
+    Readiness: 200 só depois do startup (schema conferido e pool aquecido)
+    e com o banco respondendo; 503 caso contrário
+    """
+    if not startup_state["database"]:
+        return JSONResponse(status_code=503, content={"status": "starting", "error": startup_state["error"]})
+    if not await ping():
+        return JSONResponse(status_code=503, content={"status": "unavailable", "error": "Banco não respondeu"})
+    return {"status": "ready"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas no formato texto do Prometheus: rotas, chamadas ao Claude e banco"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Serve a interface web (opcional - crie uma pasta 'static' e coloque o HTML lá)
 # Se você quiser servir o HTML diretamente:
 @app.get("/chat")
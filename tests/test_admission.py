@@ -0,0 +1,65 @@
+import pytest
+from app.utils.admission import AdmissionRejected, RateLimiter, TokenBucket
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(capacity=10, rate=2)
+    bucket.updated = 0.0
+    bucket.take(10)
+
+    assert bucket.wait_time(4, now=0.0) == 2.0
+    assert bucket.wait_time(4, now=2.0) == 0.0
+
+
+def test_token_bucket_never_exceeds_capacity():
+    bucket = TokenBucket(capacity=10, rate=2)
+    bucket.updated = 0.0
+    bucket.wait_time(1, now=100.0)
+    assert bucket.tokens == 10
+
+
+def test_token_bucket_caps_request_at_capacity():
+    # Pedido maior que a rajada: espera o balde encher, não para sempre
+    bucket = TokenBucket(capacity=10, rate=2)
+    bucket.updated = 0.0
+    bucket.take(10)
+    assert bucket.wait_time(50, now=0.0) == 5.0
+
+
+def test_token_bucket_balance_can_go_negative():
+    bucket = TokenBucket(capacity=10, rate=1)
+    bucket.updated = 0.0
+    bucket.take(15)
+    assert bucket.wait_time(1, now=0.0) == 6.0
+
+
+def test_rate_limiter_rejects_with_retry_after():
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=0)
+    limiter.acquire("ip:1")
+    limiter.acquire("ip:1")
+
+    with pytest.raises(AdmissionRejected) as error:
+        limiter.acquire("ip:1")
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) >= 1
+    assert limiter.rejected == 1
+
+    # Outro cliente tem o próprio balde
+    limiter.acquire("ip:2")
+
+
+def test_rate_limiter_settle_charges_actual_tokens():
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=100)
+    limiter.acquire("user:1", estimated_tokens=10)
+    limiter.settle("user:1", estimated_tokens=10, actual_tokens=100)
+
+    with pytest.raises(AdmissionRejected):
+        limiter.acquire("user:1", estimated_tokens=10)
+
+
+def test_rate_limiter_forgets_oldest_clients():
+    limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=0, max_keys=1)
+    limiter.acquire("ip:1")
+    limiter.acquire("ip:2")
+    limiter.acquire("ip:1")
+    assert limiter.stats()["clients"] == 1
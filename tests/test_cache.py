@@ -0,0 +1,51 @@
+from app.utils import cache as cache_module
+from app.utils.cache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_and_set():
+    cache = LRUCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" passa a ser o menos usado
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_expired_entries_are_removed(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    cache = LRUCache(max_entries=10, ttl_seconds=5)
+    cache.set("a", 1)
+
+    clock.now += 5
+    assert cache.get("a") == 1
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_zero_entries_disables_cache():
+    cache = LRUCache(max_entries=0, ttl_seconds=60)
+    cache.set("a", 1)
+    assert cache.get("a") is None
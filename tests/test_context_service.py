@@ -0,0 +1,61 @@
+from app.services import context_service
+
+MODEL = "modelo-de-teste"
+
+
+def _history(count: int, size: int) -> list:
+    # ~size/3 tokens por mensagem, alternando usuário e assistente
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"{i:03d}" + "x" * (size - 3)}
+        for i in range(count)
+    ]
+
+
+def _use_budget(monkeypatch, budget: int, recent: int):
+    monkeypatch.setattr(context_service, "CONTEXT_TOKEN_BUDGET", budget)
+    monkeypatch.setattr(context_service, "CONTEXT_TOKEN_BUDGETS", {})
+    monkeypatch.setattr(context_service, "CONTEXT_RECENT_MESSAGES", recent)
+
+
+def test_nothing_is_summarized_within_budget(monkeypatch):
+    _use_budget(monkeypatch, budget=1000, recent=2)
+    history = _history(10, 30)
+
+    assert context_service.split_history(history, None, "oi", MODEL) == ([], history)
+
+
+def test_oldest_messages_go_to_summary_until_half_budget(monkeypatch):
+    _use_budget(monkeypatch, budget=100, recent=2)
+    history = _history(12, 30)  # 11 tokens cada
+
+    to_summarize, kept = context_service.split_history(history, None, "oi", MODEL)
+
+    assert to_summarize + kept == history
+    assert kept[0]["role"] == "user"
+    kept_tokens = sum(context_service.estimate_tokens(msg["content"]) for msg in kept)
+    assert kept_tokens + context_service.estimate_tokens("oi") <= 100 * context_service.SUMMARY_TARGET_RATIO
+
+
+def test_recent_messages_are_kept_when_they_fit(monkeypatch):
+    _use_budget(monkeypatch, budget=100, recent=6)
+    history = _history(12, 30)
+
+    to_summarize, kept = context_service.split_history(history, None, "oi", MODEL)
+
+    assert kept == history[-6:]
+
+
+def test_summary_counts_against_budget(monkeypatch):
+    _use_budget(monkeypatch, budget=100, recent=2)
+    history = _history(4, 30)
+
+    assert context_service.split_history(history, None, "oi", MODEL)[0] == []
+    assert context_service.split_history(history, "r" * 200, "oi", MODEL)[0] != []
+
+
+def test_per_model_budget(monkeypatch):
+    _use_budget(monkeypatch, budget=10000, recent=2)
+    monkeypatch.setattr(context_service, "CONTEXT_TOKEN_BUDGETS", {MODEL: 50})
+
+    assert context_service.get_token_budget(MODEL) == 50
+    assert context_service.split_history(_history(12, 30), None, "oi", MODEL)[0] != []
@@ -0,0 +1,81 @@
+import json
+from app.services import ai_service
+from app.services.intent_classifier import IntentClassifier, build_default_classifier
+
+COMPLAINT = "isso é um absurdo, não consigo acessar minha conta"
+
+
+def _write_lines(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_train_from_file_skips_and_counts_bad_lines(tmp_path):
+    path = _write_lines(tmp_path / "train.ndjson", [
+        json.dumps({"message": "quero meu dinheiro de volta", "intent": "reclamacao", "source": "claude"}),
+        "{não é json",
+        "[1]",
+        "5",
+        json.dumps({"intent": "elogio"}),
+        json.dumps({"message": 42, "intent": "elogio"}),
+        "",
+        json.dumps({"message": "adorei", "intent": "elogio"}),
+    ])
+    classifier = IntentClassifier()
+
+    assert classifier.train_from_file(path) == 2
+    assert classifier.skipped_lines == 5
+    assert classifier.examples_learned == 2
+
+
+def test_train_from_file_ignores_local_guesses(tmp_path):
+    path = _write_lines(tmp_path / "train.ndjson", [
+        json.dumps({"message": "a b", "intent": "elogio", "source": "local"}),
+        json.dumps({"message": "a b", "intent": "elogio", "source": "cache"}),
+        json.dumps({"message": "a b", "intent": "elogio", "source": "claude", "error": "x"}),
+        json.dumps({"message": "a b", "intent": "elogio", "source": "claude"}),
+    ])
+    assert IntentClassifier().train_from_file(path) == 1
+
+
+def test_seed_examples_are_not_labelled():
+    classifier = build_default_classifier()
+    assert classifier.examples_learned > 0
+    assert classifier.labelled_examples == 0
+
+    classifier.learn("gostei do atendimento", "elogio")
+    assert classifier.labelled_examples == 1
+
+
+def test_unknown_words_have_zero_confidence():
+    assert build_default_classifier().classify("xyzzy plugh") == {"intent": "outro", "confidence": 0.0}
+
+
+def test_local_path_off_until_enough_claude_labels(monkeypatch):
+    classifier = build_default_classifier()
+    monkeypatch.setattr(ai_service, "_intent_classifier", classifier)
+    monkeypatch.setattr(ai_service, "INTENT_LOCAL_MIN_EXAMPLES", 3)
+    monkeypatch.setattr(ai_service, "INTENT_LOCAL_THRESHOLD", 0.5)
+
+    # Só os exemplos iniciais: confiança alta, mas não calibrada
+    assert classifier.classify(COMPLAINT)["confidence"] >= 0.5
+    assert ai_service._classify_locally(COMPLAINT) is None
+
+    for _ in range(3):
+        classifier.learn("isso é um absurdo", "reclamacao")
+    assert ai_service._classify_locally(COMPLAINT)["source"] == "local"
+
+
+def test_local_answer_below_threshold_goes_to_claude(monkeypatch):
+    classifier = build_default_classifier()
+    for _ in range(5):
+        classifier.learn("não consigo acessar", "ajuda")
+    monkeypatch.setattr(ai_service, "_intent_classifier", classifier)
+    monkeypatch.setattr(ai_service, "INTENT_LOCAL_MIN_EXAMPLES", 5)
+
+    confidence = classifier.classify(COMPLAINT)["confidence"]
+    monkeypatch.setattr(ai_service, "INTENT_LOCAL_THRESHOLD", confidence + 0.01)
+    assert ai_service._classify_locally(COMPLAINT) is None
+
+    monkeypatch.setattr(ai_service, "INTENT_LOCAL_THRESHOLD", confidence)
+    assert ai_service._classify_locally(COMPLAINT) == {**classifier.classify(COMPLAINT), "source": "local"}
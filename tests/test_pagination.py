@@ -0,0 +1,19 @@
+from datetime import datetime
+import pytest
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(datetime(2024, 5, 1), 2 ** 40)
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=")
+
+
+@pytest.mark.parametrize("cursor", ["", "não é base64", "WzEsIDJd", "eyJhIjogMX0="])
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError, match="Cursor inválido"):
+        decode_cursor(cursor)
@@ -0,0 +1,75 @@
+from app.utils import resilience
+from app.utils.resilience import CircuitBreaker
+
+MODEL = "claude-3-5-sonnet-20241022"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _open_breaker(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure(MODEL)
+    breaker.record_failure(MODEL)
+    return breaker, clock
+
+
+def test_opens_after_consecutive_failures(monkeypatch):
+    breaker, clock = _open_breaker(monkeypatch)
+
+    assert not breaker.allow(MODEL)
+    assert breaker.retry_after(MODEL) == 30
+    assert breaker.stats()[MODEL] == {"state": "open", "consecutive_failures": 2}
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure(MODEL)
+    breaker.record_success(MODEL)
+    breaker.record_failure(MODEL)
+    assert breaker.allow(MODEL)
+
+
+def test_half_open_lets_one_probe_through(monkeypatch):
+    breaker, clock = _open_breaker(monkeypatch)
+    clock.now += 30
+
+    assert breaker.allow(MODEL)
+    assert not breaker.allow(MODEL)
+    assert breaker.stats()[MODEL]["state"] == "half_open"
+
+    breaker.record_success(MODEL)
+    assert breaker.allow(MODEL)
+    assert breaker.allow(MODEL)
+
+
+def test_failed_probe_reopens(monkeypatch):
+    breaker, clock = _open_breaker(monkeypatch)
+    clock.now += 30
+    assert breaker.allow(MODEL)
+
+    breaker.record_failure(MODEL)
+    assert not breaker.allow(MODEL)
+    clock.now += 30
+    assert breaker.allow(MODEL)
+
+
+def test_released_or_stale_probe_frees_the_slot(monkeypatch):
+    breaker, clock = _open_breaker(monkeypatch)
+    clock.now += 30
+    assert breaker.allow(MODEL)
+
+    breaker.release(MODEL)
+    assert breaker.allow(MODEL)
+
+    # Teste sem resultado (ex.: stream cancelado): a vaga volta após reset_seconds
+    assert not breaker.allow(MODEL)
+    clock.now += 30
+    assert breaker.allow(MODEL)
@@ -0,0 +1,62 @@
+import pytest
+from app.utils.similarity_cache import SimilarityCache, evaluate_threshold, shingles, similarity
+
+SCOPE = ("modelo", "prompt", 0.0, 1024)
+
+
+def test_shingles_normalize_and_drop_filler_words():
+    assert shingles("Converta, por FAVOR, dólares") == shingles("converta por dolares")
+
+
+def test_word_order_changes_similarity():
+    assert similarity("dólares para reais", "reais para dólares") < 1.0
+
+
+def test_finds_same_request_with_other_spelling():
+    cache = SimilarityCache(max_entries=10, ttl_seconds=60, threshold=0.8)
+    cache.set(SCOPE, "Qual é a capital da Austrália?", "Camberra")
+
+    value, score = cache.get(SCOPE, "qual e a capital da australia")
+    assert value == "Camberra"
+    assert score == 1.0
+    assert cache.stats()["recent_hits"][0]["matched"] == "Qual é a capital da Austrália?"
+
+
+def test_different_request_or_scope_misses():
+    cache = SimilarityCache(max_entries=10, ttl_seconds=60, threshold=0.8)
+    cache.set(SCOPE, "qual é a capital da austrália", "Camberra")
+
+    assert cache.get(SCOPE, "qual é a capital da áustria") is None
+    assert cache.get(("outro modelo", "prompt", 0.0, 1024), "qual é a capital da austrália") is None
+
+
+def test_short_texts_are_not_cached():
+    cache = SimilarityCache(max_entries=10, ttl_seconds=60, min_terms=2)
+    cache.set(SCOPE, "oi", "olá")
+    assert cache.stats()["entries"] == 0
+    assert cache.get(SCOPE, "oi") is None
+
+
+def test_evicts_least_recently_used():
+    cache = SimilarityCache(max_entries=1, ttl_seconds=60)
+    cache.set(SCOPE, "capital da austrália", "Camberra")
+    cache.set(SCOPE, "capital da argentina", "Buenos Aires")
+
+    assert cache.get(SCOPE, "capital da austrália") is None
+    assert cache.get(SCOPE, "capital da argentina")[0] == "Buenos Aires"
+    assert cache.evictions == 1
+
+
+def test_num_perm_must_be_multiple_of_bands():
+    with pytest.raises(ValueError):
+        SimilarityCache(max_entries=10, ttl_seconds=60, num_perm=64, bands=10)
+
+
+def test_evaluate_threshold_reports_false_positives():
+    pairs = [
+        ("capital da austrália", "Capital da Australia", True),
+        ("dólares para reais", "reais para dólares", False),
+    ]
+    result = evaluate_threshold(pairs, threshold=0.0)
+    assert [pair[:2] for pair in result["false_positives"]] == [("dólares para reais", "reais para dólares")]
+    assert result["false_negatives"] == []
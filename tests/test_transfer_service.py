@@ -0,0 +1,98 @@
+import json
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from app.database import Base
+from app.models import conversation_model, usage_model, user_model  # noqa: F401 (registra as tabelas)
+from app.services import transfer_service
+
+Conversation = conversation_model.Conversation
+Message = conversation_model.Message
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'import.db'}")
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def _lines(*records) -> list:
+    return [json.dumps(record) for record in records]
+
+
+def _export_lines():
+    # Ids de origem fora de ordem e que não existem no banco de destino
+    return _lines(
+        {"type": "conversation", "id": 70, "title": "primeira", "summary": "resumo", "summarized_until_id": 502},
+        {"type": "message", "id": 501, "conversation_id": 70, "role": "user", "content": "a"},
+        {"type": "message", "id": 502, "conversation_id": 70, "role": "assistant", "content": "b"},
+        {"type": "message", "id": 503, "conversation_id": 70, "role": "user", "content": "c"},
+        {"type": "conversation", "id": 30, "title": "segunda"},
+        {"type": "message", "id": 900, "conversation_id": 30, "role": "user", "content": "d"},
+        {"type": "conversation", "id": 10, "title": "vazia", "summary": "sem limite"},
+    )
+
+
+def _imported(db):
+    conversations = db.execute(select(Conversation).order_by(Conversation.id)).scalars().all()
+    return {
+        conversation.title: (
+            conversation,
+            db.execute(
+                select(Message).where(Message.conversation_id == conversation.id).order_by(Message.id)
+            ).scalars().all()
+        )
+        for conversation in conversations
+    }
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 1000])
+def test_import_remaps_conversation_and_summary_ids(db, batch_size):
+    result = transfer_service.import_conversations(db, _export_lines(), batch_size=batch_size)
+    assert result == {"conversations": 3, "messages": 4}
+
+    imported = _imported(db)
+    first, first_messages = imported["primeira"]
+    second, second_messages = imported["segunda"]
+    empty, empty_messages = imported["vazia"]
+
+    assert [message.content for message in first_messages] == ["a", "b", "c"]
+    assert [message.content for message in second_messages] == ["d"]
+    assert empty_messages == []
+    assert (first.message_count, second.message_count, empty.message_count) == (3, 1, 0)
+
+    # O resumo aponta para o id novo da última mensagem que cobre (a de origem 502)
+    assert first.summary == "resumo"
+    assert first.summarized_until_id == first_messages[1].id
+    # Resumo sem summarized_until_id não tem como ser usado
+    assert empty.summary is None
+
+
+def test_import_twice_creates_new_ids(db):
+    transfer_service.import_conversations(db, _export_lines())
+    transfer_service.import_conversations(db, _export_lines(), batch_size=2)
+
+    conversations = db.execute(select(Conversation)).scalars().all()
+    assert len(conversations) == 6
+    for conversation in conversations:
+        count = len(db.execute(select(Message).where(Message.conversation_id == conversation.id)).all())
+        assert conversation.message_count == count
+
+
+def test_import_overrides_user_id(db):
+    lines = _lines({"type": "conversation", "id": 1, "user_id": 5, "title": "t"})
+    transfer_service.import_conversations(db, lines, user_id=9)
+    assert db.execute(select(Conversation.user_id)).scalar_one() == 9
+
+
+@pytest.mark.parametrize("line, error", [
+    ('{"type": "message", "conversation_id": 1}', "Linha 1: mensagem antes da linha da conversa dela"),
+    ("[1]", "Linha 1: a linha deve ser um objeto JSON"),
+    ('{"type": "outro"}', "Linha 1: 'type' deve ser 'conversation' ou 'message'"),
+])
+def test_invalid_line_raises_value_error(db, line, error):
+    with pytest.raises(ValueError, match=error):
+        transfer_service.import_conversations(db, [line])